@@ -1,5 +1,4 @@
 import streamlit as st
-import pandas as pd
 import plotly.express as px
 from datetime import datetime
 import os
@@ -13,6 +12,15 @@ import excel_handler
 import utils
 import settings
 import report_templates
+import scheduler
+import upload_queue
+import period_export
+import rollup
+import consolidation
+import query_stats
+
+# Queries recorded from here on belong to this rerun
+query_stats.start_run()
 
 # Initialize session state variables if they don't exist
 if 'authenticated' not in st.session_state:
@@ -25,6 +33,11 @@ if 'user_org_id' not in st.session_state:
     st.session_state.user_org_id = None
 if 'username' not in st.session_state:
     st.session_state.username = None
+if 'session_token' not in st.session_state:
+    st.session_state.session_token = None
+
+# Maximum rows shown in each due-date tab of the admin dashboard
+DASHBOARD_TAB_LIMIT = 100
 
 # Page configuration
 st.set_page_config(
@@ -34,6 +47,13 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Start background jobs (overdue sweep) and upload workers once per server process
+scheduler.start_background_scheduler()
+upload_queue.start_upload_workers()
+
+# Check the signed session token, restoring it from the session cookie after a reload (no users-table query)
+auth.check_session()
+
 # Function definitions for dashboard displays
 def display_dashboard():
     st.title("Tổng quan báo cáo")
@@ -50,16 +70,15 @@ def admin_dashboard():
     # Create columns for metrics
     col1, col2, col3, col4 = st.columns(4)
     
-    # Fetch statistics from database
-    total_reports = db.get_total_reports()
-    pending_reports = db.get_reports_by_status("pending")
-    completed_reports = db.get_reports_by_status("completed")
-    overdue_reports = db.get_reports_by_status("overdue")
+    # Fetch statistics from database in a single round trip
+    stats = db.get_admin_dashboard_stats()
+    completed_reports = stats['completed']
+    overdue_reports = stats['overdue']
     
     # Display metrics with icons
     with col1:
         st.markdown("### Tổng số báo cáo")
-        st.markdown(f"<div style='text-align: center; font-size: 48px;'>📄 {total_reports['assigned']}</div>", unsafe_allow_html=True)
+        st.markdown(f"<div style='text-align: center; font-size: 48px;'>📄 {stats['assigned']}</div>", unsafe_allow_html=True)
     
     with col2:
         st.markdown("### Báo cáo đã nộp")
@@ -76,24 +95,15 @@ def admin_dashboard():
     # Progress chart section
     st.markdown("## Tiến độ nộp báo cáo theo đơn vị")
     
-    # Create sample data for the progress chart
-    org_data = db.get_report_by_organization()
-    if org_data is not None and not org_data.empty:
-        # Convert to the format needed for dual-axis chart
-        chart_data = []
-        for org_name in org_data['organization'].unique():
-            org_df = org_data[org_data['organization'] == org_name]
-            total = org_df['count'].sum()
-            completed = org_df[org_df['status'] == 'completed']['count'].sum() if 'completed' in org_df['status'].values else 0
-            completion_rate = (completed / total * 100) if total > 0 else 0
-            chart_data.append({
-                'organization': org_name,
-                'Đã nộp': completed,
-                'Chưa nộp': total - completed,
-                'Tỉ lệ hoàn thành': completion_rate
-            })
-        
-        chart_df = pd.DataFrame(chart_data)
+    # Per-organization counts and completion rate come precomputed from SQL
+    chart_df = db.get_organization_completion_stats()
+    if chart_df is not None and not chart_df.empty:
+        chart_df = chart_df.rename(columns={
+            'completed': 'Đã nộp',
+            'not_completed': 'Chưa nộp',
+            'completion_rate': 'Tỉ lệ hoàn thành'
+        })
+        chart_df['Tỉ lệ hoàn thành'] = chart_df['Tỉ lệ hoàn thành'].astype(float)
         
         # Create a combined chart
         fig = px.bar(
@@ -145,40 +155,34 @@ def admin_dashboard():
     tab1, tab2 = st.tabs(["Báo cáo sắp đến hạn", "Báo cáo đã hết hạn"])
     
     with tab1:
-        # Display upcoming reports
-        upcoming_reports = db.get_assigned_reports()
-        if upcoming_reports is not None and not upcoming_reports.empty:
-            upcoming_df = upcoming_reports[upcoming_reports['status'] == 'pending']
-            if not upcoming_df.empty:
-                # Format the dataframe for display
-                upcoming_df = upcoming_df[['report_name', 'organization', 'due_date', 'status']]
-                upcoming_df.columns = ['Tên báo cáo', 'Đơn vị', 'Ngày hết hạn', 'Trạng thái']
-                upcoming_df['Trạng thái'] = upcoming_df['Trạng thái'].map({
-                    'pending': 'Chưa nộp',
-                    'completed': 'Đã nộp',
-                    'overdue': 'Quá hạn'
-                })
-                st.dataframe(upcoming_df, use_container_width=True)
-            else:
-                st.info("Không có báo cáo sắp đến hạn")
+        # Display upcoming reports (filtered in SQL)
+        upcoming_df = db.get_assigned_reports(
+            status='pending',
+            due_from=datetime.now().date(),
+            limit=DASHBOARD_TAB_LIMIT + 1
+        )
+        if upcoming_df is not None and not upcoming_df.empty:
+            display_due_date_table(upcoming_df, 'Chưa nộp')
         else:
-            st.info("Không có dữ liệu báo cáo")
+            st.info("Không có báo cáo sắp đến hạn")
     
     with tab2:
-        # Display overdue reports
-        overdue_reports = db.get_assigned_reports()
-        if overdue_reports is not None and not overdue_reports.empty:
-            overdue_df = overdue_reports[overdue_reports['status'] == 'overdue']
-            if not overdue_df.empty:
-                # Format the dataframe for display
-                overdue_df = overdue_df[['report_name', 'organization', 'due_date', 'status']]
-                overdue_df.columns = ['Tên báo cáo', 'Đơn vị', 'Ngày hết hạn', 'Trạng thái']
-                overdue_df['Trạng thái'] = 'Quá hạn'
-                st.dataframe(overdue_df, use_container_width=True)
-            else:
-                st.info("Không có báo cáo quá hạn")
+        # Display overdue reports (filtered in SQL)
+        overdue_df = db.get_assigned_reports(status='overdue', limit=DASHBOARD_TAB_LIMIT + 1)
+        if overdue_df is not None and not overdue_df.empty:
+            display_due_date_table(overdue_df, 'Quá hạn')
         else:
-            st.info("Không có dữ liệu báo cáo")
+            st.info("Không có báo cáo quá hạn")
+
+def display_due_date_table(reports_df, status_label):
+    """Show one page of the due-date tabs, noting when more rows exist than are shown."""
+    truncated = len(reports_df) > DASHBOARD_TAB_LIMIT
+    reports_df = reports_df.head(DASHBOARD_TAB_LIMIT)[['report_name', 'organization', 'due_date', 'status']].copy()
+    reports_df.columns = ['Tên báo cáo', 'Đơn vị', 'Ngày hết hạn', 'Trạng thái']
+    reports_df['Trạng thái'] = status_label
+    st.dataframe(reports_df, use_container_width=True)
+    if truncated:
+        st.caption(f"Hiển thị {DASHBOARD_TAB_LIMIT} báo cáo có hạn nộp sớm nhất")
 
 def department_dashboard():
     st.subheader("Tổng quan phòng ban")
@@ -188,9 +192,10 @@ def department_dashboard():
     
     # Fetch statistics from database for this department
     dept_id = st.session_state.user_org_id
-    dept_reports = db.get_department_reports(dept_id)
-    pending_reports = db.get_department_reports_by_status(dept_id, "pending")
-    completed_reports = db.get_department_reports_by_status(dept_id, "completed")
+    stats = db.get_department_dashboard_stats(dept_id)
+    dept_reports = stats['total']
+    pending_reports = stats['pending'] + stats['overdue']
+    completed_reports = stats['completed']
     
     # Display metrics
     with col1:
@@ -252,9 +257,10 @@ def unit_dashboard():
     
     # Fetch statistics from database for this unit
     unit_id = st.session_state.user_org_id
-    assigned_reports = db.get_unit_assigned_reports(unit_id)
-    completed_reports = db.get_unit_reports_by_status(unit_id, "completed")
-    pending_reports = db.get_unit_reports_by_status(unit_id, "pending")
+    stats = db.get_unit_dashboard_stats(unit_id)
+    assigned_reports = stats['total']
+    completed_reports = stats['completed']
+    pending_reports = stats['pending'] + stats['overdue']
     
     # Display metrics
     with col1:
@@ -318,7 +324,11 @@ else:
         "Quản lý mẫu báo cáo": "📝", 
         "Đơn vị và thành viên": "🏢",
         "Bản chức năng": "📈",
+        "Tổng hợp báo cáo": "🧮",
+        "Xuất báo cáo theo kỳ": "🗂️",
+        "Tổng hợp theo cây tổ chức": "🌳",
         "Quản lý người dùng": "👥",
+        "Hiệu năng truy vấn": "⏱️",
         "Cài đặt": "⚙️"
     }
     
@@ -338,11 +348,16 @@ else:
         "Quản lý mẫu báo cáo": "Report Templates",
         "Đơn vị và thành viên": "Organizations",
         "Bản chức năng": "Assign Reports",
+        "Tổng hợp báo cáo": "Consolidation",
+        "Xuất báo cáo theo kỳ": "Period Export",
+        "Tổng hợp theo cây tổ chức": "Roll-up",
         "Quản lý người dùng": "Users",
+        "Hiệu năng truy vấn": "Query Performance",
         "Cài đặt": "Settings"
     }
     
     page = page_mapping.get(selected_option, "Dashboard")
+    query_stats.set_page(page)
     
     # Display the page content
     if page == "Dashboard":
@@ -357,10 +372,18 @@ else:
         reports.submit_report()
     elif page == "Report Status":
         reports.view_report_status()
+    elif page == "Consolidation":
+        consolidation.consolidation_page()
+    elif page == "Period Export":
+        period_export.period_export_page()
+    elif page == "Roll-up":
+        rollup.rollup_page()
     elif page == "Organizations":
         organizations.manage_organizations()
     elif page == "Users":
         auth.manage_users()
+    elif page == "Query Performance":
+        query_stats.query_stats_page()
     elif page == "Settings":
         settings.settings_page()
     else:
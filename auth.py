@@ -1,6 +1,10 @@
+import json
+import time
 import streamlit as st
+import streamlit.components.v1 as components
 import pandas as pd
 import database as db
+import sessions
 import utils
 
 def login_page():
@@ -21,23 +25,91 @@ def login_page():
             else:
                 user = db.validate_user(username, password)
                 if user:
-                    # Store user information in session state
-                    st.session_state.authenticated = True
-                    st.session_state.user_id = user['id']
-                    st.session_state.user_role = user['role']
-                    st.session_state.user_org_id = user['organization_id']
-                    st.session_state.username = user['username']
+                    token = sessions.issue_token(user)
+                    start_session(token, sessions.decode_token(token))
                     st.rerun()
                 else:
                     st.error("Invalid username or password")
 
-def logout():
-    """Log out the current user."""
+def start_session(token, claims, persist=True):
+    """
+    Store a session token and the user information it carries in session state.
+
+    With persist, the token is also written to the browser's session cookie so
+    that a page reload restores the session.
+    """
+    st.session_state.session_token = token
+    st.session_state.authenticated = True
+    st.session_state.user_id = claims['uid']
+    st.session_state.user_role = claims['role']
+    st.session_state.user_org_id = claims['org']
+    st.session_state.username = claims['sub']
+    if persist:
+        st.session_state.session_cookie_pending = (token, max(int(claims['exp'] - time.time()), 0))
+
+def clear_session():
+    """Forget the session token and the user information in session state, and delete the session cookie."""
+    st.session_state.session_token = None
     st.session_state.authenticated = False
     st.session_state.user_id = None
     st.session_state.user_role = None
     st.session_state.user_org_id = None
     st.session_state.username = None
+    st.session_state.session_cookie_pending = ("", 0)
+
+def _write_session_cookie(token, max_age):
+    """Set (or, with max_age 0, delete) the session cookie in the browser."""
+    # Streamlit scripts cannot send Set-Cookie headers, so the cookie is set by
+    # a script in a component frame, which shares the app's origin
+    cookie = f"{sessions.SESSION_COOKIE}={token}; Max-Age={max_age}; Path=/; SameSite=Strict"
+    components.html(
+        f"""
+        <script>
+        const secure = window.parent.location.protocol === "https:" ? "; Secure" : "";
+        window.parent.document.cookie = {json.dumps(cookie)} + secure;
+        </script>
+        """,
+        height=0
+    )
+
+def check_session():
+    """
+    Validate the session token on every rerun.
+
+    A new browser session (e.g. after a page reload) takes its token from the
+    session cookie. An invalid, expired or revoked token logs the user out.
+    """
+    token = st.session_state.get('session_token')
+    from_cookie = False
+    if not token and not st.session_state.get('session_cookie_read'):
+        # Only once per browser session: after a logout the request's cookies
+        # still carry the old token
+        token = st.context.cookies.get(sessions.SESSION_COOKIE)
+        from_cookie = bool(token)
+    st.session_state.session_cookie_read = True
+
+    if token:
+        claims = sessions.verify_token(token)
+        if claims is None:
+            clear_session()
+        elif from_cookie:
+            start_session(token, claims, persist=False)
+
+    # Write the cookie change of a login, token refresh or logout
+    pending = st.session_state.pop('session_cookie_pending', None)
+    if pending is not None:
+        _write_session_cookie(*pending)
+
+def refresh_session(user):
+    """Issue a new token when the current user was updated, since updates may revoke their tokens."""
+    if st.session_state.get('session_token') and user['id'] == st.session_state.user_id:
+        token = sessions.issue_token(user)
+        start_session(token, sessions.decode_token(token))
+
+def logout():
+    """Log out the current user, revoke their session token and delete the session cookie."""
+    sessions.revoke_token(st.session_state.get('session_token'))
+    clear_session()
 
 def manage_users():
     """Manage users in the system (Admin only)."""
@@ -47,13 +119,20 @@ def manage_users():
     
     st.title("User Management")
     
-    # Get all users
-    users_df = db.get_users()
-    
     # Create tabs for viewing and managing users
     tab1, tab2 = st.tabs(["View Users", "Add/Edit User"])
     
     with tab1:
+        # Get one page of users
+        users_df = utils.keyset_page(
+            "users_page",
+            lambda limit, after: db.get_users(limit=limit, after=after[0] if after else None),
+            cursor_columns=('username',)
+        )
+        
+        # Only the listing is paged; the pickers can reach every user
+        user_choices = db.get_user_choices()
+        
         if users_df is not None and not users_df.empty:
             st.dataframe(users_df, use_container_width=True)
             
@@ -61,8 +140,8 @@ def manage_users():
             with st.expander("Delete User"):
                 user_to_delete = st.selectbox(
                     "Select user to delete",
-                    options=users_df['id'].tolist(),
-                    format_func=lambda x: users_df.loc[users_df['id'] == x, 'username'].iloc[0]
+                    options=user_choices['id'].tolist(),
+                    format_func=lambda x: user_choices.loc[user_choices['id'] == x, 'username'].iloc[0]
                 )
                 
                 if st.button("Delete User"):
@@ -85,25 +164,19 @@ def manage_users():
         # Check if we're in edit mode
         if st.checkbox("Edit Existing User"):
             edit_mode = True
-            if users_df is not None and not users_df.empty:
+            if user_choices is not None and not user_choices.empty:
                 user_to_edit = st.selectbox(
                     "Select user to edit",
-                    options=users_df['id'].tolist(),
-                    format_func=lambda x: users_df.loc[users_df['id'] == x, 'username'].iloc[0]
+                    options=user_choices['id'].tolist(),
+                    format_func=lambda x: user_choices.loc[user_choices['id'] == x, 'username'].iloc[0]
                 )
                 
                 # Get the user data
-                user_data = users_df.loc[users_df['id'] == user_to_edit].iloc[0]
-                user_id = user_data['id']
+                user_data = user_choices.loc[user_choices['id'] == user_to_edit].iloc[0]
+                user_id = int(user_data['id'])
                 default_username = user_data['username']
                 default_role = user_data['role']
-                
-                # Find the organization_id for this user
-                org_id = None
-                for _, org in organizations.iterrows():
-                    if org['name'] == user_data['organization']:
-                        org_id = org['id']
-                        break
+                org_id = None if pd.isna(user_data['organization_id']) else int(user_data['organization_id'])
             else:
                 st.info("No users to edit")
                 return
@@ -136,7 +209,7 @@ def manage_users():
                     "Organization",
                     options=organizations['id'].tolist(),
                     format_func=lambda x: organizations.loc[organizations['id'] == x, 'name'].iloc[0],
-                    index=organizations['id'].tolist().index(org_id) if org_id is not None else 0
+                    index=organizations['id'].tolist().index(org_id) if org_id in organizations['id'].tolist() else 0
                 )
             else:
                 st.error("No organizations found. Please create organizations first.")
@@ -157,6 +230,11 @@ def manage_users():
                     if edit_mode:
                         # Update existing user
                         success = db.update_user(user_id, username, password, role, organization_id)
+                        if success:
+                            refresh_session({
+                                'id': user_id, 'username': username,
+                                'role': role, 'organization_id': organization_id
+                            })
                         message = "User updated successfully"
                     else:
                         # Add new user
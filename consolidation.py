@@ -0,0 +1,111 @@
+import streamlit as st
+import pandas as pd
+from datetime import datetime, date, timedelta
+import database as db
+
+def get_quarter_range(day):
+    """Return the first and last day of the quarter containing `day`."""
+    first_month = 3 * ((day.month - 1) // 3) + 1
+    start = date(day.year, first_month, 1)
+    if first_month == 10:
+        end = date(day.year, 12, 31)
+    else:
+        end = date(day.year, first_month + 3, 1) - timedelta(days=1)
+    return start, end
+
+def get_field_labels(template_id):
+    """Map field ids to their labels for a template (multi-sheet submissions store ids)."""
+    labels = {}
+    template = db.get_report_template(template_id)
+    sheet_structure = db.get_report_template_sheet_structure(template_id) or {}
+
+    field_lists = [template['fields']] if template and template['fields'] else []
+    field_lists += [sheet_config.get('fields', []) for sheet_config in sheet_structure.values()]
+    for fields in field_lists:
+        for field in fields:
+            if isinstance(field, dict) and 'id' in field:
+                labels[field['id']] = field.get('label', field['id'])
+    return labels
+
+def consolidate(template_id, due_from, due_to):
+    """
+    Aggregate the numeric fields of all units' submissions for a template and period.
+
+    Per-unit totals come from a single SQL query; the cross-unit statistics are one
+    vectorized groupby over those totals.
+
+    Args:
+        template_id: The ID of the report template
+        due_from: First due date of the period
+        due_to: Last due date of the period
+
+    Returns:
+        Tuple (summary, per_unit) of DataFrames. `summary` has one row per sheet and
+        field with sum, avg, min, max and count across units; `per_unit` has the
+        value each unit reported. Both are empty when nothing was submitted.
+    """
+    per_unit = db.get_consolidation_values(template_id, due_from, due_to)
+    if per_unit is None or per_unit.empty:
+        return pd.DataFrame(), pd.DataFrame()
+
+    per_unit['value'] = pd.to_numeric(per_unit['value'], errors='coerce')
+    labels = get_field_labels(template_id)
+    per_unit['field'] = per_unit['field'].map(lambda field: labels.get(field, field))
+
+    summary = (
+        per_unit.groupby(['sheet', 'field'], sort=False)['value']
+        .agg(['sum', 'mean', 'min', 'max', 'count'])
+        .rename(columns={'mean': 'avg'})
+        .reset_index()
+    )
+    return summary, per_unit
+
+def consolidation_page():
+    """Consolidate submitted report values across units (Admin and Department roles)."""
+    if st.session_state.user_role not in ["admin", "department"]:
+        st.error("You don't have permission to access this page")
+        return
+
+    st.title("🧮 Tổng hợp số liệu báo cáo")
+
+    templates_df = db.get_report_templates()
+    if templates_df is not None and not templates_df.empty and st.session_state.user_role == "department":
+        templates_df = templates_df[templates_df['department_id'] == st.session_state.user_org_id]
+
+    if templates_df is None or templates_df.empty:
+        st.info("Chưa có mẫu báo cáo nào.")
+        return
+
+    template_id = st.selectbox(
+        "Mẫu báo cáo",
+        options=templates_df['id'].tolist(),
+        format_func=lambda x: templates_df.loc[templates_df['id'] == x, 'name'].iloc[0]
+    )
+
+    default_from, default_to = get_quarter_range(datetime.now().date())
+    col1, col2 = st.columns(2)
+    with col1:
+        due_from = st.date_input("Hạn nộp từ ngày", value=default_from)
+    with col2:
+        due_to = st.date_input("Đến ngày", value=default_to)
+
+    summary, per_unit = consolidate(template_id, due_from, due_to)
+    if summary.empty:
+        st.info("Không có số liệu đã nộp trong kỳ này.")
+        return
+
+    multi_sheet = (summary['sheet'] != '').any()
+
+    st.subheader("Tổng hợp toàn bộ đơn vị")
+    summary_display = summary.rename(columns={
+        'sheet': 'Sheet', 'field': 'Chỉ tiêu', 'sum': 'Tổng', 'avg': 'Trung bình',
+        'min': 'Nhỏ nhất', 'max': 'Lớn nhất', 'count': 'Số đơn vị'
+    })
+    if not multi_sheet:
+        summary_display = summary_display.drop(columns=['Sheet'])
+    st.dataframe(summary_display, use_container_width=True)
+
+    st.subheader("Chi tiết theo đơn vị")
+    columns = ['sheet', 'field'] if multi_sheet else ['field']
+    breakdown = per_unit.pivot_table(index='organization', columns=columns, values='value', aggfunc='sum')
+    st.dataframe(breakdown, use_container_width=True)
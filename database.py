@@ -1,10 +1,23 @@
 import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
 import psycopg2
+import psycopg2.pool
+import psycopg2.extensions
 import pandas as pd
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, Json, execute_values
 from datetime import datetime, timedelta
 import streamlit as st
 import urllib.parse
+import template_cache
+import query_cache
+from query_cache import cached
+import query_stats
+import recurrence
+import passwords
 
 # Database connection parameters
 db_params = {
@@ -15,62 +28,332 @@ db_params = {
     'port': '5432'
 }
 
+# Connection pool settings (override with environment variables)
+pool_settings = {
+    'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+    'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '20')),
+    'checkout_timeout': float(os.getenv('DB_POOL_CHECKOUT_TIMEOUT', '10')),
+    'health_check_interval': float(os.getenv('DB_POOL_HEALTH_CHECK_INTERVAL', '30'))
+}
+
+# Rows fetched per round trip by server-side cursors (see stream_query)
+STREAM_BATCH_SIZE = int(os.getenv('DB_STREAM_BATCH_SIZE', '2000'))
+
+# Seconds a period's org-tree roll-up is reused before it is recomputed
+ROLLUP_CACHE_TTL = float(os.getenv('ROLLUP_CACHE_TTL', '60'))
+
+# Lifetime of signed session tokens (see sessions.py) and how long other server
+# processes may take to notice a revoked one
+SESSION_TTL = int(os.getenv('SESSION_TTL', str(8 * 3600)))
+SESSION_REVOCATION_CACHE_TTL = float(os.getenv('SESSION_REVOCATION_CACHE_TTL', '30'))
+
+class PoolTimeoutError(Exception):
+    """Raised when no pooled connection becomes free within the checkout timeout."""
+
+class ConnectionPool:
+    """Thread-safe pool of PostgreSQL connections shared by all Streamlit sessions."""
+
+    def __init__(self, min_size, max_size, checkout_timeout, health_check_interval, **connect_params):
+        self._pool = psycopg2.pool.ThreadedConnectionPool(min_size, max_size, **connect_params)
+        # psycopg2 raises immediately when the pool is exhausted; the semaphore
+        # makes callers wait for a free slot instead, up to the checkout timeout
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._last_used = {}
+        self._lock = threading.Lock()
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+
+    def getconn(self, timeout=None):
+        """Check out a healthy connection, waiting up to the checkout timeout."""
+        if timeout is None:
+            timeout = self.checkout_timeout
+        if not self._slots.acquire(timeout=timeout):
+            raise PoolTimeoutError(f"No database connection available after {timeout} seconds")
+
+        try:
+            # Stale connections are dropped until a live one (or a fresh one) turns up
+            conn = self._pool.getconn()
+            while not self._is_healthy(conn):
+                self._discard(conn)
+                conn = self._pool.getconn()
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn):
+        """Return a connection to the pool, closing it if it is broken."""
+        try:
+            if conn.closed:
+                self._discard(conn)
+            else:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                with self._lock:
+                    self._last_used[id(conn)] = time.monotonic()
+                self._pool.putconn(conn)
+        except Exception:
+            self._discard(conn)
+        finally:
+            self._slots.release()
+
+    def closeall(self):
+        """Close every connection held by the pool."""
+        self._pool.closeall()
+
+    def _is_healthy(self, conn):
+        """Ping connections that have been idle longer than the health check interval."""
+        if conn.closed:
+            return False
+
+        with self._lock:
+            last_used = self._last_used.get(id(conn))
+        if last_used is not None and time.monotonic() - last_used < self.health_check_interval:
+            return True
+
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn):
+        with self._lock:
+            self._last_used.pop(id(conn), None)
+        try:
+            self._pool.putconn(conn, close=True)
+        except Exception:
+            pass
+
 @st.cache_resource
 def initialize_connection():
-    """Establish a connection to the PostgreSQL database and return the connection object."""
+    """Create the process-wide connection pool and return it."""
     try:
-        conn = psycopg2.connect(**db_params)
-        return conn
+        return ConnectionPool(**pool_settings, **db_params)
     except Exception as e:
         st.error(f"Database connection error: {e}")
         return None
 
+@contextmanager
 def get_connection():
-    """Get a database connection from the cached resource."""
-    return initialize_connection()
+    """Check a connection out of the pool for the duration of a `with` block."""
+    pool = initialize_connection()
+    if pool is None:
+        raise psycopg2.OperationalError("Database connection pool is not available")
 
-def execute_query(query, params=None, fetch=True):
-    """Execute a SQL query and return the results."""
-    conn = get_connection()
-    if conn is None:
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
+# Queries recorded instead of run on this thread (see capture_queries)
+_captured = threading.local()
+
+class _RecordingCursor:
+    """Stands in for a cursor while capturing: records queries and returns no rows."""
+
+    rowcount = 0
+
+    def __init__(self, queries):
+        self._queries = queries
+
+    def execute(self, query, params=None):
+        self._queries.append((query, params))
+
+    def fetchone(self):
         return None
 
+    def fetchall(self):
+        return []
+
+@contextmanager
+def capture_queries():
+    """Record the queries database functions would run on this thread, without running them.
+
+    Used by migrations.check_query_plans to EXPLAIN the exact SQL the app runs.
+    Yields the list of (query, params) tuples recorded so far.
+    """
+    _captured.queries = []
+    try:
+        yield _captured.queries
+    finally:
+        _captured.queries = None
+
+class _TimedCursor:
+    """Wraps a transaction's cursor and records every statement it runs in query_stats."""
+
+    def __init__(self, cursor, function):
+        self._cursor = cursor
+        self._function = function
+
+    def execute(self, query, params=None):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(query, params)
+        finally:
+            # execute_values sends the composed statement as bytes
+            text = query.decode('utf-8', 'replace') if isinstance(query, bytes) else str(query)
+            query_stats.record_query(
+                self._function, (time.perf_counter() - start) * 1000, max(self._cursor.rowcount, 0), text
+            )
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+@contextmanager
+def transaction(cursor_factory=RealDictCursor, function=None):
+    """Run a block in its own transaction on a pooled connection and yield a cursor.
+
+    Commits when the block finishes and rolls back if it raises, so a failing
+    query never touches work running on another session's connection. Every
+    statement is recorded in query_stats under `function`, by default the name
+    of the function that opened the transaction.
+    """
+    queries = getattr(_captured, 'queries', None)
+    if queries is not None:
+        yield _RecordingCursor(queries)
+        return
+
+    # Frame 1 is contextlib's __enter__, frame 2 the function using the block
+    function = function or sys._getframe(2).f_code.co_name
+    with get_connection() as conn:
+        try:
+            with conn.cursor(cursor_factory=cursor_factory) as cursor:
+                yield _TimedCursor(cursor, function)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+def execute_query(query, params=None, fetch=True):
+    """Execute a SQL query and return the results.
+
+    The query's duration and row count are recorded in query_stats under the
+    name of the function that called execute_query.
+    """
     try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        with transaction(function=sys._getframe(1).f_code.co_name) as cursor:
             cursor.execute(query, params)
 
             if fetch:
                 results = cursor.fetchall()
                 return pd.DataFrame(results) if results else pd.DataFrame()
             else:
-                conn.commit()
                 return True
     except Exception as e:
         st.error(f"Query execution error: {e}")
-        conn.rollback()
         return None
 
+def stream_query(query, params=None, batch_size=STREAM_BATCH_SIZE):
+    """Return a generator of the rows of a query as tuples, read through a server-side (named) cursor.
+
+    Postgres sends `batch_size` rows per round trip, so large exports never hold
+    the full result in memory. The pooled connection stays checked out until the
+    generator is exhausted or closed. The stream is recorded in query_stats
+    once it ends, with the time spent fetching and the rows read, under the name
+    of the function that called stream_query.
+    """
+    return _stream_rows(query, params, batch_size, sys._getframe(1).f_code.co_name)
+
+def _stream_rows(query, params, batch_size, function):
+    fetch_ms = 0.0
+    rows = 0
+    try:
+        with get_connection() as conn:
+            try:
+                with conn.cursor(name=f"stream_{threading.get_ident()}_{time.monotonic_ns()}") as cursor:
+                    start = time.perf_counter()
+                    cursor.execute(query, params)
+                    while True:
+                        batch = cursor.fetchmany(batch_size)
+                        fetch_ms += (time.perf_counter() - start) * 1000
+                        if not batch:
+                            break
+                        rows += len(batch)
+                        yield from batch
+                        start = time.perf_counter()
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    finally:
+        query_stats.record_query(function, fetch_ms, rows, query)
+
+def to_jsonb(value):
+    """Adapt a value for a JSONB column; JSON strings pass through and Postgres parses them."""
+    if value is None or isinstance(value, str):
+        return value
+    return Json(value)
+
 # User Authentication Functions
 def validate_user(username, password):
-    """Validate user credentials and return user information if valid."""
+    """Validate user credentials and return user information if valid.
+
+    The password is checked against its scrypt hash on the password worker
+    pool. Plain-text passwords from older versions, and hashes made with
+    another cost, are replaced with a fresh hash on a successful login.
+    """
     query = """
-    SELECT u.id, u.username, u.role, u.organization_id
+    SELECT u.id, u.username, u.role, u.organization_id, u.password
     FROM users u
-    WHERE u.username = %s AND u.password = %s
+    WHERE u.username = %s
     """
-    result = execute_query(query, (username, password))
+    result = execute_query(query, (username,))
+    if result is None:
+        return None
     
-    if result is not None and not result.empty:
-        return result.iloc[0].to_dict()
-    return None
+    hasher = passwords.get_password_hasher()
+    if result.empty:
+        hasher.verify(password, None)
+        return None
+    
+    user = result.iloc[0].to_dict()
+    stored = user.pop('password')
+    if not hasher.verify(password, stored):
+        return None
+    
+    if passwords.needs_rehash(stored):
+        # Only replace the value that was checked, in case it changed meanwhile
+        execute_query(
+            "UPDATE users SET password = %s WHERE id = %s AND password = %s",
+            (hasher.hash(password), user['id'], stored),
+            fetch=False
+        )
+    return user
 
-def get_users():
-    """Get all users."""
+def get_users(limit=None, after=None):
+    """Get users ordered by username.
+
+    Pass the last username of the previous page as `after` to fetch the next
+    page (keyset pagination); `limit` caps the page size.
+    """
     query = """
     SELECT u.id, u.username, u.role, o.name as organization
     FROM users u
     LEFT JOIN organizations o ON u.organization_id = o.id
-    ORDER BY u.username
+    """
+    params = []
+    if after is not None:
+        query += " WHERE u.username > %s"
+        params.append(after)
+    query += " ORDER BY u.username"
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
+    return execute_query(query, params)
+
+def get_user_choices():
+    """Get every user's id, username, role and organization_id, for pickers that must reach any user."""
+    query = """
+    SELECT id, username, role, organization_id
+    FROM users
+    ORDER BY username
     """
     return execute_query(query)
 
@@ -81,35 +364,101 @@ def add_user(username, password, role, organization_id):
     VALUES (%s, %s, %s, %s)
     RETURNING id
     """
-    result = execute_query(query, (username, password, role, organization_id), fetch=True)
+    password_hash = passwords.get_password_hasher().hash(password)
+    result = execute_query(query, (username, password_hash, role, organization_id), fetch=True)
     return result is not None
 
 def update_user(user_id, username, password, role, organization_id):
-    """Update an existing user."""
+    """Update an existing user.
+
+    Session tokens carry the role and organization, so the user's tokens are
+    revoked when either of them changes or a new password is set.
+    """
     # If password is empty, don't update it
-    if password:
-        query = """
-        UPDATE users
-        SET username = %s, password = %s, role = %s, organization_id = %s
-        WHERE id = %s
-        """
-        params = (username, password, role, organization_id, user_id)
-    else:
-        query = """
-        UPDATE users
-        SET username = %s, role = %s, organization_id = %s
-        WHERE id = %s
-        """
-        params = (username, role, organization_id, user_id)
-    
-    return execute_query(query, params, fetch=False)
+    query = """
+    WITH old AS (
+        SELECT role, organization_id FROM users WHERE id = %s FOR UPDATE
+    )
+    UPDATE users u
+    SET username = %s, password = COALESCE(%s, u.password), role = %s, organization_id = %s
+    FROM old
+    WHERE u.id = %s
+    RETURNING old.role, old.organization_id
+    """
+    new_password = passwords.get_password_hasher().hash(password) if password else None
+    result = execute_query(query, (user_id, username, new_password, role, organization_id, user_id))
+    if result is None:
+        return None
+
+    if not result.empty:
+        old = result.iloc[0]
+        if password or old['role'] != role or old['organization_id'] != organization_id:
+            revoke_user_sessions(user_id)
+    return True
+
+def hash_plaintext_passwords():
+    """Replace every plain-text password with its hash and return how many were hashed."""
+    with transaction() as cursor:
+        cursor.execute("SELECT id, password FROM users WHERE password NOT LIKE 'scrypt$%' FOR UPDATE")
+        users = cursor.fetchall()
+        for user in users:
+            cursor.execute(
+                "UPDATE users SET password = %s WHERE id = %s",
+                (passwords.hash_password(user['password']), user['id'])
+            )
+        return len(users)
 
 def delete_user(user_id):
-    """Delete a user by ID."""
-    query = "DELETE FROM users WHERE id = %s"
-    return execute_query(query, (user_id,), fetch=False)
+    """Delete a user by ID and revoke all of their session tokens."""
+    query = """
+    WITH deleted AS (
+        DELETE FROM users WHERE id = %s RETURNING id
+    )
+    INSERT INTO revoked_sessions (user_id, expires_at)
+    SELECT id, NOW() + make_interval(secs => %s) FROM deleted
+    """
+    result = execute_query(query, (user_id, SESSION_TTL), fetch=False)
+    query_cache.invalidate(get_revoked_sessions)
+    return result
+
+# Session Revocation Functions
+@cached(ttl=SESSION_REVOCATION_CACHE_TTL)
+def get_revoked_sessions():
+    """Get the revocations of session tokens that have not expired yet (revoked_at as epoch seconds)."""
+    query = """
+    SELECT token_id, user_id, EXTRACT(EPOCH FROM revoked_at)::float as revoked_at
+    FROM revoked_sessions
+    WHERE expires_at > NOW()
+    """
+    return execute_query(query)
+
+def revoke_session(token_id, user_id, expires_at):
+    """Revoke one session token until it expires (expires_at in epoch seconds)."""
+    query = """
+    WITH purged AS (
+        DELETE FROM revoked_sessions WHERE expires_at <= NOW()
+    )
+    INSERT INTO revoked_sessions (token_id, user_id, expires_at)
+    VALUES (%s, %s, to_timestamp(%s))
+    """
+    result = execute_query(query, (token_id, user_id, expires_at), fetch=False)
+    query_cache.invalidate(get_revoked_sessions)
+    return result
+
+def revoke_user_sessions(user_id):
+    """Revoke every session token issued to a user so far."""
+    # Stamped with this server's clock, like the tokens' issue times, so a
+    # token issued right after the revocation is never caught by it
+    query = """
+    INSERT INTO revoked_sessions (user_id, revoked_at, expires_at)
+    VALUES (%s, to_timestamp(%s), NOW() + make_interval(secs => %s))
+    """
+    result = execute_query(query, (user_id, time.time(), SESSION_TTL), fetch=False)
+    query_cache.invalidate(get_revoked_sessions)
+    return result
 
 # Organization Management Functions
+@cached()
 def get_organizations():
     """Get all organizations."""
     query = """
@@ -119,6 +468,19 @@ def get_organizations():
     """
     return execute_query(query)
 
+def _invalidate_organizations():
+    """Drop cached organization lists, including department names shown on templates."""
+    query_cache.invalidate(get_organizations)
+    query_cache.invalidate(get_organization_units)
+    query_cache.invalidate(get_units_under)
+    query_cache.invalidate(get_organization_subtree)
+    query_cache.invalidate(get_organization_ancestors)
+    query_cache.invalidate(get_organization_closure)
+    query_cache.invalidate(get_organization_rollup)
+    query_cache.invalidate(get_organization_departments)
+    query_cache.invalidate(get_report_templates)
+    query_cache.invalidate_tag('organizations')
+
 def add_organization(name, org_type, parent_id=None):
     """Add a new organization."""
     query = """
@@ -127,6 +489,7 @@ def add_organization(name, org_type, parent_id=None):
     RETURNING id
     """
     result = execute_query(query, (name, org_type, parent_id), fetch=True)
+    _invalidate_organizations()
     return result is not None
 
 def update_organization(org_id, name, org_type, parent_id=None):
@@ -136,13 +499,20 @@ def update_organization(org_id, name, org_type, parent_id=None):
     SET name = %s, type = %s, parent_id = %s
     WHERE id = %s
     """
-    return execute_query(query, (name, org_type, parent_id, org_id), fetch=False)
+    result = execute_query(query, (name, org_type, parent_id, org_id), fetch=False)
+    _invalidate_organizations()
+    return result
 
 def delete_organization(org_id):
     """Delete an organization by ID."""
     query = "DELETE FROM organizations WHERE id = %s"
-    return execute_query(query, (org_id,), fetch=False)
+    result = execute_query(query, (org_id,), fetch=False)
+    _invalidate_organizations()
+    # Templates of a deleted department lose their department_id
+    query_cache.invalidate(get_report_template)
+    return result
 
+@cached()
 def get_organization_units():
     """Get all member units."""
     query = """
@@ -153,6 +523,60 @@ def get_organization_units():
     """
     return execute_query(query)
 
+@cached()
+def get_units_under(parent_id):
+    """Get all member units below an organization, at any depth."""
+    query = """
+    SELECT o.id, o.name
+    FROM organization_closure c
+    JOIN organizations o ON o.id = c.descendant_id
+    WHERE c.ancestor_id = %s AND c.depth > 0 AND o.type = 'unit'
+    ORDER BY o.name
+    """
+    return execute_query(query, (parent_id,))
+
+@cached()
+def get_organization_subtree(org_id):
+    """Get an organization and everything below it, with each one's depth below it."""
+    query = """
+    SELECT o.id, o.name, o.type, o.parent_id, c.depth
+    FROM organization_closure c
+    JOIN organizations o ON o.id = c.descendant_id
+    WHERE c.ancestor_id = %s
+    ORDER BY c.depth, o.name
+    """
+    return execute_query(query, (org_id,))
+
+@cached()
+def get_organization_ancestors(org_id):
+    """Get an organization's ancestors from the top level down, ending with the organization itself."""
+    query = """
+    SELECT o.id, o.name, o.type, c.depth
+    FROM organization_closure c
+    JOIN organizations o ON o.id = c.ancestor_id
+    WHERE c.descendant_id = %s
+    ORDER BY c.depth DESC
+    """
+    return execute_query(query, (org_id,))
+
+def get_organization_depth(org_id):
+    """Return how many levels an organization is below the top level (0 for top-level ones)."""
+    ancestors = get_organization_ancestors(org_id)
+    if ancestors is None or ancestors.empty:
+        return None
+    return int(ancestors['depth'].max())
+
+def is_in_subtree(ancestor_id, org_id):
+    """Return True if org_id is ancestor_id or lies anywhere below it."""
+    query = """
+    SELECT 1
+    FROM organization_closure
+    WHERE ancestor_id = %s AND descendant_id = %s
+    """
+    result = execute_query(query, (ancestor_id, org_id))
+    return result is not None and not result.empty
+
+@cached()
 def get_organization_departments():
     """Get all functional departments."""
     query = """
@@ -164,17 +588,19 @@ def get_organization_departments():
     return execute_query(query)
 
 # Report Template Management Functions
+@cached()
 def get_report_templates():
     """Get all report templates."""
     query = """
     SELECT rt.id, rt.name, rt.description, rt.fields, rt.created_at, rt.updated_at,
-           o.name as department
+           rt.department_id, o.name as department
     FROM report_templates rt
     LEFT JOIN organizations o ON rt.department_id = o.id
     ORDER BY rt.name
     """
     return execute_query(query)
 
+@cached()
 def get_report_template(template_id):
     """Get a specific report template by ID."""
     query = """
@@ -194,7 +620,8 @@ def add_report_template(name, description, fields, department_id):
     VALUES (%s, %s, %s, %s)
     RETURNING id
     """
-    result = execute_query(query, (name, description, fields, department_id), fetch=True)
+    result = execute_query(query, (name, description, to_jsonb(fields), department_id), fetch=True)
+    query_cache.invalidate(get_report_templates)
     return result is not None
 
 def update_report_template(template_id, name, description, fields, department_id):
@@ -204,12 +631,31 @@ def update_report_template(template_id, name, description, fields, department_id
     SET name = %s, description = %s, fields = %s, department_id = %s, updated_at = NOW()
     WHERE id = %s
     """
-    return execute_query(query, (name, description, fields, department_id, template_id), fetch=False)
+    result = execute_query(query, (name, description, to_jsonb(fields), department_id, template_id), fetch=False)
+    template_cache.get_template_cache().invalidate(template_id)
+    query_cache.invalidate(get_report_templates)
+    query_cache.invalidate(get_report_template, template_id)
+    return result
 
 def delete_report_template(template_id):
     """Delete a report template by ID."""
     query = "DELETE FROM report_templates WHERE id = %s"
-    return execute_query(query, (template_id,), fetch=False)
+    result = execute_query(query, (template_id,), fetch=False)
+    template_cache.get_template_cache().invalidate(template_id)
+    query_cache.invalidate(get_report_templates)
+    query_cache.invalidate(get_report_template, template_id)
+    query_cache.invalidate(get_report_template_sheet_structure, template_id)
+    # Deleting a template deletes its assigned reports
+    query_cache.invalidate_tag('assignments')
+    return result
+
+def get_report_template_version(template_id):
+    """Get a template's updated_at, which changes whenever its fields or sheets do."""
+    query = "SELECT updated_at FROM report_templates WHERE id = %s"
+    result = execute_query(query, (template_id,))
+    if result is not None and not result.empty:
+        return result.iloc[0]['updated_at']
+    return None
 
 # Report Assignment Functions
 def assign_report(template_id, organization_id, due_date):
@@ -220,30 +666,192 @@ def assign_report(template_id, organization_id, due_date):
     RETURNING id
     """
     result = execute_query(query, (template_id, organization_id, due_date), fetch=True)
+    query_cache.invalidate_tag('assignments')
     return result is not None
 
-def get_assigned_reports():
-    """Get all assigned reports."""
+def assign_reports_bulk(template_id, organization_ids, due_dates):
+    """Assign a template to every organization for every due date in one transaction.
+
+    All rows go in with a single multi-row INSERT, so either every assignment is
+    created or none is. A unit or date given twice (e.g. picked directly and
+    again through its parent) is assigned once. Returns the new assigned report
+    ids, or None on error.
+    """
+    organization_ids = dict.fromkeys(int(organization_id) for organization_id in organization_ids)
+    rows = [
+        (int(template_id), organization_id, due_date)
+        for due_date in dict.fromkeys(due_dates)
+        for organization_id in organization_ids
+    ]
+    if not rows:
+        return []
+
     query = """
+    INSERT INTO assigned_reports (template_id, organization_id, due_date, status)
+    VALUES %s
+    RETURNING id
+    """
+    try:
+        with transaction(cursor_factory=None) as cursor:
+            result = execute_values(cursor, query, rows, template="(%s, %s, %s, 'pending')",
+                                    page_size=len(rows), fetch=True)
+        query_cache.invalidate_tag('assignments')
+        return [row[0] for row in result]
+    except Exception as e:
+        st.error(f"Query execution error: {e}")
+        return None
+
+def _assigned_reports_filters(status=None, due_from=None, due_to=None, organization_id=None, template_id=None,
+                              after=None, department_id=None):
+    """Build the WHERE clause and parameters for filtering assigned reports.
+
+    `department_id` keeps the reports of templates owned by that department.
+
+    `after` is the (due_date, id) of the last row of the previous page; rows
+    sorted by due_date, id resume right after it (keyset pagination).
+    """
+    conditions = []
+    params = []
+
+    if status is not None:
+        if isinstance(status, (list, tuple, set)):
+            conditions.append("ar.status = ANY(%s)")
+            params.append(list(status))
+        else:
+            conditions.append("ar.status = %s")
+            params.append(status)
+    if due_from is not None:
+        conditions.append("ar.due_date >= %s")
+        params.append(due_from)
+    if due_to is not None:
+        conditions.append("ar.due_date <= %s")
+        params.append(due_to)
+    if organization_id is not None:
+        if isinstance(organization_id, (list, tuple, set)):
+            conditions.append("ar.organization_id = ANY(%s)")
+            params.append(list(organization_id))
+        else:
+            conditions.append("ar.organization_id = %s")
+            params.append(organization_id)
+    if template_id is not None:
+        conditions.append("ar.template_id = %s")
+        params.append(template_id)
+    if department_id is not None:
+        conditions.append("ar.template_id IN (SELECT id FROM report_templates WHERE department_id = %s)")
+        params.append(department_id)
+    if after is not None:
+        conditions.append("(ar.due_date, ar.id) > (%s, %s)")
+        params.extend([after[0], int(after[1])])
+
+    where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return where_clause, params
+
+def get_assigned_reports(status=None, due_from=None, due_to=None, organization_id=None,
+                         template_id=None, limit=None, offset=None, after=None, department_id=None):
+    """Get assigned reports, optionally filtered by status, due date window, organization, template
+    and the department owning the template.
+
+    Filters, LIMIT and OFFSET are applied in SQL so callers only fetch the rows they display.
+    For paging through long histories pass `after` (see _assigned_reports_filters)
+    instead of an OFFSET, so every page costs the same.
+    """
+    where_clause, params = _assigned_reports_filters(
+        status, due_from, due_to, organization_id, template_id, after, department_id
+    )
+    query = f"""
     SELECT ar.id, rt.name as report_name, o.name as organization, ar.due_date, ar.status
     FROM assigned_reports ar
     JOIN report_templates rt ON ar.template_id = rt.id
     JOIN organizations o ON ar.organization_id = o.id
-    ORDER BY ar.due_date
+    {where_clause}
+    ORDER BY ar.due_date, ar.id
     """
-    return execute_query(query)
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
+    if offset:
+        query += " OFFSET %s"
+        params.append(offset)
+    return execute_query(query, params)
 
-def get_organization_assigned_reports(organization_id):
-    """Get reports assigned to a specific organization."""
-    query = """
+def get_assigned_report_status_counts(status=None, organization_id=None, department_id=None):
+    """Count assigned reports per status for the given filters."""
+    where_clause, params = _assigned_reports_filters(
+        status=status, organization_id=organization_id, department_id=department_id
+    )
+    query = f"""
+    SELECT ar.status, COUNT(*) as count
+    FROM assigned_reports ar
+    {where_clause}
+    GROUP BY ar.status
+    ORDER BY ar.status
+    """
+    return execute_query(query, params)
+
+def stream_assigned_reports(status=None, due_from=None, due_to=None, organization_id=None, template_id=None,
+                            department_id=None):
+    """Yield (report_name, organization, due_date, status, id) rows for the status export.
+
+    Takes the same filters as get_assigned_reports but streams rows through a
+    server-side cursor instead of building a DataFrame.
+    """
+    where_clause, params = _assigned_reports_filters(
+        status, due_from, due_to, organization_id, template_id, department_id=department_id
+    )
+    query = f"""
+    SELECT rt.name as report_name, o.name as organization, ar.due_date, ar.status, ar.id
+    FROM assigned_reports ar
+    JOIN report_templates rt ON ar.template_id = rt.id
+    JOIN organizations o ON ar.organization_id = o.id
+    {where_clause}
+    ORDER BY ar.due_date, ar.id
+    """
+    return stream_query(query, params)
+
+def _paged(query, params, limit):
+    """Append the keyset sort order and an optional LIMIT to an assigned reports query."""
+    query += " ORDER BY ar.due_date, ar.id"
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
+    return query, params
+
+def get_organization_assigned_reports(organization_id, status=None, limit=None, after=None):
+    """Get reports assigned to a specific organization, optionally one status and one page."""
+    where_clause, params = _assigned_reports_filters(status=status, organization_id=organization_id, after=after)
+    query = f"""
     SELECT ar.id, rt.name as report_name, rt.description, ar.due_date, ar.status,
            rt.fields, ar.template_id
     FROM assigned_reports ar
     JOIN report_templates rt ON ar.template_id = rt.id
-    WHERE ar.organization_id = %s
-    ORDER BY ar.due_date
+    {where_clause}
+    """
+    return execute_query(*_paged(query, params, limit))
+
+def get_organization_reports_with_submissions(organization_id, limit=None, after=None):
+    """Get reports assigned to an organization together with each one's latest submission.
+
+    One query replaces a get_report_submission call per report; the submission
+    columns are null for reports that have not been submitted. `limit` and
+    `after` select one page as in get_assigned_reports.
+    """
+    where_clause, params = _assigned_reports_filters(organization_id=organization_id, after=after)
+    query = f"""
+    SELECT ar.id, rt.name as report_name, rt.description, ar.due_date, ar.status,
+           rt.fields, ar.template_id,
+           ls.id as submission_id, ls.data, ls.submitted_at, ls.sharepoint_url
+    FROM assigned_reports ar
+    JOIN report_templates rt ON ar.template_id = rt.id
+    LEFT JOIN LATERAL (
+        SELECT rs.id, rs.data, rs.submitted_at, rs.sharepoint_url
+        FROM report_submissions rs
+        WHERE rs.assigned_report_id = ar.id
+        ORDER BY rs.submitted_at DESC
+        LIMIT 1
+    ) ls ON TRUE
+    {where_clause}
     """
-    return execute_query(query, (organization_id,))
+    return execute_query(*_paged(query, params, limit))
 
 def update_report_status(report_id, status):
     """Update the status of an assigned report."""
@@ -252,28 +860,50 @@ def update_report_status(report_id, status):
     SET status = %s, updated_at = NOW()
     WHERE id = %s
     """
-    return execute_query(query, (status, report_id), fetch=False)
+    result = execute_query(query, (status, report_id), fetch=False)
+    query_cache.invalidate_tag('assignments')
+    return result
 
 def submit_report_data(assigned_report_id, data, sharepoint_url=None):
-    """Submit data for an assigned report."""
-    query = """
-    INSERT INTO report_submissions (assigned_report_id, data, sharepoint_url, submitted_at)
-    VALUES (%s, %s, %s, NOW())
-    RETURNING id
+    """Submit data for an assigned report.
+
+    The submission, the report's status change and, when no sharepoint_url is
+    given, a queued SharePoint upload are written in one transaction; the upload
+    workers fill in sharepoint_url later.
     """
-    result = execute_query(query, (assigned_report_id, data, sharepoint_url), fetch=True)
-    
-    if result is not None:
-        # Update the status of the assigned report
-        update_report_status(assigned_report_id, 'completed')
+    try:
+        with transaction() as cursor:
+            cursor.execute("""
+            INSERT INTO report_submissions (assigned_report_id, data, sharepoint_url, submitted_at)
+            VALUES (%s, %s, %s, NOW())
+            RETURNING id
+            """, (assigned_report_id, to_jsonb(data), sharepoint_url))
+            submission_id = cursor.fetchone()['id']
+
+            cursor.execute("""
+            UPDATE assigned_reports
+            SET status = 'completed', updated_at = NOW()
+            WHERE id = %s
+            """, (assigned_report_id,))
+
+            if sharepoint_url is None:
+                cursor.execute(
+                    "INSERT INTO sharepoint_uploads (submission_id) VALUES (%s)",
+                    (submission_id,)
+                )
+        query_cache.invalidate_tag('submissions')
         return True
-    return False
+    except Exception as e:
+        st.error(f"Query execution error: {e}")
+        return False
 
 def get_report_submission(assigned_report_id):
-    """Get the submission data for an assigned report."""
+    """Get the submission data for an assigned report, with its template's fields."""
     query = """
-    SELECT rs.id, rs.data, rs.submitted_at, rs.sharepoint_url
+    SELECT rs.id, rs.data, rs.submitted_at, rs.sharepoint_url, rt.fields
     FROM report_submissions rs
+    JOIN assigned_reports ar ON ar.id = rs.assigned_report_id
+    JOIN report_templates rt ON rt.id = ar.template_id
     WHERE rs.assigned_report_id = %s
     ORDER BY rs.submitted_at DESC
     LIMIT 1
@@ -283,6 +913,83 @@ def get_report_submission(assigned_report_id):
         return result.iloc[0].to_dict()
     return None
 
+def find_submissions(criteria, template_id=None):
+    """Find the latest submissions whose data contains `criteria` (a dict matched with JSONB @>).
+
+    The containment test is served by the GIN index on report_submissions.data.
+    """
+    query = """
+    SELECT DISTINCT ON (ar.id) ar.id as assigned_report_id, o.name as organization,
+           rt.name as report_name, ar.due_date, rs.data, rs.submitted_at
+    FROM report_submissions rs
+    JOIN assigned_reports ar ON rs.assigned_report_id = ar.id
+    JOIN report_templates rt ON ar.template_id = rt.id
+    JOIN organizations o ON ar.organization_id = o.id
+    WHERE rs.data @> %s AND (%s IS NULL OR ar.template_id = %s)
+    ORDER BY ar.id, rs.submitted_at DESC
+    """
+    return execute_query(query, (Json(criteria), template_id, template_id))
+
+# Consolidation Functions
+def get_consolidation_values(template_id, due_from, due_to):
+    """Get per-unit totals of every numeric field submitted for a template and period.
+
+    Uses the latest submission of each assigned report due in [due_from, due_to].
+    Handles both flat submissions ({"field": value}) and the multi-sheet row lists
+    produced by excel_utils.parse_excel_submission ({"sheet": [{"field_id": value}, ...]}).
+    Values such as "1,234,567 VND" or "85.5%" are parsed as numbers; anything else is
+    skipped. Returns one row per unit, sheet and field with the summed value.
+    """
+    query = r"""
+    WITH latest AS (
+        SELECT DISTINCT ON (ar.id) ar.organization_id, rs.data
+        FROM assigned_reports ar
+        JOIN report_submissions rs ON rs.assigned_report_id = ar.id
+        WHERE ar.template_id = %s AND ar.due_date BETWEEN %s AND %s
+        ORDER BY ar.id, rs.submitted_at DESC
+    ),
+    entries AS (
+        SELECT l.organization_id, e.key, e.value
+        FROM latest l
+        CROSS JOIN LATERAL jsonb_each(
+            CASE WHEN jsonb_typeof(l.data) = 'object' THEN l.data ELSE '{}'::jsonb END
+        ) e
+    ),
+    cells AS (
+        -- Flat submissions: {"field": value}
+        SELECT organization_id, '' AS sheet, key AS field, value
+        FROM entries
+        WHERE jsonb_typeof(value) IN ('number', 'string')
+        UNION ALL
+        -- Multi-sheet submissions: {"sheet": [{"field_id": value}, ...]}
+        SELECT e.organization_id, e.key AS sheet, c.key AS field, c.value
+        FROM entries e
+        CROSS JOIN LATERAL jsonb_array_elements(
+            CASE WHEN jsonb_typeof(e.value) = 'array' THEN e.value ELSE '[]'::jsonb END
+        ) r
+        CROSS JOIN LATERAL jsonb_each(
+            CASE WHEN jsonb_typeof(r) = 'object' THEN r ELSE '{}'::jsonb END
+        ) c
+    ),
+    numbers AS (
+        SELECT organization_id, sheet, field,
+               CASE
+                   WHEN jsonb_typeof(value) = 'number' THEN (value #>> '{}')::numeric
+                   WHEN value #>> '{}' ~ '^\s*-?[0-9][0-9,]*(\.[0-9]+)?\s*[%%A-Za-z/ ]*$'
+                       THEN replace(substring(value #>> '{}' FROM '-?[0-9][0-9,]*(?:\.[0-9]+)?'), ',', '')::numeric
+               END AS value
+        FROM cells
+    )
+    SELECT n.organization_id, o.name as organization, n.sheet, n.field,
+           SUM(n.value) AS value, COUNT(*) AS row_count
+    FROM numbers n
+    JOIN organizations o ON n.organization_id = o.id
+    WHERE n.value IS NOT NULL
+    GROUP BY n.organization_id, o.name, n.sheet, n.field
+    ORDER BY n.sheet, n.field, o.name
+    """
+    return execute_query(query, (template_id, due_from, due_to))
+
 # Dashboard Statistics Functions
 def get_total_reports():
     """Get total reports statistics."""
@@ -303,6 +1010,25 @@ def get_reports_by_status(status):
     result = execute_query(query, (status,))
     return result.iloc[0]['count'] if not result.empty else 0
 
+def get_admin_dashboard_stats():
+    """Get template and assignment counts for the admin dashboard in one query."""
+    query = """
+    SELECT (SELECT COUNT(*) FROM report_templates) AS templates,
+           COUNT(*) AS assigned,
+           COUNT(*) FILTER (WHERE status = 'pending') AS pending,
+           COUNT(*) FILTER (WHERE status = 'completed') AS completed,
+           COUNT(*) FILTER (WHERE status = 'overdue') AS overdue
+    FROM assigned_reports
+    """
+    return _stats_row(execute_query(query), ['templates', 'assigned', 'pending', 'completed', 'overdue'])
+
+def _stats_row(result, keys):
+    """Convert a single-row count query result into a dict of ints."""
+    if result is None or result.empty:
+        return {key: 0 for key in keys}
+    row = result.iloc[0]
+    return {key: int(row[key]) for key in keys}
+
 def get_total_users():
     """Get total number of users."""
     query = "SELECT COUNT(*) as count FROM users"
@@ -329,6 +1055,70 @@ def get_report_by_organization():
     """
     return execute_query(query)
 
+def get_organization_completion_stats(period_from=None, period_to=None):
+    """Get each organization's completed and outstanding reports and completion rate.
+
+    Reads the report_status_counts summary (maintained by triggers on
+    assigned_reports) instead of grouping every assigned report. Periods are
+    due-date months; pass dates to limit the range.
+    """
+    conditions = ["c.count > 0"]
+    params = []
+    if period_from is not None:
+        conditions.append("c.period >= date_trunc('month', %s::date)")
+        params.append(period_from)
+    if period_to is not None:
+        conditions.append("c.period <= %s")
+        params.append(period_to)
+
+    query = f"""
+    SELECT o.name as organization,
+           COALESCE(SUM(c.count) FILTER (WHERE c.status = 'completed'), 0) as completed,
+           COALESCE(SUM(c.count) FILTER (WHERE c.status <> 'completed'), 0) as not_completed,
+           ROUND(100.0 * COALESCE(SUM(c.count) FILTER (WHERE c.status = 'completed'), 0)
+                 / SUM(c.count), 1) as completion_rate
+    FROM report_status_counts c
+    JOIN organizations o ON c.organization_id = o.id
+    WHERE {' AND '.join(conditions)}
+    GROUP BY o.id, o.name
+    ORDER BY o.name
+    """
+    return execute_query(query, params)
+
+@cached(ttl=ROLLUP_CACHE_TTL, tags=('submissions', 'assignments'))
+def get_organization_rollup(period_from, period_to):
+    """Get every organization's report counts summed over its whole subtree.
+
+    One pass over the organization_closure and report_status_counts tables
+    gives each node the pending, overdue and completed reports of everything
+    below it (itself included). Periods are due-date months. Writes in this
+    process drop the cached counts at once; writes by other processes (e.g. a
+    separate scheduler worker) show up within ROLLUP_CACHE_TTL seconds.
+    """
+    query = """
+    SELECT o.id, o.name, o.type, o.parent_id,
+           COALESCE(SUM(s.count), 0) as total,
+           COALESCE(SUM(s.count) FILTER (WHERE s.status = 'completed'), 0) as completed,
+           COALESCE(SUM(s.count) FILTER (WHERE s.status = 'pending'), 0) as pending,
+           COALESCE(SUM(s.count) FILTER (WHERE s.status = 'overdue'), 0) as overdue
+    FROM organizations o
+    JOIN organization_closure c ON c.ancestor_id = o.id
+    LEFT JOIN report_status_counts s ON s.organization_id = c.descendant_id
+        AND s.period >= date_trunc('month', %s::date) AND s.period <= %s
+    GROUP BY o.id, o.name, o.type, o.parent_id
+    ORDER BY o.name
+    """
+    return execute_query(query, (period_from, period_to))
+
+@cached()
+def get_organization_closure():
+    """Get every (ancestor_id, descendant_id) pair of the organization tree."""
+    query = """
+    SELECT ancestor_id, descendant_id
+    FROM organization_closure
+    """
+    return execute_query(query)
+
 def get_recent_activity():
     """Get recent activity for the dashboard."""
     query = """
@@ -364,6 +1154,19 @@ def get_department_reports_by_status(department_id, status):
     result = execute_query(query, (department_id, status))
     return result.iloc[0]['count'] if not result.empty else 0
 
+def get_department_dashboard_stats(department_id):
+    """Get total, pending, completed and overdue counts for a department in one query."""
+    query = """
+    SELECT COUNT(*) AS total,
+           COUNT(*) FILTER (WHERE ar.status = 'pending') AS pending,
+           COUNT(*) FILTER (WHERE ar.status = 'completed') AS completed,
+           COUNT(*) FILTER (WHERE ar.status = 'overdue') AS overdue
+    FROM assigned_reports ar
+    JOIN report_templates rt ON ar.template_id = rt.id
+    WHERE rt.department_id = %s
+    """
+    return _stats_row(execute_query(query, (department_id,)), ['total', 'pending', 'completed', 'overdue'])
+
 def get_department_report_status(department_id):
     """Get report status data for a department."""
     query = """
@@ -410,6 +1213,18 @@ def get_unit_reports_by_status(unit_id, status):
     result = execute_query(query, (unit_id, status))
     return result.iloc[0]['count'] if not result.empty else 0
 
+def get_unit_dashboard_stats(unit_id):
+    """Get total, pending, completed and overdue counts for a unit in one query."""
+    query = """
+    SELECT COUNT(*) AS total,
+           COUNT(*) FILTER (WHERE status = 'pending') AS pending,
+           COUNT(*) FILTER (WHERE status = 'completed') AS completed,
+           COUNT(*) FILTER (WHERE status = 'overdue') AS overdue
+    FROM assigned_reports
+    WHERE organization_id = %s
+    """
+    return _stats_row(execute_query(query, (unit_id,)), ['total', 'pending', 'completed', 'overdue'])
+
 def get_unit_upcoming_reports(unit_id):
     """Get upcoming reports for a unit."""
     query = """
@@ -428,57 +1243,368 @@ def get_unit_action_needed_reports(unit_id):
     SELECT ar.id, rt.name as report_name, rt.description, ar.due_date, ar.status
     FROM assigned_reports ar
     JOIN report_templates rt ON ar.template_id = rt.id
-    WHERE ar.organization_id = %s AND ar.status = 'pending'
+    WHERE ar.organization_id = %s AND ar.status IN ('pending', 'overdue')
     ORDER BY 
-        CASE WHEN ar.due_date < CURRENT_DATE THEN 0 ELSE 1 END,
+        CASE WHEN ar.status = 'overdue' THEN 0 ELSE 1 END,
         ar.due_date ASC
     """
     return execute_query(query, (unit_id,))
 
-# System settings functions
-def get_settings(setting_type):
-    """Get settings by type."""
+# Background job functions
+def mark_overdue_reports():
+    """Flip pending reports whose due date has passed to 'overdue' and return the row count.
+
+    Errors are raised rather than shown in the page so the scheduler can record them.
+    """
     query = """
-    SELECT value
-    FROM system_settings
-    WHERE type = %s
+    UPDATE assigned_reports
+    SET status = 'overdue', updated_at = NOW()
+    WHERE status = 'pending' AND due_date < CURRENT_DATE
+    """
+    with transaction() as cursor:
+        cursor.execute(query)
+        updated = cursor.rowcount
+    if updated:
+        query_cache.invalidate_tag('assignments')
+    return updated
+
+# Report Schedule Functions
+def get_report_schedules():
+    """Get all recurring report schedules with their template and unit count."""
+    query = """
+    SELECT s.id, s.name, rt.name as template, s.frequency, s.cron_expression,
+           s.first_due_date, s.end_date, s.lead_days, s.active,
+           (SELECT COUNT(*) FROM report_schedule_units su WHERE su.schedule_id = s.id) as units
+    FROM report_schedules s
+    JOIN report_templates rt ON s.template_id = rt.id
+    ORDER BY s.name
+    """
+    return execute_query(query)
+
+def add_report_schedule(name, template_id, organization_ids, frequency, first_due_date,
+                        end_date=None, lead_days=31, cron_expression=None):
+    """Create a recurring schedule for a set of units and return its id, or None on error."""
+    query = """
+    INSERT INTO report_schedules (name, template_id, frequency, cron_expression,
+                                  first_due_date, end_date, lead_days)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    RETURNING id
     """
-    result = execute_query(query, (setting_type,))
+    try:
+        if frequency == "cron":
+            recurrence.parse_cron(cron_expression)
+        with transaction(cursor_factory=None) as cursor:
+            cursor.execute(query, (name, int(template_id), frequency, cron_expression,
+                                   first_due_date, end_date, int(lead_days)))
+            schedule_id = cursor.fetchone()[0]
+            execute_values(
+                cursor,
+                "INSERT INTO report_schedule_units (schedule_id, organization_id) VALUES %s",
+                [(schedule_id, int(organization_id)) for organization_id in set(organization_ids)]
+            )
+        return schedule_id
+    except Exception as e:
+        st.error(f"Query execution error: {e}")
+        return None
+
+def set_report_schedule_active(schedule_id, active):
+    """Pause or resume a schedule; reports it already created are kept."""
+    query = """
+    UPDATE report_schedules
+    SET active = %s, updated_at = NOW()
+    WHERE id = %s
+    """
+    return execute_query(query, (active, schedule_id), fetch=False)
+
+def delete_report_schedule(schedule_id):
+    """Delete a schedule; reports it already created are kept."""
+    query = "DELETE FROM report_schedules WHERE id = %s"
+    return execute_query(query, (schedule_id,), fetch=False)
+
+def materialize_scheduled_reports(schedule_id=None):
+    """Create the assigned reports that active schedules have due within their lead time.
+
+    Each schedule's upcoming due dates are inserted for all of its units with one
+    INSERT ... SELECT. The unique index on (schedule_id, organization_id, due_date)
+    makes reruns no-ops, and a unit that already has the template assigned by hand
+    for that date is skipped. Returns the number of reports created; errors are
+    raised for the scheduler to record.
+    """
+    query = """
+    SELECT id, frequency, cron_expression, first_due_date, end_date, lead_days
+    FROM report_schedules
+    WHERE active
+    """
+    params = []
+    if schedule_id is not None:
+        query += " AND id = %s"
+        params.append(schedule_id)
+
+    insert_query = """
+    INSERT INTO assigned_reports (template_id, organization_id, due_date, status, schedule_id)
+    SELECT s.template_id, su.organization_id, d.due_date, 'pending', s.id
+    FROM report_schedules s
+    JOIN report_schedule_units su ON su.schedule_id = s.id
+    CROSS JOIN unnest(%s::date[]) AS d(due_date)
+    WHERE s.id = %s
+      AND NOT EXISTS (
+          SELECT 1 FROM assigned_reports ar
+          WHERE ar.organization_id = su.organization_id
+            AND ar.due_date = d.due_date
+            AND ar.template_id = s.template_id
+      )
+    ON CONFLICT (schedule_id, organization_id, due_date) DO NOTHING
+    """
+
+    with transaction() as cursor:
+        cursor.execute(query, params)
+        schedules = cursor.fetchall()
+
+    today = datetime.now().date()
+    created = 0
+    for schedule in schedules:
+        window_end = today + timedelta(days=schedule['lead_days'])
+        if schedule['end_date'] is not None:
+            window_end = min(window_end, schedule['end_date'])
+        due_dates = recurrence.due_dates(
+            schedule['frequency'], schedule['first_due_date'], today, window_end,
+            schedule['cron_expression']
+        )
+        if not due_dates:
+            continue
+
+        # One transaction per schedule keeps each batch short
+        with transaction() as cursor:
+            cursor.execute(insert_query, (due_dates, schedule['id']))
+            created += cursor.rowcount
+    if created:
+        query_cache.invalidate_tag('assignments')
+    return created
+
+def record_job_run(job_name, started_at, duration_ms, rows_affected, error=None):
+    """Record the outcome of a background job run."""
+    query = """
+    INSERT INTO job_runs (job_name, started_at, duration_ms, rows_affected, error)
+    VALUES (%s, %s, %s, %s, %s)
+    """
+    return execute_query(query, (job_name, started_at, duration_ms, rows_affected, error), fetch=False)
+
+def get_job_runs(job_name=None, limit=20):
+    """Get the most recent background job runs."""
+    query = """
+    SELECT job_name, started_at, duration_ms, rows_affected, error
+    FROM job_runs
+    WHERE %s IS NULL OR job_name = %s
+    ORDER BY started_at DESC
+    LIMIT %s
+    """
+    return execute_query(query, (job_name, job_name, limit))
+
+# Period Export Functions
+def _period_submissions_query(department_id=None, template_id=None):
+    """Build the query for the latest submission of every report due in a period."""
+    conditions = ["ar.due_date BETWEEN %s AND %s"]
+    params = []
+    if department_id is not None:
+        conditions.append("rt.department_id = %s")
+        params.append(department_id)
+    if template_id is not None:
+        conditions.append("ar.template_id = %s")
+        params.append(template_id)
+
+    query = f"""
+    SELECT DISTINCT ON (ar.id) ar.id as assigned_report_id, rs.id as submission_id,
+           ar.template_id, rt.name as template_name, o.name as organization_name,
+           ar.due_date, rs.data
+    FROM assigned_reports ar
+    JOIN report_templates rt ON ar.template_id = rt.id
+    JOIN organizations o ON ar.organization_id = o.id
+    JOIN report_submissions rs ON rs.assigned_report_id = ar.id
+    WHERE {' AND '.join(conditions)}
+    ORDER BY ar.id, rs.submitted_at DESC
+    """
+    return query, params
+
+def get_period_submissions(due_from, due_to, department_id=None, template_id=None):
+    """Get the latest submission of every report due in a period, optionally for one department or template."""
+    query, params = _period_submissions_query(department_id, template_id)
+    return execute_query(query, [due_from, due_to] + params)
+
+def queue_period_uploads(due_from, due_to, department_id=None, template_id=None):
+    """Queue SharePoint uploads of the latest submission of every report due in a period; return how many."""
+    query, params = _period_submissions_query(department_id, template_id)
+    query = f"""
+    INSERT INTO sharepoint_uploads (submission_id)
+    SELECT submission_id FROM ({query}) latest
+    RETURNING id
+    """
+    result = execute_query(query, [due_from, due_to] + params)
+    return None if result is None else len(result)
+
+def enqueue_submission_upload(assigned_report_id):
+    """Queue an upload of an assigned report's latest submission and return the upload id."""
+    query = """
+    INSERT INTO sharepoint_uploads (submission_id)
+    SELECT rs.id
+    FROM report_submissions rs
+    WHERE rs.assigned_report_id = %s
+    ORDER BY rs.submitted_at DESC
+    LIMIT 1
+    RETURNING id
+    """
+    result = execute_query(query, (assigned_report_id,))
     if result is not None and not result.empty:
-        return result.iloc[0]['value']
+        return int(result.iloc[0]['id'])
     return None
 
+def claim_uploads(limit, lease_seconds):
+    """
+    Claim up to `limit` due uploads for this worker.
+
+    Claimed rows move to 'uploading' and are not due again until the lease runs
+    out, so concurrent workers (in any process) never claim the same upload.
+    Errors are raised so the worker can back off.
+
+    Returns:
+        List of dicts with the upload and the submission it belongs to
+    """
+    query = """
+    UPDATE sharepoint_uploads u
+    SET status = 'uploading', attempts = u.attempts + 1,
+        next_attempt_at = NOW() + make_interval(secs => %s), updated_at = NOW()
+    FROM (
+        SELECT id
+        FROM sharepoint_uploads
+        WHERE status IN ('pending', 'uploading') AND next_attempt_at <= NOW()
+        ORDER BY next_attempt_at
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    ) claimed, report_submissions rs, assigned_reports ar, report_templates rt, organizations o
+    WHERE u.id = claimed.id
+      AND rs.id = u.submission_id
+      AND ar.id = rs.assigned_report_id
+      AND rt.id = ar.template_id
+      AND o.id = ar.organization_id
+    RETURNING u.id, u.submission_id, u.attempts, ar.id as assigned_report_id, ar.template_id,
+              ar.due_date, rt.name as template_name, o.name as organization_name, rs.data
+    """
+    with transaction() as cursor:
+        cursor.execute(query, (lease_seconds, limit))
+        return cursor.fetchall()
+
+def complete_upload(upload_id, submission_id, url):
+    """Mark an upload done and store its URL on the submission."""
+    with transaction() as cursor:
+        cursor.execute("""
+        UPDATE sharepoint_uploads
+        SET status = 'done', url = %s, last_error = NULL, updated_at = NOW()
+        WHERE id = %s
+        """, (url, upload_id))
+        cursor.execute(
+            "UPDATE report_submissions SET sharepoint_url = %s WHERE id = %s",
+            (url, submission_id)
+        )
+
+def fail_upload(upload_id, error, retry_in=None):
+    """Record a failed attempt; retry after `retry_in` seconds, or give up when it is None."""
+    query = """
+    UPDATE sharepoint_uploads
+    SET status = CASE WHEN %s::float IS NULL THEN 'failed' ELSE 'pending' END,
+        next_attempt_at = NOW() + make_interval(secs => COALESCE(%s::float, 0)),
+        last_error = %s, updated_at = NOW()
+    WHERE id = %s
+    """
+    with transaction() as cursor:
+        cursor.execute(query, (retry_in, retry_in, error, upload_id))
+
+def get_upload_queue_counts():
+    """Count queued SharePoint uploads by status."""
+    query = """
+    SELECT status, COUNT(*) as count
+    FROM sharepoint_uploads
+    GROUP BY status
+    ORDER BY status
+    """
+    return execute_query(query)
+
+def get_failed_uploads(limit=50):
+    """Get the most recent uploads that ran out of retries."""
+    query = """
+    SELECT u.id, rt.name as report_name, o.name as organization, ar.due_date,
+           u.attempts, u.last_error, u.updated_at
+    FROM sharepoint_uploads u
+    JOIN report_submissions rs ON u.submission_id = rs.id
+    JOIN assigned_reports ar ON rs.assigned_report_id = ar.id
+    JOIN report_templates rt ON ar.template_id = rt.id
+    JOIN organizations o ON ar.organization_id = o.id
+    WHERE u.status = 'failed'
+    ORDER BY u.updated_at DESC
+    LIMIT %s
+    """
+    return execute_query(query, (limit,))
+
+def retry_failed_uploads():
+    """Queue every failed upload again with a fresh retry budget."""
+    query = """
+    UPDATE sharepoint_uploads
+    SET status = 'pending', attempts = 0, next_attempt_at = NOW(), updated_at = NOW()
+    WHERE status = 'failed'
+    """
+    return execute_query(query, fetch=False)
+
+# System settings functions
+# Notification channel the system_settings trigger sends changed types on
+SETTINGS_CHANNEL = 'system_settings'
+
+def get_all_settings():
+    """Get the JSON value of every saved setting type (cached by settings_store)."""
+    query = """
+    SELECT type, value
+    FROM system_settings
+    """
+    return execute_query(query)
+
 def save_settings(setting_type, value):
-    """Save settings by type. Updates if exists, otherwise inserts."""
-    # Check if setting exists
-    check_query = "SELECT id FROM system_settings WHERE type = %s"
-    result = execute_query(check_query, (setting_type,))
-    
-    if result is not None and not result.empty:
-        # Update existing setting
-        update_query = """
-        UPDATE system_settings
-        SET value = %s, updated_at = NOW()
-        WHERE type = %s
-        """
-        return execute_query(update_query, (value, setting_type), fetch=False)
-    else:
-        # Insert new setting
-        insert_query = """
-        INSERT INTO system_settings (type, value, created_at, updated_at)
-        VALUES (%s, %s, NOW(), NOW())
-        """
-        return execute_query(insert_query, (setting_type, value), fetch=False)
+    """Save settings by type, inserting the type if it has never been saved."""
+    query = """
+    INSERT INTO system_settings (type, value, created_at, updated_at)
+    VALUES (%s, %s, NOW(), NOW())
+    ON CONFLICT (type) DO UPDATE
+    SET value = EXCLUDED.value, updated_at = NOW()
+    """
+    return execute_query(query, (setting_type, value), fetch=False)
+
+def listen(channel):
+    """Open a dedicated autocommit connection that listens on a notification channel."""
+    conn = psycopg2.connect(**db_params)
+    conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    with conn.cursor() as cursor:
+        cursor.execute(f"LISTEN {channel}")
+    return conn
 
 def update_report_template_sheet_structure(template_id, sheet_structure):
     """Update the sheet structure for a report template."""
+    if isinstance(sheet_structure, str):
+        sheet_structure = json.loads(sheet_structure)
+    
+    # JSONB does not keep object key order, so record each sheet's position
+    positioned = {
+        sheet_name: {**sheet_config, 'position': position}
+        for position, (sheet_name, sheet_config) in enumerate(sheet_structure.items())
+    }
+    
     query = """
     UPDATE report_templates
     SET sheet_structure = %s, updated_at = NOW()
     WHERE id = %s
     """
-    return execute_query(query, (sheet_structure, template_id), fetch=False)
+    result = execute_query(query, (Json(positioned), template_id), fetch=False)
+    template_cache.get_template_cache().invalidate(template_id)
+    query_cache.invalidate(get_report_templates)
+    query_cache.invalidate(get_report_template_sheet_structure, template_id)
+    return result
 
+@cached()
 def get_report_template_sheet_structure(template_id):
     """Get the sheet structure for a report template."""
     query = """
@@ -488,5 +1614,13 @@ def get_report_template_sheet_structure(template_id):
     """
     result = execute_query(query, (template_id,))
     if result is not None and not result.empty and result.iloc[0]['sheet_structure']:
-        return result.iloc[0]['sheet_structure']
-    return None
\ No newline at end of file
+        return _ordered_sheet_structure(result.iloc[0]['sheet_structure'])
+    return None
+
+def _ordered_sheet_structure(sheet_structure):
+    """Restore the saved sheet order of a JSONB sheet structure."""
+    sheets = sorted(sheet_structure.items(), key=lambda item: item[1].get('position', 0))
+    return {
+        sheet_name: {key: value for key, value in sheet_config.items() if key != 'position'}
+        for sheet_name, sheet_config in sheets
+    }
\ No newline at end of file
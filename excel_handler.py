@@ -2,7 +2,28 @@ import io
 import pandas as pd
 import openpyxl
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-import json
+from openpyxl.formatting.rule import CellIsRule
+import tempfile
+import itertools
+import excel_utils
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+
+# Columns of the status report, in sheet order
+STATUS_REPORT_COLUMNS = ['report_name', 'organization', 'due_date', 'status', 'id']
+
+# Rows converted to column arrays at a time by the status exports
+STATUS_EXPORT_BATCH_SIZE = 5000
+
+STATUS_FILLS = {
+    'completed': PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid"),
+    'pending': PatternFill(start_color="FFEB9C", end_color="FFEB9C", fill_type="solid"),
+    'overdue': PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
+}
 
 def create_report_template(fields):
     """Create an Excel template with the specified fields."""
@@ -49,22 +70,30 @@ def create_report_template(fields):
 
 def parse_excel_report(uploaded_file, expected_fields):
     """Parse an Excel report and extract the field values."""
-    # Read the Excel file
-    df = pd.read_excel(uploaded_file)
+    # Only the header row and the first data row are needed
+    workbook = openpyxl.load_workbook(uploaded_file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(max_row=2, values_only=True)
+        headers = list(next(rows, ()))
+        first_row = next(rows, None)
+    finally:
+        workbook.close()
     
     # Validate that all expected fields are present as column headers
     for field in expected_fields:
-        if field not in df.columns:
+        if field not in headers:
             raise ValueError(f"Missing expected field: {field}")
     
+    if first_row is None or all(value is None or value == '' for value in first_row):
+        raise ValueError("Excel file contains no data rows")
+    
     # Extract the first row of data for each field
     data = {}
-    if len(df) > 0:
-        for field in expected_fields:
-            # Convert to string to ensure compatibility with JSON
-            data[field] = str(df[field].iloc[0])
-    else:
-        raise ValueError("Excel file contains no data rows")
+    for field in expected_fields:
+        col = headers.index(field)
+        value = first_row[col] if col < len(first_row) else None
+        # Convert to string to ensure compatibility with JSON
+        data[field] = str(value) if value is not None else ''
     
     return data
 
@@ -115,11 +144,11 @@ def create_excel_from_report(report, submission):
     
     if submission:
         try:
-            data = json.loads(submission['data'])
+            items = excel_utils.ordered_submission_items(submission['data'], submission.get('fields'))
             
             # Add header row
             col = 1
-            for field in data.keys():
+            for field, _ in items:
                 cell = worksheet.cell(row=row, column=col, value=field)
                 cell.font = header_font
                 cell.fill = header_fill
@@ -130,7 +159,7 @@ def create_excel_from_report(report, submission):
             # Add data row
             row += 1
             col = 1
-            for value in data.values():
+            for _, value in items:
                 cell = worksheet.cell(row=row, column=col, value=value)
                 cell.border = thin_border
                 col += 1
@@ -147,84 +176,140 @@ def create_excel_from_report(report, submission):
     
     return output.getvalue()
 
-def create_status_report(reports_df):
-    """Create an Excel status report from the reports dataframe."""
-    # Create a new workbook and select the active worksheet
-    output = io.BytesIO()
-    workbook = openpyxl.Workbook()
-    worksheet = workbook.active
-    worksheet.title = "Report Status"
-    
-    # Define styles
-    header_font = Font(bold=True, color="FFFFFF")
-    header_fill = PatternFill(start_color="0066B2", end_color="0066B2", fill_type="solid")
-    header_alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
-    
-    completed_fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
-    pending_fill = PatternFill(start_color="FFEB9C", end_color="FFEB9C", fill_type="solid")
-    overdue_fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
-    
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-    
-    # Add title
-    worksheet.merge_cells('A1:E1')
-    title_cell = worksheet.cell(row=1, column=1, value="Vinatex Report Status")
-    title_cell.font = Font(bold=True, size=14)
-    title_cell.alignment = Alignment(horizontal="center")
-    
-    # Add generation date
-    import datetime
-    worksheet.merge_cells('A2:E2')
-    date_cell = worksheet.cell(row=2, column=1, value=f"Generated on: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    date_cell.alignment = Alignment(horizontal="center")
-    
-    # Add header row
-    headers = ["Report Name", "Organization", "Due Date", "Status", "ID"]
-    for col, header in enumerate(headers, 1):
-        cell = worksheet.cell(row=4, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-        cell.border = thin_border
-    
-    # Add data rows
-    for i, (_, row) in enumerate(reports_df.iterrows(), 5):
-        worksheet.cell(row=i, column=1, value=row['report_name']).border = thin_border
-        worksheet.cell(row=i, column=2, value=row['organization']).border = thin_border
-        worksheet.cell(row=i, column=3, value=str(row['due_date'])).border = thin_border
+def status_report_batches(reports, batch_size=STATUS_EXPORT_BATCH_SIZE):
+    """
+    Split status report rows into DataFrames of at most `batch_size` rows.
+
+    Args:
+        reports: A dataframe from get_assigned_reports or an iterable of
+            (report_name, organization, due_date, status, id) rows such as
+            database.stream_assigned_reports()
+        batch_size: Maximum number of rows per batch
+
+    Yields:
+        DataFrames with STATUS_REPORT_COLUMNS
+    """
+    if isinstance(reports, pd.DataFrame):
+        for start in range(0, len(reports), batch_size):
+            yield reports[STATUS_REPORT_COLUMNS].iloc[start:start + batch_size]
+        return
+
+    rows = iter(reports)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return
+        yield pd.DataFrame.from_records(batch, columns=STATUS_REPORT_COLUMNS)
+
+def create_status_report(reports):
+    """Create an Excel status report.
+
+    `reports` is either a dataframe from get_assigned_reports or an iterable of
+    (report_name, organization, due_date, status, id) rows such as
+    database.stream_assigned_reports(). Each batch of rows is rendered to
+    sheet XML with column-wise string operations and spooled to a temporary
+    file, which is spliced into the workbook once the title, header and
+    formatting are saved; memory use does not grow with the row count and
+    status colors come from conditional formatting rules.
+    """
+    with tempfile.TemporaryFile() as rows_file:
+        # Add data rows (dates are written as text, the ID as a number)
+        row_count = 0
+        for frame in status_report_batches(reports):
+            frame = frame.assign(due_date=frame['due_date'].astype(str))
+            rows_file.write(excel_utils.rows_xml(frame, 5 + row_count, numeric_columns=('id',)).encode('utf-8'))
+            row_count += len(frame)
+        rows_file.seek(0)
+        last_row = row_count + 4
         
-        status_cell = worksheet.cell(row=i, column=4, value=row['status'])
-        status_cell.border = thin_border
+        workbook = excel_utils.create_streaming_workbook()
+        worksheet = workbook.create_sheet("Report Status")
         
-        # Color-code the status
-        if row['status'] == 'completed':
-            status_cell.fill = completed_fill
-        elif row['status'] == 'pending':
-            status_cell.fill = pending_fill
-        elif row['status'] == 'overdue':
-            status_cell.fill = overdue_fill
+        # Adjust column widths and hide the ID column (used for reference)
+        for column, width in zip("ABCD", (30, 30, 15, 15)):
+            worksheet.column_dimensions[column].width = width
+        worksheet.column_dimensions['E'].hidden = True
         
-        worksheet.cell(row=i, column=5, value=row['id']).border = thin_border
-    
-    # Hide the ID column (used for reference)
-    worksheet.column_dimensions['E'].hidden = True
-    
-    # Adjust column widths
-    worksheet.column_dimensions['A'].width = 30
-    worksheet.column_dimensions['B'].width = 30
-    worksheet.column_dimensions['C'].width = 15
-    worksheet.column_dimensions['D'].width = 15
-    
-    # Add filters
-    worksheet.auto_filter.ref = f"A4:D{len(reports_df) + 4}"
-    
-    # Save the workbook to the BytesIO object
-    workbook.save(output)
+        # Add title and generation date
+        import datetime
+        worksheet.merged_cells.add('A1:E1')
+        worksheet.merged_cells.add('A2:E2')
+        worksheet.append([excel_utils.styled_cell(worksheet, "Vinatex Report Status", 'vt_title')])
+        generated_on = f"Generated on: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+        worksheet.append([excel_utils.styled_cell(worksheet, generated_on, 'vt_centered')])
+        worksheet.append([])
+        
+        # Add header row
+        headers = ["Report Name", "Organization", "Due Date", "Status", "ID"]
+        excel_utils.write_header(worksheet, headers, style='vt_status_header')
+        
+        # An empty export keeps just the header row; the ranges below need data rows
+        if row_count:
+            excel_utils.add_grid(worksheet, 5, last_row, len(headers))
+            
+            # Color-code the status
+            for status, fill in STATUS_FILLS.items():
+                worksheet.conditional_formatting.add(
+                    f"D5:D{last_row}",
+                    CellIsRule(operator='equal', formula=[f'"{status}"'], fill=fill)
+                )
+            
+            # Add filters
+            worksheet.auto_filter.ref = f"A4:D{last_row}"
+        
+        workbook_file = excel_utils.save_workbook(workbook)
+        return excel_utils.splice_sheet_rows(workbook_file, 1, rows_file, last_row, 'E').getvalue()
+
+def iter_status_csv(reports):
+    """Yield the status report as UTF-8 CSV (with a BOM so Excel reads Vietnamese names), one chunk per batch."""
+    yield ('\ufeff' + ','.join(STATUS_REPORT_COLUMNS) + '\r\n').encode('utf-8')
+    for frame in status_report_batches(reports):
+        yield frame.to_csv(header=False, index=False, lineterminator='\r\n').encode('utf-8')
+
+def create_status_csv(reports, output=None):
+    """
+    Write the status report as CSV a batch at a time.
+
+    Args:
+        reports: Rows as accepted by status_report_batches
+        output: Binary file object to write to; a temporary file by default
+
+    Returns:
+        The output file, rewound to the start
+    """
+    if output is None:
+        output = tempfile.TemporaryFile()
+    for chunk in iter_status_csv(reports):
+        output.write(chunk)
     output.seek(0)
-    
+    return output
+
+def parquet_available():
+    """Return True when pyarrow is installed and Parquet exports can be created."""
+    return pq is not None
+
+def create_status_parquet(reports):
+    """
+    Create the status report as a Parquet file.
+
+    Each batch becomes one row group, so the export never holds more than one
+    batch of rows as Arrow arrays.
+
+    Raises:
+        RuntimeError: If pyarrow is not installed
+    """
+    if pq is None:
+        raise RuntimeError("Parquet export requires the pyarrow package")
+
+    schema = pa.schema([
+        ('report_name', pa.string()),
+        ('organization', pa.string()),
+        ('due_date', pa.date32()),
+        ('status', pa.string()),
+        ('id', pa.int64())
+    ])
+    output = io.BytesIO()
+    with pq.ParquetWriter(output, schema) as writer:
+        for frame in status_report_batches(reports):
+            writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
     return output.getvalue()
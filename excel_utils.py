@@ -1,289 +1,549 @@
-import json
 import os
+import re
+import json
+import shutil
+import zipfile
+import functools
+import operator
+from datetime import datetime, date
 import pandas as pd
 from io import BytesIO
 import openpyxl
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+from openpyxl.styles import Font, Alignment, PatternFill, Border, Side, NamedStyle
+from openpyxl.formatting.rule import FormulaRule
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.utils import get_column_letter
 import streamlit as st
 import database as db
+import template_cache
 
-def create_excel_from_template(template_id, data):
+# Validation stops collecting errors after this many problems in one upload
+MAX_VALIDATION_ERRORS = 20
+
+# Date formats accepted for date fields typed in as text
+DATE_INPUT_FORMATS = ['%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y']
+
+class ExcelValidationError(ValueError):
+    """Raised when uploaded cell values do not match the template's field types."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("\n".join(errors))
+
+THIN_BORDER = Border(
+    left=Side(style='thin'),
+    right=Side(style='thin'),
+    top=Side(style='thin'),
+    bottom=Side(style='thin')
+)
+
+# Number formats for typed template fields
+FIELD_STYLES = {
+    'number': 'vt_number',
+    'date': 'vt_date'
+}
+
+def _named_styles():
+    """Build the named styles shared by every exported workbook."""
+    return [
+        NamedStyle(
+            name='vt_header',
+            font=Font(bold=True, size=12),
+            fill=PatternFill(start_color="D9E1F2", end_color="D9E1F2", fill_type="solid"),
+            border=THIN_BORDER,
+            alignment=Alignment(horizontal='center', vertical='center', wrap_text=True)
+        ),
+        NamedStyle(
+            name='vt_status_header',
+            font=Font(bold=True, color="FFFFFF"),
+            fill=PatternFill(start_color="0066B2", end_color="0066B2", fill_type="solid"),
+            border=THIN_BORDER,
+            alignment=Alignment(horizontal='center', vertical='center', wrap_text=True)
+        ),
+        NamedStyle(name='vt_title', font=Font(bold=True, size=14), alignment=Alignment(horizontal='center')),
+        NamedStyle(name='vt_centered', alignment=Alignment(horizontal='center')),
+        NamedStyle(name='vt_number', border=THIN_BORDER, number_format='#,##0.00'),
+        NamedStyle(name='vt_date', border=THIN_BORDER, number_format='DD/MM/YYYY')
+    ]
+
+def create_streaming_workbook():
     """
-    Create an Excel file with multiple sheets based on the template's sheet structure.
-    
+    Create a write-only workbook with the export named styles registered.
+
+    Rows appended to a write-only sheet are flushed to disk straight away, so
+    memory stays flat however many rows are exported. Column widths must be set
+    before the first row is appended.
+
+    Returns:
+        openpyxl Workbook in write-only mode
+    """
+    wb = openpyxl.Workbook(write_only=True)
+    for style in _named_styles():
+        wb.add_named_style(style)
+    return wb
+
+def styled_cell(ws, value, style):
+    """
+    Create a cell for a write-only sheet with one of the registered named styles.
+
     Args:
-        template_id: The ID of the report template
-        data: JSON data of field values
-        
+        ws: The write-only worksheet
+        value: The cell value
+        style: Name of a style registered by create_streaming_workbook
+
+    Returns:
+        WriteOnlyCell to pass to ws.append
+    """
+    cell = WriteOnlyCell(ws, value=value)
+    cell.style = style
+    return cell
+
+def write_header(ws, headers, style='vt_header', widths=None):
+    """
+    Append a styled header row, setting the column widths first.
+
+    Args:
+        ws: The write-only worksheet
+        headers: List of header labels
+        style: Named style for the header cells
+        widths: Optional list of column widths, one per header
+    """
+    for col_idx, width in enumerate(widths or [], 1):
+        ws.column_dimensions[get_column_letter(col_idx)].width = width
+    ws.append([styled_cell(ws, header, style) for header in headers])
+
+def write_rows(ws, rows, column_styles=None):
+    """
+    Stream data rows into a write-only sheet.
+
+    Only the columns listed in `column_styles` get a styled cell; everything else
+    is written as a plain value, which is what keeps large exports fast.
+
+    Args:
+        ws: The write-only worksheet
+        rows: Iterable of row sequences (e.g. a database cursor)
+        column_styles: Optional dict of 0-based column index to named style
+
+    Returns:
+        Number of rows written
+    """
+    # Resolve each named style once; write-only cells are never modified after
+    # being appended, so they can share one style array
+    style_arrays = {
+        col_idx: styled_cell(ws, None, style)._style
+        for col_idx, style in (column_styles or {}).items()
+    }
+
+    count = 0
+    for row in rows:
+        if style_arrays:
+            row = list(row)
+            for col_idx, style_array in style_arrays.items():
+                if col_idx < len(row):
+                    cell = WriteOnlyCell(ws, value=row[col_idx])
+                    cell._style = style_array
+                    row[col_idx] = cell
+        ws.append(row)
+        count += 1
+    return count
+
+def rows_xml(frame, first_row, numeric_columns=()):
+    """
+    Render a batch of rows as SpreadsheetML <row> elements.
+
+    Each column is converted with one string operation over the whole batch
+    instead of one openpyxl cell object per value, which is where nearly all
+    the time of a large write-only export goes. Text is written as inline
+    strings; missing values are left out.
+
+    Args:
+        frame: DataFrame whose columns are written from column A on
+        first_row: Sheet row (1-based) of the first row of the batch
+        numeric_columns: Names of the columns written as numbers
+
+    Returns:
+        String of <row> elements for splice_sheet_rows
+    """
+    if frame.empty:
+        return ""
+    rows = pd.Series(range(first_row, first_row + len(frame))).astype(str)
+    cells = []
+    for col_idx, column in enumerate(frame.columns, 1):
+        values = frame[column].reset_index(drop=True)
+        refs = get_column_letter(col_idx) + rows
+        if column in numeric_columns:
+            cell = '<c r="' + refs + '"><v>' + values.astype(str) + '</v></c>'
+        else:
+            text = (
+                values.astype(str)
+                .str.replace(r'[\x00-\x08\x0b\x0c\x0e-\x1f]', '', regex=True)
+                .str.replace('&', '&amp;', regex=False)
+                .str.replace('<', '&lt;', regex=False)
+                .str.replace('>', '&gt;', regex=False)
+            )
+            cell = '<c r="' + refs + '" t="inlineStr"><is><t xml:space="preserve">' + text + '</t></is></c>'
+        cells.append(cell.where(values.notna(), ''))
+    return ''.join('<row r="' + rows + '">' + functools.reduce(operator.add, cells) + '</row>')
+
+def splice_sheet_rows(workbook, sheet_index, rows_file, last_row, last_col):
+    """
+    Append pre-rendered rows to the end of a sheet's data in a saved workbook.
+
+    Args:
+        workbook: BytesIO of the saved workbook
+        sheet_index: 1-based position of the sheet in the workbook
+        rows_file: Binary file holding the UTF-8 <row> elements from rows_xml
+        last_row: Last row of the sheet once the rows are added
+        last_col: Letter of the last column
+
+    Returns:
+        BytesIO object containing the Excel file
+    """
+    sheet_path = f"xl/worksheets/sheet{sheet_index}.xml"
+    output = BytesIO()
+    with zipfile.ZipFile(workbook) as source, \
+            zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as target:
+        for item in source.infolist():
+            if item.filename != sheet_path:
+                target.writestr(item, source.read(item.filename))
+                continue
+
+            sheet = re.sub(r'<sheetData\s*/>', '<sheetData></sheetData>', source.read(item.filename).decode('utf-8'))
+            sheet = re.sub(r'<dimension ref="[^"]*"', f'<dimension ref="A1:{last_col}{last_row}"', sheet)
+            head, tail = sheet.split('</sheetData>', 1)
+            with target.open(sheet_path, 'w') as sheet_file:
+                sheet_file.write(head.encode('utf-8'))
+                shutil.copyfileobj(rows_file, sheet_file)
+                sheet_file.write(('</sheetData>' + tail).encode('utf-8'))
+    output.seek(0)
+    return output
+
+def add_grid(ws, first_row, last_row, last_col):
+    """
+    Draw thin borders around a block of data cells.
+
+    The borders are a single conditional format over the range instead of a
+    Border on every cell.
+
+    Args:
+        ws: The worksheet
+        first_row: First data row (1-based)
+        last_row: Last data row
+        last_col: Last data column (1-based)
+    """
+    if last_row < first_row:
+        return
+    cell_range = f"A{first_row}:{get_column_letter(last_col)}{last_row}"
+    ws.conditional_formatting.add(cell_range, FormulaRule(formula=['TRUE'], border=THIN_BORDER))
+
+def save_workbook(wb):
+    """
+    Save a workbook to memory.
+
+    Args:
+        wb: The workbook
+
     Returns:
         BytesIO object containing the Excel file
     """
-    # Get the template sheet structure
+    excel_bytes = BytesIO()
+    wb.save(excel_bytes)
+    excel_bytes.seek(0)
+    return excel_bytes
+
+def get_sheet_structure(template_id):
+    """
+    Get a template's sheet structure, falling back to a single sheet of its fields.
+
+    Args:
+        template_id: The ID of the report template
+
+    Returns:
+        Dictionary of sheet name to sheet config
+    """
     sheet_structure = db.get_report_template_sheet_structure(template_id)
     if not sheet_structure:
         # Fallback to the old single-sheet structure
         template = db.get_report_template(template_id)
         if not template:
             raise ValueError("Mẫu báo cáo không tồn tại")
-        
-        fields = json.loads(template['fields'])
+
+        # Legacy templates list plain field names
+        fields = [
+            field if isinstance(field, dict) else {'id': field, 'label': field, 'type': 'text'}
+            for field in template['fields'] or []
+        ]
         sheet_structure = {
             "Báo cáo": {
                 "fields": fields
             }
         }
-    else:
-        sheet_structure = json.loads(sheet_structure)
+    return sheet_structure
+
+def _write_template_sheet(wb, sheet_name, fields, rows):
+    """Write one template sheet: the STT and field headers followed by `rows`."""
+    ws = wb.create_sheet(title=sheet_name)
+
+    # Column widths follow the header length
+    headers = ['STT'] + [field['label'] for field in fields]
+    widths = [max(10, min(50, len(header) * 1.5)) for header in headers]
+    write_header(ws, headers, widths=widths)
+
+    column_styles = {
+        col_idx: FIELD_STYLES[field['type']]
+        for col_idx, field in enumerate(fields, 1)
+        if field.get('type') in FIELD_STYLES
+    }
+    row_count = write_rows(ws, rows, column_styles)
+    add_grid(ws, 2, row_count + 1, len(headers))
+
+def create_excel_from_template(template_id, data):
+    """
+    Create an Excel file with multiple sheets based on the template's sheet structure.
     
-    # Create a new Excel workbook
-    wb = openpyxl.Workbook()
+    Args:
+        template_id: The ID of the report template
+        data: JSON data of field values
+        
+    Returns:
+        BytesIO object containing the Excel file
+    """
+    return build_submission_workbook(get_sheet_structure(template_id), data)
+
+def normalize_submission_data(data):
+    """
+    Return submission data as a dict of field values or sheet row lists.
     
-    # Remove the default sheet
-    default_sheet = wb.active
-    wb.remove(default_sheet)
+    Older submissions may hold the JSON text of the data (a JSON string in
+    the JSONB column) instead of the object itself; it is decoded. Rows that
+    are not objects are dropped from sheet row lists.
     
-    # Define styles
-    header_font = Font(bold=True, size=12)
-    header_fill = PatternFill(start_color="D9E1F2", end_color="D9E1F2", fill_type="solid")
-    border = Border(
-        left=Side(style='thin'), 
-        right=Side(style='thin'), 
-        top=Side(style='thin'), 
-        bottom=Side(style='thin')
-    )
+    Raises:
+        ValueError: If the data is not an object (e.g. a list or a number)
+    """
+    if data is None:
+        return {}
+    # Data stored as a JSON string may itself have been encoded twice
+    for _ in range(2):
+        if not isinstance(data, str):
+            break
+        data = json.loads(data)
+    if not isinstance(data, dict):
+        raise ValueError(f"submission data is not an object (got {type(data).__name__})")
+    return {
+        key: [row for row in value if isinstance(row, dict)] if isinstance(value, list) else value
+        for key, value in data.items()
+    }
+
+def ordered_submission_items(data, fields):
+    """
+    Return a flat submission's (field, value) pairs in the template's field order.
     
-    # Process each sheet in the structure
-    for sheet_name, sheet_config in sheet_structure.items():
-        # Create a new sheet
-        ws = wb.create_sheet(title=sheet_name)
+    JSONB does not keep object key order, so the order comes from the
+    template's fields (plain names or dicts with an id); keys the template does
+    not list follow in their stored order.
+    
+    Args:
+        data: Dictionary of field values
+        fields: The template's fields list, or None
         
-        # Add headers
-        headers = ['STT'] + [field['label'] for field in sheet_config['fields']]
-        for col_idx, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_idx, value=header)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.border = border
-            cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
+    Returns:
+        List of (field, value) tuples
+    """
+    field_ids = [field['id'] if isinstance(field, dict) else field for field in fields or []]
+    ordered = [(field_id, data[field_id]) for field_id in field_ids if field_id in data]
+    known = set(field_ids)
+    return ordered + [(key, value) for key, value in data.items() if key not in known]
+
+def build_submission_workbook(sheet_structure, data):
+    """
+    Create a submission's Excel file from an already loaded sheet structure.
+    
+    Does not touch the database, so batch exports can run it in worker processes.
+    
+    Args:
+        sheet_structure: Dictionary of sheet name to sheet config (see get_sheet_structure)
+        data: JSON data of field values (see normalize_submission_data)
         
-        # Auto-adjust column widths based on header length
-        for col_idx, header in enumerate(headers, 1):
-            col_letter = get_column_letter(col_idx)
-            column_width = len(header) * 1.5  # Adjust multiplier as needed
-            ws.column_dimensions[col_letter].width = max(10, min(50, column_width))
+    Returns:
+        BytesIO object containing the Excel file
         
-        # Add data rows
-        row_idx = 2
-        for idx, item in enumerate(data.get(sheet_name, []), 1):
-            ws.cell(row=row_idx, column=1, value=idx).border = border  # STT column
-            
-            for col_idx, field in enumerate(sheet_config['fields'], 2):
-                field_id = field['id']
-                value = item.get(field_id, '')
-                cell = ws.cell(row=row_idx, column=col_idx, value=value)
-                cell.border = border
-                
-                # Apply specific formatting based on field type if needed
-                if field.get('type') == 'number':
-                    cell.number_format = '#,##0.00'
-                elif field.get('type') == 'date':
-                    cell.number_format = 'DD/MM/YYYY'
-                
-            row_idx += 1
+    Raises:
+        ValueError: If the data is not a JSON object
+    """
+    data = normalize_submission_data(data)
+    wb = create_streaming_workbook()
     
-    # Save to BytesIO
-    excel_bytes = BytesIO()
-    wb.save(excel_bytes)
-    excel_bytes.seek(0)
+    # Single-sheet submissions store one flat dict of field values
+    if len(sheet_structure) == 1 and not any(isinstance(value, list) for value in data.values()):
+        data = {sheet_name: [data] for sheet_name in sheet_structure}
     
-    return excel_bytes
+    for sheet_name, sheet_config in sheet_structure.items():
+        field_ids = [field['id'] for field in sheet_config['fields']]
+        rows = (
+            [idx] + [item.get(field_id, '') for field_id in field_ids]
+            for idx, item in enumerate(data.get(sheet_name, []), 1)
+        )
+        _write_template_sheet(wb, sheet_name, sheet_config['fields'], rows)
+    
+    return save_workbook(wb)
+
+def convert_cell_value(value, field_type):
+    """
+    Validate a cell value against a template field type and convert it for storage.
+    
+    Args:
+        value: The cell value read from the workbook (not empty)
+        field_type: The field type ('text', 'number' or 'date')
+        
+    Returns:
+        The value as a string; dates are normalized to YYYY-MM-DD
+        
+    Raises:
+        ValueError: If the value does not match the field type
+    """
+    if field_type == 'number':
+        if isinstance(value, bool):
+            raise ValueError(f"'{value}' không phải là số")
+        if isinstance(value, (int, float)):
+            return str(value)
+        try:
+            float(str(value).replace(',', '').strip())
+        except ValueError:
+            raise ValueError(f"'{value}' không phải là số")
+        return str(value).strip()
+    
+    if field_type == 'date':
+        if isinstance(value, (datetime, date)):
+            return value.strftime('%Y-%m-%d')
+        text = str(value).strip()
+        for date_format in DATE_INPUT_FORMATS:
+            try:
+                return datetime.strptime(text, date_format).strftime('%Y-%m-%d')
+            except ValueError:
+                continue
+        raise ValueError(f"'{value}' không phải là ngày hợp lệ (dd/mm/yyyy)")
+    
+    return str(value)
 
 def parse_excel_submission(uploaded_file, template_id):
     """
     Parse an uploaded Excel file that was created from a template.
     
+    The workbook is opened read-only and rows are streamed one at a time, so
+    memory stays bounded however many line items a unit uploads. Each sheet
+    ends at its first fully empty row, and every value is checked against its
+    field's type as it is read.
+    
     Args:
         uploaded_file: The uploaded Excel file
         template_id: The ID of the report template
         
     Returns:
         Dictionary of field values
-    """
-    # Get the template sheet structure
-    sheet_structure = db.get_report_template_sheet_structure(template_id)
-    if not sheet_structure:
-        # Fallback to the old single-sheet structure
-        template = db.get_report_template(template_id)
-        if not template:
-            raise ValueError("Mẫu báo cáo không tồn tại")
         
-        fields = json.loads(template['fields'])
-        sheet_structure = {
-            "Báo cáo": {
-                "fields": fields
-            }
-        }
-    else:
-        sheet_structure = json.loads(sheet_structure)
+    Raises:
+        ExcelValidationError: If any cell does not match its field type
+    """
+    sheet_structure = get_sheet_structure(template_id)
     
     # Load the Excel workbook
-    wb = openpyxl.load_workbook(uploaded_file)
+    wb = openpyxl.load_workbook(uploaded_file, read_only=True, data_only=True)
     
     # Initialize the result dictionary
     result = {}
+    errors = []
     
-    # Process each sheet in the structure
-    for sheet_name, sheet_config in sheet_structure.items():
-        if sheet_name not in wb.sheetnames:
-            st.warning(f"Sheet '{sheet_name}' không tồn tại trong file Excel.")
-            continue
-        
-        ws = wb[sheet_name]
-        
-        # Skip the header row and get data
-        data_rows = list(ws.iter_rows(min_row=2, values_only=True))
-        
-        # Initialize sheet data
-        sheet_data = []
-        
-        # Get field IDs from the structure
-        field_ids = [field['id'] for field in sheet_config['fields']]
-        
-        # Process each data row
-        for row in data_rows:
-            if all(cell is None or cell == '' for cell in row[1:]):  # Skip empty rows (excluding STT column)
+    try:
+        # Process each sheet in the structure
+        for sheet_name, sheet_config in sheet_structure.items():
+            if sheet_name not in wb.sheetnames:
+                st.warning(f"Sheet '{sheet_name}' không tồn tại trong file Excel.")
                 continue
+            
+            ws = wb[sheet_name]
+            fields = sheet_config['fields']
+            field_ids = [field['id'] for field in fields]
+            field_types = [field.get('type', 'text') for field in fields]
+            
+            # Initialize sheet data
+            sheet_data = []
+            
+            # Excel data starts at row 2 and column 2 (after the header and STT column)
+            for row_idx, row in enumerate(ws.iter_rows(min_row=2, min_col=2, max_col=len(fields) + 1,
+                                                       values_only=True), 2):
+                if all(cell is None or cell == '' for cell in row):
+                    break
+                
+                row_data = {}
+                for col_idx, (field_id, field_type, cell_value) in enumerate(zip(field_ids, field_types, row), 2):
+                    if cell_value is None or cell_value == '':
+                        row_data[field_id] = ''
+                        continue
+                    try:
+                        row_data[field_id] = convert_cell_value(cell_value, field_type)
+                    except ValueError as e:
+                        errors.append(f"Sheet '{sheet_name}', ô {get_column_letter(col_idx)}{row_idx}: {e}")
+                        if len(errors) >= MAX_VALIDATION_ERRORS:
+                            raise ExcelValidationError(errors)
                 
-            row_data = {}
-            for idx, field_id in enumerate(field_ids):
-                # Excel data starts at column 2 (after STT column)
-                cell_value = row[idx+1] if idx+1 < len(row) else None
-                row_data[field_id] = str(cell_value) if cell_value is not None else ''
+                # Short rows leave the remaining fields empty
+                for field_id in field_ids[len(row):]:
+                    row_data[field_id] = ''
+                
+                sheet_data.append(row_data)
             
-            sheet_data.append(row_data)
-        
-        result[sheet_name] = sheet_data
+            result[sheet_name] = sheet_data
+    finally:
+        wb.close()
+    
+    if errors:
+        raise ExcelValidationError(errors)
     
     return result
 
-def create_excel_template(template_id):
+def get_cached_template(template_id, kind, build):
     """
-    Create an empty Excel template based on a report template.
+    Get blank template bytes from the template cache, building them on a miss.
     
     Args:
         template_id: The ID of the report template
+        kind: Name of the workbook layout, so different layouts of one template are cached apart
+        build: Function returning the workbook bytes
         
     Returns:
-        BytesIO object containing the Excel template
+        Bytes of the Excel template
     """
-    # Get the template sheet structure
-    sheet_structure = db.get_report_template_sheet_structure(template_id)
-    if not sheet_structure:
-        # Fallback to the old single-sheet structure
-        template = db.get_report_template(template_id)
-        if not template:
-            raise ValueError("Mẫu báo cáo không tồn tại")
-        
-        fields = json.loads(template['fields'])
-        sheet_structure = {
-            "Báo cáo": {
-                "fields": fields
-            }
-        }
-    else:
-        sheet_structure = json.loads(sheet_structure)
-    
-    # Create a new Excel workbook
-    wb = openpyxl.Workbook()
-    
-    # Remove the default sheet
-    default_sheet = wb.active
-    wb.remove(default_sheet)
-    
-    # Define styles
-    header_font = Font(bold=True, size=12)
-    header_fill = PatternFill(start_color="D9E1F2", end_color="D9E1F2", fill_type="solid")
-    border = Border(
-        left=Side(style='thin'), 
-        right=Side(style='thin'), 
-        top=Side(style='thin'), 
-        bottom=Side(style='thin')
-    )
-    
-    # Process each sheet in the structure
-    for sheet_name, sheet_config in sheet_structure.items():
-        # Create a new sheet
-        ws = wb.create_sheet(title=sheet_name)
-        
-        # Add headers
-        headers = ['STT'] + [field['label'] for field in sheet_config['fields']]
-        for col_idx, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_idx, value=header)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.border = border
-            cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-        
-        # Auto-adjust column widths based on header length
-        for col_idx, header in enumerate(headers, 1):
-            col_letter = get_column_letter(col_idx)
-            column_width = len(header) * 1.5  # Adjust multiplier as needed
-            ws.column_dimensions[col_letter].width = max(10, min(50, column_width))
-        
-        # Add a few empty rows
-        for row_idx in range(2, 12):
-            ws.cell(row=row_idx, column=1, value=row_idx-1).border = border  # STT column
-            
-            for col_idx, _ in enumerate(sheet_config['fields'], 2):
-                cell = ws.cell(row=row_idx, column=col_idx, value='')
-                cell.border = border
-    
-    # Save to BytesIO
-    excel_bytes = BytesIO()
-    wb.save(excel_bytes)
-    excel_bytes.seek(0)
-    
-    return excel_bytes
+    version = db.get_report_template_version(template_id)
+    if version is None:
+        raise ValueError("Mẫu báo cáo không tồn tại")
+    return template_cache.get_template_cache().get_or_create((template_id, version, kind), build)
 
-def save_to_sharepoint(excel_file, template_name, org_name):
+def create_excel_template(template_id):
     """
-    Simulate saving to SharePoint - in a real application this would use
-    SharePoint API to save the file to the configured location.
+    Create an empty Excel template based on a report template.
+    
+    The workbook is cached by template version (see template_cache).
     
     Args:
-        excel_file: The Excel file to save (BytesIO)
-        template_name: The name of the report template
-        org_name: The name of the organization
+        template_id: The ID of the report template
         
     Returns:
-        String URL where the file would be saved
+        BytesIO object containing the Excel template
     """
-    # Load SharePoint settings
-    settings_data = db.get_settings("sharepoint")
-    
-    if settings_data:
-        settings = json.loads(settings_data)
-        base_url = settings.get("sharepoint_url", "https://vinatex.sharepoint.com/sites/reports")
-        document_library = settings.get("document_library", "Documents/Reports")
-        use_org_folders = settings.get("use_org_folders", True)
-    else:
-        # Default settings
-        base_url = "https://vinatex.sharepoint.com/sites/reports"
-        document_library = "Documents/Reports"
-        use_org_folders = True
-    
-    # Format the filename
-    filename = f"{template_name}_{org_name}.xlsx".replace(" ", "_")
-    
-    # Generate the SharePoint URL
-    if use_org_folders:
-        folder_path = f"{org_name}"
-        sharepoint_url = f"{base_url}/{document_library}/{folder_path}/{filename}"
-    else:
-        sharepoint_url = f"{base_url}/{document_library}/{filename}"
+    return BytesIO(get_cached_template(
+        template_id, 'sheets', lambda: _build_excel_template(template_id).getvalue()
+    ))
+
+def _build_excel_template(template_id):
+    """Build the empty multi-sheet workbook for create_excel_template."""
+    sheet_structure = get_sheet_structure(template_id)
+    wb = create_streaming_workbook()
     
-    # In a real implementation, we would use SharePoint API to save the file
-    # For now, we just return the URL where it would be saved
+    # Each sheet gets a few empty, numbered rows
+    for sheet_name, sheet_config in sheet_structure.items():
+        blank_row = [''] * len(sheet_config['fields'])
+        rows = ([row_idx] + blank_row for row_idx in range(1, 11))
+        _write_template_sheet(wb, sheet_name, sheet_config['fields'], rows)
     
-    return sharepoint_url
\ No newline at end of file
+    return save_workbook(wb)
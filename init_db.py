@@ -4,6 +4,7 @@ import json
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 import random
 from datetime import datetime, timedelta
+import migrations
 
 # Database connection parameters
 database_url = os.getenv('DATABASE_URL')
@@ -11,66 +12,6 @@ database_url = os.getenv('DATABASE_URL')
 # SQL queries for database initialization
 CREATE_DB_QUERY = "CREATE DATABASE vinatex_reports;"
 
-# Tables creation SQL
-CREATE_TABLES_SQL = """
--- Organizations table
-CREATE TABLE IF NOT EXISTS organizations (
-    id SERIAL PRIMARY KEY,
-    name VARCHAR(255) NOT NULL,
-    type VARCHAR(50) NOT NULL,  -- 'unit', 'department', 'holding', etc.
-    parent_id INT,
-    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (parent_id) REFERENCES organizations(id) ON DELETE CASCADE
-);
-
--- Users table
-CREATE TABLE IF NOT EXISTS users (
-    id SERIAL PRIMARY KEY,
-    username VARCHAR(100) UNIQUE NOT NULL,
-    password VARCHAR(255) NOT NULL,
-    role VARCHAR(50) NOT NULL,  -- 'admin', 'department', 'unit'
-    organization_id INT,
-    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (organization_id) REFERENCES organizations(id) ON DELETE SET NULL
-);
-
--- Report Templates table
-CREATE TABLE IF NOT EXISTS report_templates (
-    id SERIAL PRIMARY KEY,
-    name VARCHAR(255) NOT NULL,
-    description TEXT,
-    fields TEXT NOT NULL,  -- JSON string of field names
-    department_id INT,
-    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (department_id) REFERENCES organizations(id) ON DELETE SET NULL
-);
-
--- Assigned Reports table
-CREATE TABLE IF NOT EXISTS assigned_reports (
-    id SERIAL PRIMARY KEY,
-    template_id INT NOT NULL,
-    organization_id INT NOT NULL,
-    due_date DATE NOT NULL,
-    status VARCHAR(50) NOT NULL,  -- 'pending', 'completed', 'overdue'
-    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (template_id) REFERENCES report_templates(id) ON DELETE CASCADE,
-    FOREIGN KEY (organization_id) REFERENCES organizations(id) ON DELETE CASCADE
-);
-
--- Report Submissions table
-CREATE TABLE IF NOT EXISTS report_submissions (
-    id SERIAL PRIMARY KEY,
-    assigned_report_id INT NOT NULL,
-    data TEXT NOT NULL,  -- JSON string of field values
-    submitted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (assigned_report_id) REFERENCES assigned_reports(id) ON DELETE CASCADE
-);
-"""
-
 # Sample data creation queries
 SAMPLE_ORGANIZATIONS_SQL = """
 -- Holding company
@@ -275,7 +216,7 @@ def create_sample_assigned_reports(cursor):
             
             # Get template fields
             cursor.execute("SELECT fields FROM report_templates WHERE id = %s", (template_id,))
-            fields = json.loads(cursor.fetchone()[0])
+            fields = cursor.fetchone()[0]
             
             # Create sample data for submission
             sample_data = {}
@@ -442,10 +383,9 @@ def initialize_database():
         conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
         cursor = conn.cursor()
 
-        # Create tables
-        print("Creating tables...")
-        cursor.execute(CREATE_TABLES_SQL)
-        conn.commit()
+        # Create or upgrade tables and indexes
+        print("Applying schema migrations...")
+        migrations.apply_migrations(conn)
 
         # Check if we already have data
         cursor.execute("SELECT COUNT(*) FROM organizations")
@@ -0,0 +1,636 @@
+"""
+Versioned schema migrations for the Vinatex Report Portal.
+
+Each migration runs once, in its own transaction, and is recorded in the
+schema_migrations table. Both setup scripts (init_db.py and setup_database.py)
+apply migrations through apply_migrations().
+
+    python migrations.py                 # apply pending migrations
+    python migrations.py --status        # list applied and pending migrations
+    python migrations.py --check-plans   # EXPLAIN the dashboard queries and check their indexes
+"""
+import os
+import argparse
+from datetime import date
+import psycopg2
+
+# Arbitrary key for the advisory lock that serializes concurrent migration runs
+MIGRATION_LOCK_ID = 720415
+
+# (version, description, sql) in the order they must be applied
+MIGRATIONS = [
+    (1, "Base schema", """
+    -- Organizations table
+    CREATE TABLE IF NOT EXISTS organizations (
+        id SERIAL PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        type VARCHAR(50) NOT NULL,  -- 'unit', 'department', 'holding', etc.
+        parent_id INT,
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (parent_id) REFERENCES organizations(id) ON DELETE CASCADE
+    );
+
+    -- Users table
+    CREATE TABLE IF NOT EXISTS users (
+        id SERIAL PRIMARY KEY,
+        username VARCHAR(100) UNIQUE NOT NULL,
+        password VARCHAR(255) NOT NULL,
+        role VARCHAR(50) NOT NULL,  -- 'admin', 'department', 'unit'
+        organization_id INT,
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (organization_id) REFERENCES organizations(id) ON DELETE SET NULL
+    );
+
+    -- Report Templates table
+    CREATE TABLE IF NOT EXISTS report_templates (
+        id SERIAL PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        description TEXT,
+        fields TEXT NOT NULL,  -- JSON string of field names
+        sheet_structure TEXT,  -- JSON string defining Excel sheet structure
+        department_id INT,
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (department_id) REFERENCES organizations(id) ON DELETE SET NULL
+    );
+
+    -- Assigned Reports table
+    CREATE TABLE IF NOT EXISTS assigned_reports (
+        id SERIAL PRIMARY KEY,
+        template_id INT NOT NULL,
+        organization_id INT NOT NULL,
+        due_date DATE NOT NULL,
+        status VARCHAR(50) NOT NULL,  -- 'pending', 'completed', 'overdue'
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (template_id) REFERENCES report_templates(id) ON DELETE CASCADE,
+        FOREIGN KEY (organization_id) REFERENCES organizations(id) ON DELETE CASCADE
+    );
+
+    -- Report Submissions table
+    CREATE TABLE IF NOT EXISTS report_submissions (
+        id SERIAL PRIMARY KEY,
+        assigned_report_id INT NOT NULL,
+        data TEXT NOT NULL,  -- JSON string of field values
+        sharepoint_url TEXT,  -- URL to the saved file in SharePoint
+        submitted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (assigned_report_id) REFERENCES assigned_reports(id) ON DELETE CASCADE
+    );
+
+    -- System Settings table
+    CREATE TABLE IF NOT EXISTS system_settings (
+        id SERIAL PRIMARY KEY,
+        type VARCHAR(50) NOT NULL,  -- 'email', 'sharepoint', 'notification', etc.
+        value TEXT NOT NULL,  -- JSON string of settings
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+
+    -- Background job runs table
+    CREATE TABLE IF NOT EXISTS job_runs (
+        id SERIAL PRIMARY KEY,
+        job_name VARCHAR(100) NOT NULL,
+        started_at TIMESTAMP NOT NULL,
+        duration_ms INT NOT NULL,
+        rows_affected INT NOT NULL DEFAULT 0,
+        error TEXT
+    );
+
+    -- Databases created by the old init_db.py lack these columns
+    ALTER TABLE report_templates ADD COLUMN IF NOT EXISTS sheet_structure TEXT;
+    ALTER TABLE report_submissions ADD COLUMN IF NOT EXISTS sharepoint_url TEXT;
+    """),
+
+    (2, "Indexes for dashboard and listing predicates", """
+    -- Unit dashboard counts and action list: organization_id = ? AND status ... ORDER BY due_date
+    CREATE INDEX IF NOT EXISTS idx_assigned_reports_org_status_due
+        ON assigned_reports (organization_id, status, due_date);
+
+    -- Unit listings and upcoming reports: organization_id = ? [AND due_date >= ?] ORDER BY due_date
+    CREATE INDEX IF NOT EXISTS idx_assigned_reports_org_due
+        ON assigned_reports (organization_id, due_date);
+
+    -- Admin due-date tabs and the overdue sweep: status = ? AND due_date ... ORDER BY due_date
+    CREATE INDEX IF NOT EXISTS idx_assigned_reports_status_due
+        ON assigned_reports (status, due_date, id);
+
+    -- Department dashboards join assigned_reports through template_id
+    CREATE INDEX IF NOT EXISTS idx_assigned_reports_template_status
+        ON assigned_reports (template_id, status);
+
+    -- Recent activity: ORDER BY updated_at DESC LIMIT 10
+    CREATE INDEX IF NOT EXISTS idx_assigned_reports_updated
+        ON assigned_reports (updated_at DESC);
+
+    -- Department dashboards: report_templates.department_id = ?
+    CREATE INDEX IF NOT EXISTS idx_report_templates_department
+        ON report_templates (department_id);
+
+    -- Latest submission per report: assigned_report_id = ? ORDER BY submitted_at DESC LIMIT 1
+    CREATE INDEX IF NOT EXISTS idx_report_submissions_report_submitted
+        ON report_submissions (assigned_report_id, submitted_at DESC);
+
+    -- Recent submissions: ORDER BY submitted_at DESC LIMIT 10
+    CREATE INDEX IF NOT EXISTS idx_report_submissions_submitted
+        ON report_submissions (submitted_at DESC);
+
+    -- Unit and department pickers: type = ? ORDER BY name; child lookups by parent_id
+    CREATE INDEX IF NOT EXISTS idx_organizations_type_name
+        ON organizations (type, name);
+    CREATE INDEX IF NOT EXISTS idx_organizations_parent
+        ON organizations (parent_id);
+
+    -- Job history: job_name = ? ORDER BY started_at DESC
+    CREATE INDEX IF NOT EXISTS idx_job_runs_name_started
+        ON job_runs (job_name, started_at DESC);
+    """),
+
+    (3, "Store submission data and template fields as JSONB", """
+    ALTER TABLE report_submissions
+        ALTER COLUMN data TYPE JSONB USING data::jsonb;
+    ALTER TABLE report_templates
+        ALTER COLUMN fields TYPE JSONB USING fields::jsonb;
+
+    -- JSONB does not keep object key order, so record each sheet's position
+    -- while converting (json_each still sees the keys in their written order)
+    ALTER TABLE report_templates ADD COLUMN sheet_structure_jsonb JSONB;
+    UPDATE report_templates
+    SET sheet_structure_jsonb = (
+        SELECT jsonb_object_agg(s.key, s.value::jsonb || jsonb_build_object('position', s.ord - 1))
+        FROM json_each(sheet_structure::json) WITH ORDINALITY AS s(key, value, ord)
+    )
+    WHERE sheet_structure IS NOT NULL AND sheet_structure <> '';
+    ALTER TABLE report_templates DROP COLUMN sheet_structure;
+    ALTER TABLE report_templates RENAME COLUMN sheet_structure_jsonb TO sheet_structure;
+
+    -- Containment queries (data @> '{...}') on submitted values
+    CREATE INDEX IF NOT EXISTS idx_report_submissions_data
+        ON report_submissions USING GIN (data jsonb_path_ops);
+
+    -- Key and containment lookups on template definitions
+    CREATE INDEX IF NOT EXISTS idx_report_templates_fields
+        ON report_templates USING GIN (fields);
+    CREATE INDEX IF NOT EXISTS idx_report_templates_sheet_structure
+        ON report_templates USING GIN (sheet_structure);
+    """),
+
+    (4, "Recurring assignment schedules", """
+    -- A template assigned to a set of units on a recurring due date
+    CREATE TABLE IF NOT EXISTS report_schedules (
+        id SERIAL PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        template_id INT NOT NULL,
+        frequency VARCHAR(20) NOT NULL,  -- 'monthly', 'quarterly', 'yearly', 'cron'
+        cron_expression VARCHAR(100),  -- day-of-month month day-of-week, for 'cron'
+        first_due_date DATE NOT NULL,
+        end_date DATE,
+        lead_days INT NOT NULL DEFAULT 31,  -- how far ahead reports are created
+        active BOOLEAN NOT NULL DEFAULT TRUE,
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (template_id) REFERENCES report_templates(id) ON DELETE CASCADE
+    );
+
+    CREATE TABLE IF NOT EXISTS report_schedule_units (
+        schedule_id INT NOT NULL,
+        organization_id INT NOT NULL,
+        PRIMARY KEY (schedule_id, organization_id),
+        FOREIGN KEY (schedule_id) REFERENCES report_schedules(id) ON DELETE CASCADE,
+        FOREIGN KEY (organization_id) REFERENCES organizations(id) ON DELETE CASCADE
+    );
+
+    -- Reports created by a schedule point back to it; the unique index lets the
+    -- materializer insert with ON CONFLICT DO NOTHING so reruns never duplicate rows
+    ALTER TABLE assigned_reports ADD COLUMN IF NOT EXISTS schedule_id INT
+        REFERENCES report_schedules(id) ON DELETE SET NULL;
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_assigned_reports_schedule_org_due
+        ON assigned_reports (schedule_id, organization_id, due_date);
+    """),
+
+    (5, "Indexes for keyset pagination of report listings", """
+    -- Paged listings: [organization_id = ? AND] (due_date, id) > (?, ?) ORDER BY due_date, id LIMIT ?
+    -- The id column makes the sort order total, so each page is one index range scan
+    CREATE INDEX IF NOT EXISTS idx_assigned_reports_due_id
+        ON assigned_reports (due_date, id);
+    CREATE INDEX IF NOT EXISTS idx_assigned_reports_org_due_id
+        ON assigned_reports (organization_id, due_date, id);
+    DROP INDEX IF EXISTS idx_assigned_reports_org_due;
+    """),
+
+    (6, "Maintained report counts per organization, month and status", """
+    -- Summary read by the admin progress chart; kept current by the triggers below
+    CREATE TABLE IF NOT EXISTS report_status_counts (
+        organization_id INT NOT NULL,
+        period DATE NOT NULL,  -- first day of the due date's month
+        status VARCHAR(50) NOT NULL,
+        count INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (organization_id, period, status),
+        FOREIGN KEY (organization_id) REFERENCES organizations(id) ON DELETE CASCADE
+    );
+
+    INSERT INTO report_status_counts (organization_id, period, status, count)
+    SELECT organization_id, date_trunc('month', due_date)::date, status, COUNT(*)
+    FROM assigned_reports
+    GROUP BY 1, 2, 3
+    ON CONFLICT (organization_id, period, status) DO UPDATE SET count = EXCLUDED.count;
+
+    -- Statement-level triggers see all changed rows at once through transition
+    -- tables, so a bulk assignment updates each summary row once, not per report
+    CREATE OR REPLACE FUNCTION apply_report_status_counts() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO report_status_counts (organization_id, period, status, count)
+            SELECT organization_id, date_trunc('month', due_date)::date, status, COUNT(*)
+            FROM new_reports
+            GROUP BY 1, 2, 3
+            ON CONFLICT (organization_id, period, status)
+            DO UPDATE SET count = report_status_counts.count + EXCLUDED.count;
+        END IF;
+
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE report_status_counts c
+            SET count = c.count - d.count
+            FROM (
+                SELECT organization_id, date_trunc('month', due_date)::date AS period, status, COUNT(*) AS count
+                FROM old_reports
+                GROUP BY 1, 2, 3
+            ) d
+            WHERE c.organization_id = d.organization_id
+              AND c.period = d.period
+              AND c.status = d.status;
+        END IF;
+
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION clear_report_status_counts() RETURNS trigger AS $$
+    BEGIN
+        DELETE FROM report_status_counts;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS report_status_counts_insert ON assigned_reports;
+    CREATE TRIGGER report_status_counts_insert
+        AFTER INSERT ON assigned_reports
+        REFERENCING NEW TABLE AS new_reports
+        FOR EACH STATEMENT EXECUTE FUNCTION apply_report_status_counts();
+
+    DROP TRIGGER IF EXISTS report_status_counts_update ON assigned_reports;
+    CREATE TRIGGER report_status_counts_update
+        AFTER UPDATE ON assigned_reports
+        REFERENCING OLD TABLE AS old_reports NEW TABLE AS new_reports
+        FOR EACH STATEMENT EXECUTE FUNCTION apply_report_status_counts();
+
+    DROP TRIGGER IF EXISTS report_status_counts_delete ON assigned_reports;
+    CREATE TRIGGER report_status_counts_delete
+        AFTER DELETE ON assigned_reports
+        REFERENCING OLD TABLE AS old_reports
+        FOR EACH STATEMENT EXECUTE FUNCTION apply_report_status_counts();
+
+    DROP TRIGGER IF EXISTS report_status_counts_truncate ON assigned_reports;
+    CREATE TRIGGER report_status_counts_truncate
+        AFTER TRUNCATE ON assigned_reports
+        FOR EACH STATEMENT EXECUTE FUNCTION clear_report_status_counts();
+    """),
+
+    (7, "Durable queue of SharePoint uploads", """
+    -- One row per submission workbook to upload. Workers claim due rows with
+    -- FOR UPDATE SKIP LOCKED; a claim pushes next_attempt_at out by the lease,
+    -- so the upload of a worker that died is picked up again once it expires
+    CREATE TABLE IF NOT EXISTS sharepoint_uploads (
+        id SERIAL PRIMARY KEY,
+        submission_id INT NOT NULL,
+        status VARCHAR(20) NOT NULL DEFAULT 'pending',  -- 'pending', 'uploading', 'done', 'failed'
+        attempts INT NOT NULL DEFAULT 0,
+        next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        url TEXT,
+        last_error TEXT,
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (submission_id) REFERENCES report_submissions(id) ON DELETE CASCADE
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_sharepoint_uploads_due
+        ON sharepoint_uploads (next_attempt_at) WHERE status IN ('pending', 'uploading');
+    CREATE INDEX IF NOT EXISTS idx_sharepoint_uploads_submission
+        ON sharepoint_uploads (submission_id);
+    """),
+
+    (8, "Closure table of the organization hierarchy", """
+    -- One row per (ancestor, descendant) pair, including each organization
+    -- paired with itself at depth 0, so subtree and ancestor lookups are
+    -- single index range scans instead of recursive queries
+    CREATE TABLE IF NOT EXISTS organization_closure (
+        ancestor_id INT NOT NULL,
+        descendant_id INT NOT NULL,
+        depth INT NOT NULL,
+        PRIMARY KEY (ancestor_id, descendant_id),
+        FOREIGN KEY (ancestor_id) REFERENCES organizations(id) ON DELETE CASCADE,
+        FOREIGN KEY (descendant_id) REFERENCES organizations(id) ON DELETE CASCADE
+    );
+    CREATE INDEX IF NOT EXISTS idx_organization_closure_descendant
+        ON organization_closure (descendant_id, depth);
+
+    INSERT INTO organization_closure (ancestor_id, descendant_id, depth)
+    WITH RECURSIVE paths AS (
+        SELECT id AS ancestor_id, id AS descendant_id, 0 AS depth FROM organizations
+        UNION ALL
+        SELECT p.ancestor_id, o.id, p.depth + 1
+        FROM paths p
+        JOIN organizations o ON o.parent_id = p.descendant_id
+        WHERE p.depth < 100  -- stops at any cycle already in the data
+    )
+    SELECT ancestor_id, descendant_id, MIN(depth) FROM paths GROUP BY 1, 2
+    ON CONFLICT (ancestor_id, descendant_id) DO NOTHING;
+
+    -- A new organization inherits its parent's ancestors
+    CREATE OR REPLACE FUNCTION add_organization_closure() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO organization_closure (ancestor_id, descendant_id, depth)
+        SELECT NEW.id, NEW.id, 0
+        UNION ALL
+        SELECT ancestor_id, NEW.id, depth + 1
+        FROM organization_closure
+        WHERE descendant_id = NEW.parent_id;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    -- Reject a parent that lies inside the organization's own subtree; with
+    -- the closure table this is one primary key lookup
+    CREATE OR REPLACE FUNCTION check_organization_parent() RETURNS trigger AS $$
+    BEGIN
+        IF NEW.parent_id IS NOT NULL AND EXISTS (
+            SELECT 1 FROM organization_closure
+            WHERE ancestor_id = NEW.id AND descendant_id = NEW.parent_id
+        ) THEN
+            RAISE EXCEPTION 'Organization % cannot be placed under its own descendant %', NEW.id, NEW.parent_id;
+        END IF;
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    -- Moving an organization moves its whole subtree: drop the paths from its
+    -- old ancestors into the subtree, then link the new ancestors to it
+    CREATE OR REPLACE FUNCTION move_organization_closure() RETURNS trigger AS $$
+    BEGIN
+        DELETE FROM organization_closure c
+        USING organization_closure subtree, organization_closure above
+        WHERE subtree.ancestor_id = NEW.id
+          AND above.descendant_id = NEW.id AND above.depth > 0
+          AND c.ancestor_id = above.ancestor_id
+          AND c.descendant_id = subtree.descendant_id;
+
+        INSERT INTO organization_closure (ancestor_id, descendant_id, depth)
+        SELECT above.ancestor_id, subtree.descendant_id, above.depth + subtree.depth + 1
+        FROM organization_closure above, organization_closure subtree
+        WHERE above.descendant_id = NEW.parent_id
+          AND subtree.ancestor_id = NEW.id;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS organization_closure_insert ON organizations;
+    CREATE TRIGGER organization_closure_insert
+        AFTER INSERT ON organizations
+        FOR EACH ROW EXECUTE FUNCTION add_organization_closure();
+
+    DROP TRIGGER IF EXISTS organization_parent_check ON organizations;
+    CREATE TRIGGER organization_parent_check
+        BEFORE UPDATE OF parent_id ON organizations
+        FOR EACH ROW WHEN (NEW.parent_id IS DISTINCT FROM OLD.parent_id)
+        EXECUTE FUNCTION check_organization_parent();
+
+    DROP TRIGGER IF EXISTS organization_closure_move ON organizations;
+    CREATE TRIGGER organization_closure_move
+        AFTER UPDATE OF parent_id ON organizations
+        FOR EACH ROW WHEN (NEW.parent_id IS DISTINCT FROM OLD.parent_id)
+        EXECUTE FUNCTION move_organization_closure();
+    """),
+
+    (9, "Revoked session tokens", """
+    -- Signed session tokens are checked without the database; this small table
+    -- lists the ones revoked before they expire. A row without token_id revokes
+    -- every token of the user issued up to revoked_at. Rows are purged once the
+    -- tokens they cover have expired.
+    CREATE TABLE IF NOT EXISTS revoked_sessions (
+        id SERIAL PRIMARY KEY,
+        token_id VARCHAR(64),
+        user_id INT NOT NULL,
+        revoked_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        expires_at TIMESTAMPTZ NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_revoked_sessions_expires
+        ON revoked_sessions (expires_at);
+    """),
+
+    (10, "Unique setting types and change notifications", """
+    -- Older versions could insert a setting type twice; keep the newest row
+    DELETE FROM system_settings s
+    USING system_settings newer
+    WHERE newer.type = s.type
+      AND (newer.updated_at, newer.id) > (s.updated_at, s.id);
+
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_system_settings_type
+        ON system_settings (type);
+
+    -- Every server process caches the settings until it is told they changed
+    CREATE OR REPLACE FUNCTION notify_system_settings() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('system_settings', CASE WHEN TG_OP = 'DELETE' THEN OLD.type ELSE NEW.type END);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS system_settings_notify ON system_settings;
+    CREATE TRIGGER system_settings_notify
+        AFTER INSERT OR UPDATE OR DELETE ON system_settings
+        FOR EACH ROW EXECUTE FUNCTION notify_system_settings();
+    """),
+]
+
+# Dashboard queries from database.py and the index(es) each one may use:
+# (name, call on the database module, acceptable indexes). The SQL checked is
+# captured from the call itself, so it is always the query the app runs.
+# Cached readers are called through __wrapped__ so the cache is bypassed.
+PLAN_CHECKS = [
+    ("get_unit_dashboard_stats", lambda db: db.get_unit_dashboard_stats(1),
+     ("idx_assigned_reports_org_status_due", "idx_assigned_reports_org_due_id")),
+
+    ("get_unit_action_needed_reports", lambda db: db.get_unit_action_needed_reports(1),
+     ("idx_assigned_reports_org_status_due", "idx_assigned_reports_org_due_id")),
+
+    ("get_unit_upcoming_reports", lambda db: db.get_unit_upcoming_reports(1),
+     ("idx_assigned_reports_org_due_id",)),
+
+    ("get_assigned_reports(status, due_from)",
+     lambda db: db.get_assigned_reports(status='pending', due_from=date.today(), limit=101),
+     ("idx_assigned_reports_status_due",)),
+
+    ("get_assigned_reports(page)",
+     lambda db: db.get_assigned_reports(limit=51, after=(date.today(), 0)),
+     ("idx_assigned_reports_due_id",)),
+
+    ("get_organization_assigned_reports(page)",
+     lambda db: db.get_organization_assigned_reports(1, limit=51, after=(date.today(), 0)),
+     ("idx_assigned_reports_org_due_id",)),
+
+    ("mark_overdue_reports", lambda db: db.mark_overdue_reports(),
+     ("idx_assigned_reports_status_due",)),
+
+    ("get_department_dashboard_stats", lambda db: db.get_department_dashboard_stats(1),
+     ("idx_report_templates_department",)),
+
+    ("get_report_submission", lambda db: db.get_report_submission(1),
+     ("idx_report_submissions_report_submitted",)),
+
+    ("get_recent_activity", lambda db: db.get_recent_activity(),
+     ("idx_assigned_reports_updated",)),
+
+    ("find_submissions", lambda db: db.find_submissions({"Revenue (VND)": "0"}),
+     ("idx_report_submissions_data",)),
+
+    ("get_organization_reports_with_submissions",
+     lambda db: db.get_organization_reports_with_submissions(1, limit=51),
+     ("idx_report_submissions_report_submitted",)),
+
+    ("get_units_under", lambda db: db.get_units_under.__wrapped__(1),
+     ("organization_closure_pkey",)),
+
+    ("get_organization_ancestors", lambda db: db.get_organization_ancestors.__wrapped__(1),
+     ("idx_organization_closure_descendant",)),
+
+    ("get_organization_units", lambda db: db.get_organization_units.__wrapped__(),
+     ("idx_organizations_type_name",)),
+]
+
+def get_applied_versions(cursor):
+    """Return the set of migration versions already applied."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+def apply_migrations(conn, verbose=True):
+    """Apply every pending migration on `conn` and return the versions applied."""
+    previous_autocommit = conn.autocommit
+    conn.autocommit = False
+    applied = []
+
+    try:
+        with conn.cursor() as cursor:
+            # Hold a session-level lock so two processes never migrate at once
+            cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+            try:
+                applied_versions = get_applied_versions(cursor)
+                conn.commit()
+
+                for version, description, sql in MIGRATIONS:
+                    if version in applied_versions:
+                        continue
+                    if verbose:
+                        print(f"Applying migration {version}: {description}")
+                    try:
+                        cursor.execute(sql)
+                        cursor.execute(
+                            "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                            (version, description)
+                        )
+                        conn.commit()
+                    except Exception:
+                        conn.rollback()
+                        raise
+                    applied.append(version)
+            finally:
+                conn.rollback()
+                cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+                conn.commit()
+    finally:
+        conn.autocommit = previous_autocommit
+
+    return applied
+
+def get_migration_status(conn):
+    """Return (version, description, applied) for every known migration."""
+    with conn.cursor() as cursor:
+        applied_versions = get_applied_versions(cursor)
+    conn.commit()
+    return [(version, description, version in applied_versions) for version, description, _ in MIGRATIONS]
+
+def _plan_index_names(plan):
+    """Collect every index name used anywhere in an EXPLAIN (FORMAT JSON) plan tree."""
+    names = set()
+    if 'Index Name' in plan:
+        names.add(plan['Index Name'])
+    for child in plan.get('Plans', []):
+        names |= _plan_index_names(child)
+    return names
+
+def check_query_plans(conn):
+    """EXPLAIN each dashboard query and report whether it uses one of its expected indexes.
+
+    Sequential scans are disabled for the check so that small development
+    databases, where the planner would rightly prefer a seq scan, still show
+    whether an index is usable for the predicate. Returns a list of
+    (name, expected_indexes, used_indexes, ok) tuples.
+    """
+    import database
+
+    results = []
+    with conn.cursor() as cursor:
+        for name, call, expected_indexes in PLAN_CHECKS:
+            with database.capture_queries() as queries:
+                call(database)
+            used = set()
+            for sql, params in queries:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+                used |= _plan_index_names(cursor.fetchone()[0][0]['Plan'])
+                conn.rollback()
+            results.append((name, expected_indexes, sorted(used), bool(used & set(expected_indexes))))
+    return results
+
+def get_connection_params():
+    """Connection parameters for the CLI: DATABASE_URL if set, else database.db_params."""
+    database_url = os.getenv('DATABASE_URL')
+    if database_url:
+        return {'dsn': database_url}
+
+    import database
+    return dict(database.db_params)
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply and inspect schema migrations")
+    parser.add_argument("--status", action="store_true", help="list applied and pending migrations")
+    parser.add_argument("--check-plans", action="store_true", help="check that dashboard queries use their indexes")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**get_connection_params())
+    try:
+        if args.status:
+            for version, description, applied in get_migration_status(conn):
+                print(f"{version:>4}  {'applied' if applied else 'pending':<8} {description}")
+        elif args.check_plans:
+            failures = 0
+            for name, expected_indexes, used, ok in check_query_plans(conn):
+                failures += 0 if ok else 1
+                print(f"{'OK  ' if ok else 'FAIL'} {name}: expected {' or '.join(expected_indexes)}, "
+                      f"used {', '.join(used) or 'no index'}")
+            raise SystemExit(1 if failures else 0)
+        else:
+            applied = apply_migrations(conn)
+            print(f"Applied {len(applied)} migration(s)" if applied else "Database schema is up to date")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -20,13 +20,8 @@ def manage_organizations():
         if organizations_df is not None and not organizations_df.empty:
             # Create a parent name column for better display
             orgs_with_parent = organizations_df.copy()
-            orgs_with_parent['parent_name'] = None
-            
-            for idx, row in orgs_with_parent.iterrows():
-                if row['parent_id'] is not None:
-                    parent_row = orgs_with_parent[orgs_with_parent['id'] == row['parent_id']]
-                    if not parent_row.empty:
-                        orgs_with_parent.at[idx, 'parent_name'] = parent_row.iloc[0]['name']
+            org_names = dict(zip(organizations_df['id'], organizations_df['name']))
+            orgs_with_parent['parent_name'] = orgs_with_parent['parent_id'].map(org_names)
             
             # Display the organizations
             st.dataframe(orgs_with_parent[['id', 'name', 'type', 'parent_name']], use_container_width=True)
@@ -98,16 +93,18 @@ def manage_organizations():
             # Parent organization selection
             parent_options = [None]  # None means no parent
             if organizations_df is not None and not organizations_df.empty:
-                # Filter out the current org (for edit mode) and potential circular references
+                # Filter out the current org (for edit mode) and everything below it,
+                # which would create a circular reference
                 filtered_orgs = organizations_df
                 if edit_mode:
-                    filtered_orgs = organizations_df[organizations_df['id'] != org_id]
+                    subtree = db.get_organization_subtree(int(org_id))
+                    subtree_ids = subtree['id'].tolist() if subtree is not None else [org_id]
+                    filtered_orgs = organizations_df[~organizations_df['id'].isin(subtree_ids)]
                 
                 parent_options.extend(filtered_orgs['id'].tolist())
                 
                 parent_name_map = {None: "None (Top Level)"}
-                for _, org in filtered_orgs.iterrows():
-                    parent_name_map[org['id']] = org['name']
+                parent_name_map.update(zip(filtered_orgs['id'], filtered_orgs['name']))
                 
                 parent_id = st.selectbox(
                     "Parent Organization",
@@ -0,0 +1,205 @@
+"""
+Password hashing for user accounts.
+
+Passwords are stored as salted scrypt hashes encoded as
+
+    scrypt$<n>$<r>$<p>$<salt>$<hash>        (salt and hash in base64)
+
+The cost is set by PASSWORD_SCRYPT_N/R/P. A stored hash made with other
+parameters, or a password still stored in plain text by older versions, is
+reported as needing a rehash so database.validate_user can upgrade it on the
+next successful login.
+
+scrypt releases the GIL, so hashing runs on a small worker pool
+(PASSWORD_WORKERS threads) that also bounds the memory used by concurrent
+logins. Successful checks are remembered for PASSWORD_CACHE_TTL seconds, keyed
+by a keyed hash of the credentials, so reruns that re-check the same password
+do not pay the KDF cost again.
+
+    python passwords.py --benchmark 8    # login latency with 8 concurrent logins
+    python passwords.py --rehash-all     # hash every plain-text password now
+"""
+import os
+import hmac
+import time
+import base64
+import hashlib
+import secrets
+import argparse
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st
+
+# Hashing cost (override with environment variables); memory use is 128 * n * r bytes
+PASSWORD_SCRYPT_N = int(os.getenv('PASSWORD_SCRYPT_N', str(2 ** 14)))
+PASSWORD_SCRYPT_R = int(os.getenv('PASSWORD_SCRYPT_R', '8'))
+PASSWORD_SCRYPT_P = int(os.getenv('PASSWORD_SCRYPT_P', '1'))
+
+# Threads hashing passwords at once
+PASSWORD_WORKERS = int(os.getenv('PASSWORD_WORKERS', '4'))
+
+# Seconds a verified password is remembered; 0 disables the cache
+PASSWORD_CACHE_TTL = float(os.getenv('PASSWORD_CACHE_TTL', '300'))
+PASSWORD_CACHE_SIZE = 1024
+
+SALT_BYTES = 16
+HASH_BYTES = 32
+PREFIX = 'scrypt'
+
+def _b64encode(data):
+    return base64.b64encode(data).decode('ascii')
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(
+        password.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+        maxmem=256 * n * r * p, dklen=HASH_BYTES
+    )
+
+def hash_password(password):
+    """Hash a password with a random salt and the configured cost."""
+    salt = secrets.token_bytes(SALT_BYTES)
+    digest = _scrypt(password, salt, PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P)
+    return '$'.join([
+        PREFIX, str(PASSWORD_SCRYPT_N), str(PASSWORD_SCRYPT_R), str(PASSWORD_SCRYPT_P),
+        _b64encode(salt), _b64encode(digest)
+    ])
+
+def is_hashed(stored):
+    """Return True if a stored password is a hash rather than plain text."""
+    return stored.startswith(PREFIX + '$')
+
+def needs_rehash(stored):
+    """Return True if a stored password is plain text or hashed with other parameters."""
+    if not is_hashed(stored):
+        return True
+    _, n, r, p, _, _ = stored.split('$')
+    return (int(n), int(r), int(p)) != (PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P)
+
+def check_password(password, stored):
+    """Check a password against a stored hash (or a legacy plain-text password)."""
+    if not is_hashed(stored):
+        return hmac.compare_digest(password.encode('utf-8'), stored.encode('utf-8'))
+    try:
+        _, n, r, p, salt, digest = stored.split('$')
+        expected = base64.b64decode(digest)
+        actual = _scrypt(password, base64.b64decode(salt), int(n), int(r), int(p))
+    except ValueError:
+        return False
+    return hmac.compare_digest(actual, expected)
+
+class PasswordHasher:
+    """Runs password checks on a bounded thread pool and remembers recent successes."""
+
+    def __init__(self, workers, cache_ttl, cache_size=PASSWORD_CACHE_SIZE):
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password")
+        # Cache keys are keyed hashes, so the cache never holds anything that
+        # can be attacked offline without this process's secret
+        self._key = secrets.token_bytes(32)
+        self._verified = OrderedDict()
+        self._lock = threading.Lock()
+        # Checked when the username does not exist, so the response time does not reveal it
+        self._dummy_hash = hash_password(secrets.token_urlsafe(16))
+
+    def _cache_key(self, password, stored):
+        return hmac.new(self._key, f"{stored}\0{password}".encode('utf-8'), hashlib.sha256).digest()
+
+    def verify(self, password, stored):
+        """Check a password on a worker thread; pass stored=None for an unknown user."""
+        if stored is None:
+            self._executor.submit(check_password, password, self._dummy_hash).result()
+            return False
+
+        key = self._cache_key(password, stored) if self.cache_ttl > 0 else None
+        if key is not None:
+            with self._lock:
+                expires_at = self._verified.get(key)
+                if expires_at is not None and expires_at > time.monotonic():
+                    return True
+
+        ok = self._executor.submit(check_password, password, stored).result()
+        if ok:
+            self._remember(password, stored)
+        return ok
+
+    def hash(self, password):
+        """Hash a password on a worker thread."""
+        stored = self._executor.submit(hash_password, password).result()
+        # The next check of a password that was just (re)hashed is free
+        self._remember(password, stored)
+        return stored
+
+    def _remember(self, password, stored):
+        if self.cache_ttl <= 0:
+            return
+        with self._lock:
+            key = self._cache_key(password, stored)
+            self._verified[key] = time.monotonic() + self.cache_ttl
+            self._verified.move_to_end(key)
+            while len(self._verified) > self.cache_size:
+                self._verified.popitem(last=False)
+
+@st.cache_resource
+def get_password_hasher():
+    """Create the process-wide password hasher and return it."""
+    return PasswordHasher(PASSWORD_WORKERS, PASSWORD_CACHE_TTL)
+
+def benchmark(concurrency, logins_per_client=5):
+    """
+    Measure login latency with `concurrency` clients logging in at the same time.
+
+    Uses an uncached hasher so every login pays the full KDF cost.
+
+    Returns:
+        Dictionary with the cost parameters, per-login p50/p95/max in ms and
+        logins per second
+    """
+    hasher = PasswordHasher(PASSWORD_WORKERS, cache_ttl=0)
+    stored = hash_password("benchmark-password")
+    latencies = []
+    lock = threading.Lock()
+
+    def client():
+        for _ in range(logins_per_client):
+            start = time.perf_counter()
+            hasher.verify("benchmark-password", stored)
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'n': PASSWORD_SCRYPT_N, 'r': PASSWORD_SCRYPT_R, 'p': PASSWORD_SCRYPT_P,
+        'workers': PASSWORD_WORKERS, 'concurrency': concurrency,
+        'p50_ms': round(latencies[len(latencies) // 2], 1),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1], 1),
+        'max_ms': round(latencies[-1], 1),
+        'logins_per_second': round(len(latencies) / elapsed, 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Password hashing tools")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="measure login latency with N concurrent logins")
+    parser.add_argument("--rehash-all", action="store_true", help="hash every plain-text password in the users table")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        for name, value in benchmark(args.benchmark).items():
+            print(f"{name:>18}: {value}")
+    elif args.rehash_all:
+        import database as db
+        print(f"Hashed {db.hash_plaintext_passwords()} plain-text passwords")
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Batch export of every submission due in a period.
+
+At quarter close every unit's submission for every template is needed at once.
+All rows come from one query; workbooks are built in a pool of worker processes
+(EXPORT_WORKERS, default one per core) and written into a ZIP archive as they
+finish, so memory holds only the workbooks in flight. The same selection can
+instead be queued for SharePoint through upload_queue.
+
+    python period_export.py 2025-01-01 2025-03-31 q1.zip [--department ID] [--template ID]
+"""
+import io
+import os
+import logging
+import argparse
+import zipfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+import streamlit as st
+import database as db
+import excel_utils
+import utils
+from consolidation import get_quarter_range
+
+logger = logging.getLogger(__name__)
+
+# Worker processes for building workbooks (override with environment variables)
+EXPORT_WORKERS = int(os.getenv('EXPORT_WORKERS', str(os.cpu_count() or 1)))
+
+# A worker process takes about a second to start and a simple workbook a few
+# milliseconds to build, so smaller exports are built in this process
+EXPORT_PARALLEL_MIN = int(os.getenv('EXPORT_PARALLEL_MIN', '200'))
+
+# Workbooks handed to a worker process per round trip
+EXPORT_CHUNK_SIZE = 8
+
+def _build_workbook(task):
+    """Build one workbook in a worker process and return (archive name, bytes, error).
+
+    A submission that cannot be exported returns bytes None and the error
+    message, so it does not fail the rest of the batch.
+    """
+    name, sheet_structure, data = task
+    try:
+        return name, excel_utils.build_submission_workbook(sheet_structure, data).getvalue(), None
+    except Exception as e:
+        return name, None, str(e) or type(e).__name__
+
+def _archive_name(submission):
+    """Return a submission's path inside the archive: <template>/<unit>_<due date>_<report id>.xlsx."""
+    return (
+        f"{utils.safe_filename(submission['template_name'])}/"
+        f"{utils.safe_filename(submission['organization_name'])}_{submission['due_date']}_"
+        f"{submission['assigned_report_id']}.xlsx"
+    )
+
+def export_period(output, due_from, due_to, department_id=None, template_id=None,
+                  progress=None, workers=EXPORT_WORKERS):
+    """
+    Write the latest submission of every report due in a period to a ZIP archive.
+
+    Args:
+        output: Binary file object (or path) the archive is written to
+        due_from: First due date of the period
+        due_to: Last due date of the period
+        department_id: Only export templates owned by this department
+        template_id: Only export this template
+        progress: Optional callback called with (done, total) after each workbook
+        workers: Number of worker processes; 1 builds everything in this process
+
+    Returns:
+        Tuple of (number of workbooks written, archive names of the
+        submissions skipped because their data cannot be exported)
+    """
+    submissions = db.get_period_submissions(due_from, due_to, department_id, template_id)
+    if submissions is None:
+        raise RuntimeError("Không thể tải danh sách báo cáo")
+    submissions = submissions.to_dict('records')
+
+    # One sheet structure per template; the workers never query the database
+    sheet_structures = {
+        template: excel_utils.get_sheet_structure(template)
+        for template in {int(submission['template_id']) for submission in submissions}
+    }
+    tasks = []
+    skipped = []
+    for submission in submissions:
+        name = _archive_name(submission)
+        try:
+            data = excel_utils.normalize_submission_data(submission['data'])
+        except ValueError as e:
+            logger.warning("Skipping submission %s (%s): %s", submission['submission_id'], name, e)
+            skipped.append(name)
+            continue
+        tasks.append((name, sheet_structures[int(submission['template_id'])], data))
+    total = len(tasks)
+
+    # Workbooks are already compressed, so they are stored as they are
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_STORED) as archive:
+        if workers > 1 and total >= EXPORT_PARALLEL_MIN:
+            # Spawned workers do not inherit the server's threads and open connections
+            with ProcessPoolExecutor(
+                max_workers=min(workers, total), mp_context=multiprocessing.get_context('spawn')
+            ) as executor:
+                workbooks = executor.map(_build_workbook, tasks, chunksize=EXPORT_CHUNK_SIZE)
+                written = _write_workbooks(archive, workbooks, total, progress, skipped)
+        else:
+            written = _write_workbooks(archive, map(_build_workbook, tasks), total, progress, skipped)
+
+    return written, skipped
+
+def _write_workbooks(archive, workbooks, total, progress, skipped):
+    """Add workbooks to the archive as they arrive, reporting progress; return the number written.
+
+    The names of workbooks that failed to build are appended to `skipped`.
+    """
+    written = 0
+    for done, (name, data, error) in enumerate(workbooks, 1):
+        if error is None:
+            archive.writestr(name, data)
+            written += 1
+        else:
+            logger.warning("Skipping %s: %s", name, error)
+            skipped.append(name)
+        if progress:
+            progress(done, total)
+    return written
+
+def period_export_page():
+    """Export or upload every submission of a period (Admin and Department roles)."""
+    if st.session_state.user_role not in ["admin", "department"]:
+        st.error("You don't have permission to access this page")
+        return
+
+    st.title("🗂️ Xuất báo cáo theo kỳ")
+
+    default_from, default_to = get_quarter_range(datetime.now().date())
+    col1, col2 = st.columns(2)
+    with col1:
+        due_from = st.date_input("Hạn nộp từ ngày", value=default_from)
+    with col2:
+        due_to = st.date_input("Đến ngày", value=default_to)
+
+    templates_df = db.get_report_templates()
+    if templates_df is None:
+        return
+
+    department_id = None
+    if st.session_state.user_role == "department":
+        department_id = st.session_state.user_org_id
+        templates_df = templates_df[templates_df['department_id'] == department_id]
+    else:
+        departments = db.get_organization_departments()
+        if departments is not None and not departments.empty:
+            department_id = st.selectbox(
+                "Phòng ban",
+                options=[None] + departments['id'].tolist(),
+                format_func=lambda x: "Tất cả" if x is None else departments.loc[departments['id'] == x, 'name'].iloc[0]
+            )
+            if department_id is not None:
+                templates_df = templates_df[templates_df['department_id'] == department_id]
+
+    template_id = st.selectbox(
+        "Mẫu báo cáo",
+        options=[None] + templates_df['id'].tolist(),
+        format_func=lambda x: "Tất cả" if x is None else templates_df.loc[templates_df['id'] == x, 'name'].iloc[0]
+    )
+
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("Tạo tệp ZIP"):
+            progress_bar = st.progress(0.0, text="Đang tạo tệp Excel...")
+
+            def show_progress(done, total):
+                progress_bar.progress(done / total, text=f"Đã tạo {done}/{total} tệp Excel")
+
+            archive = io.BytesIO()
+            count, skipped = export_period(archive, due_from, due_to, department_id, template_id, show_progress)
+            if skipped:
+                st.warning(
+                    f"{len(skipped)} báo cáo có dữ liệu không hợp lệ nên không có trong tệp ZIP:\n\n"
+                    + "\n".join(f"- {name}" for name in skipped)
+                )
+            if count == 0:
+                progress_bar.empty()
+                if not skipped:
+                    st.info("Không có báo cáo đã nộp trong kỳ này.")
+            else:
+                st.download_button(
+                    label=f"Tải xuống {count} báo cáo",
+                    data=archive.getvalue(),
+                    file_name=f"bao_cao_{due_from}_{due_to}.zip",
+                    mime="application/zip"
+                )
+    with col2:
+        if st.button("Tải lên SharePoint"):
+            count = db.queue_period_uploads(due_from, due_to, department_id, template_id)
+            if count is not None:
+                st.success(f"Đã đưa {count} báo cáo vào hàng đợi tải lên SharePoint.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Export every submission due in a period to a ZIP archive")
+    parser.add_argument("due_from", type=date.fromisoformat, help="first due date (YYYY-MM-DD)")
+    parser.add_argument("due_to", type=date.fromisoformat, help="last due date (YYYY-MM-DD)")
+    parser.add_argument("output", help="path of the ZIP archive to write")
+    parser.add_argument("--department", type=int, help="only templates owned by this department")
+    parser.add_argument("--template", type=int, help="only this template")
+    parser.add_argument("--workers", type=int, default=EXPORT_WORKERS, help="worker processes")
+    args = parser.parse_args()
+
+    def show_progress(done, total):
+        print(f"\r{done}/{total}", end="", flush=True)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    count, skipped = export_period(
+        args.output, args.due_from, args.due_to, args.department, args.template,
+        progress=show_progress, workers=args.workers
+    )
+    print(f"\nExported {count} submissions to {args.output}")
+    if skipped:
+        print(f"Skipped {len(skipped)} submissions with invalid data (see the log above)")
+
+if __name__ == "__main__":
+    main()
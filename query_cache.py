@@ -0,0 +1,140 @@
+"""
+In-process cache for read-mostly database queries.
+
+Readers in database.py that every page rerun repeats (organizations, templates)
+are wrapped with @cached. Results are kept for QUERY_CACHE_TTL seconds
+in a size-bounded LRU shared by all sessions of the server process, and each
+write function calls invalidate() for exactly the readers and arguments it
+changes, or invalidate_tag() for readers declared with that tag (readers
+outside database.py, such as rollup.value_rollup). Every invalidation bumps the
+reader's generation, and a result loaded across an invalidation is not stored.
+The TTL bounds staleness for writes made by other processes.
+"""
+import os
+import copy
+import time
+import threading
+import functools
+from collections import OrderedDict
+import pandas as pd
+import streamlit as st
+
+# Cache limits (override with environment variables)
+QUERY_CACHE_TTL = float(os.getenv('QUERY_CACHE_TTL', '300'))
+QUERY_CACHE_SIZE = int(os.getenv('QUERY_CACHE_SIZE', '256'))
+
+class QueryCache:
+    """Thread-safe LRU of query results that expire after a TTL."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return (True, value) for a live entry, or (False, None) on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def generation(self, name):
+        """Return the number of invalidations of `name` so far."""
+        with self._lock:
+            return self._generations.get(name, 0)
+
+    def set(self, key, value, ttl=None, generation=None):
+        """Store a value, evicting the least recently used entries over the size limit.
+
+        With `generation` (taken before the value was loaded) nothing is stored
+        if the reader was invalidated meanwhile, since the value may be stale.
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if generation is not None and self._generations.get(key[0], 0) != generation:
+                return
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, name, args=None):
+        """Drop the entry of `name` called with `args`, or every entry of `name` when args is None."""
+        with self._lock:
+            self._generations[name] = self._generations.get(name, 0) + 1
+            if args is not None:
+                self._entries.pop((name, args), None)
+                return
+            for key in [key for key in self._entries if key[0] == name]:
+                del self._entries[key]
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+
+@st.cache_resource
+def get_query_cache():
+    """Create the process-wide query cache and return it."""
+    return QueryCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+
+# Names of the readers declared with each tag
+_tagged_readers = {}
+
+def _copy(value):
+    """Copy a cached value deeply enough that callers cannot change the cached one."""
+    if isinstance(value, pd.DataFrame):
+        copied = value.copy(deep=True)
+        # DataFrame copies share the dicts and lists held in object columns
+        for column in copied.columns[copied.dtypes == object]:
+            if copied[column].map(lambda item: isinstance(item, (dict, list))).any():
+                copied[column] = [copy.deepcopy(item) for item in copied[column]]
+        return copied
+    return copy.deepcopy(value)
+
+def cached(ttl=None, tags=()):
+    """Cache a reader's results by its positional arguments.
+
+    Failed queries (None) are not cached, and callers get a deep copy of the
+    cached value so they can modify it freely. `tags` name the writes that make
+    the reader stale (see invalidate_tag).
+    """
+    def decorator(func):
+        for tag in tags:
+            _tagged_readers.setdefault(tag, set()).add(func.__name__)
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            cache = get_query_cache()
+            key = (func.__name__, args)
+            hit, value = cache.get(key)
+            if not hit:
+                generation = cache.generation(func.__name__)
+                value = func(*args)
+                if value is None:
+                    return None
+                cache.set(key, value, ttl, generation)
+            return _copy(value)
+        return wrapper
+    return decorator
+
+def invalidate(reader, *args):
+    """Drop a cached reader's result for `args`, or all of its results when no args are given."""
+    get_query_cache().invalidate(reader.__name__, args if args else None)
+
+def invalidate_tag(tag):
+    """Drop every result of the readers declared with `tag`."""
+    cache = get_query_cache()
+    for name in _tagged_readers.get(tag, ()):
+        cache.invalidate(name)
@@ -0,0 +1,180 @@
+"""
+Timing instrumentation for the database.py query paths.
+
+Every query run through execute_query, a transaction() block or stream_query
+records its duration, row count, the database.py function that ran it and the
+Streamlit page and rerun it belongs to, in an in-process ring buffer of the
+last QUERY_STATS_BUFFER_SIZE calls. Queries slower than SLOW_QUERY_MS go
+to the slow-query log (the "vinatex.slow_queries" logger, written to
+SLOW_QUERY_LOG_FILE when that is set). The admin page summarizes the buffer so
+N+1 patterns show up as functions called many times per rerun.
+"""
+import os
+import logging
+import threading
+import itertools
+from collections import deque
+import pandas as pd
+import streamlit as st
+
+# Instrumentation settings (override with environment variables)
+QUERY_STATS_BUFFER_SIZE = int(os.getenv('QUERY_STATS_BUFFER_SIZE', '5000'))
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '500'))
+SLOW_QUERY_LOG_FILE = os.getenv('SLOW_QUERY_LOG_FILE')
+
+slow_query_logger = logging.getLogger('vinatex.slow_queries')
+if SLOW_QUERY_LOG_FILE and not slow_query_logger.handlers:
+    _handler = logging.FileHandler(SLOW_QUERY_LOG_FILE, encoding='utf-8')
+    _handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    slow_query_logger.addHandler(_handler)
+    slow_query_logger.setLevel(logging.WARNING)
+
+# Streamlit runs each rerun of a session's script on its own thread
+_context = threading.local()
+_run_ids = itertools.count(1)
+
+class QueryStats:
+    """Ring buffer of recent query timings plus the recent slow queries."""
+
+    def __init__(self, buffer_size, slow_query_ms):
+        self.slow_query_ms = slow_query_ms
+        self._records = deque(maxlen=buffer_size)
+        self._slow = deque(maxlen=200)
+        self._lock = threading.Lock()
+
+    def record(self, function, duration_ms, rows, query, page=None, run_id=None):
+        """Record one query call, logging it when it is over the slow-query threshold."""
+        record = {
+            'time': pd.Timestamp.now(),
+            'function': function,
+            'page': page or '-',
+            'run_id': run_id or 0,
+            'duration_ms': duration_ms,
+            'rows': rows
+        }
+        with self._lock:
+            self._records.append(record)
+            if duration_ms >= self.slow_query_ms:
+                self._slow.append({**record, 'query': ' '.join(query.split())})
+
+        if duration_ms >= self.slow_query_ms:
+            slow_query_logger.warning(
+                "%.1f ms %s (page %s, %s rows): %s",
+                duration_ms, function, record['page'], rows, ' '.join(query.split())
+            )
+
+    def records(self):
+        """Return the buffered calls as a DataFrame."""
+        with self._lock:
+            return pd.DataFrame(list(self._records))
+
+    def slow_queries(self):
+        """Return the recent slow queries as a DataFrame, newest first."""
+        with self._lock:
+            return pd.DataFrame(list(reversed(self._slow)))
+
+    def summary(self):
+        """
+        Aggregate the buffered calls per function.
+
+        Returns:
+            DataFrame with calls, total/mean/p50/p95/p99/max time, rows and the
+            average and highest number of calls per rerun, sorted by total time
+        """
+        records = self.records()
+        if records.empty:
+            return records
+
+        by_function = records.groupby('function')
+        summary = by_function['duration_ms'].agg(
+            calls='count',
+            total_ms='sum',
+            mean_ms='mean',
+            p50_ms=lambda d: d.quantile(0.50),
+            p95_ms=lambda d: d.quantile(0.95),
+            p99_ms=lambda d: d.quantile(0.99),
+            max_ms='max'
+        )
+        summary['rows'] = by_function['rows'].sum()
+
+        per_run = records.groupby(['function', 'run_id']).size().groupby('function')
+        summary['calls_per_rerun'] = per_run.mean()
+        summary['max_calls_per_rerun'] = per_run.max()
+        summary['pages'] = by_function['page'].agg(lambda pages: ', '.join(sorted(set(pages))))
+        return summary.sort_values('total_ms', ascending=False).reset_index()
+
+    def clear(self):
+        """Drop every recorded call."""
+        with self._lock:
+            self._records.clear()
+            self._slow.clear()
+
+@st.cache_resource
+def get_query_stats():
+    """Create the process-wide query statistics buffer and return it."""
+    return QueryStats(QUERY_STATS_BUFFER_SIZE, SLOW_QUERY_MS)
+
+def start_run(page=None):
+    """Mark the start of a script rerun; queries recorded on this thread belong to it."""
+    _context.run_id = next(_run_ids)
+    _context.page = page
+
+def set_page(page):
+    """Set the page that the current rerun's queries are attributed to."""
+    _context.page = page
+
+def record_query(function, duration_ms, rows, query):
+    """Record a query for the current rerun (called by database.py for every statement it runs)."""
+    get_query_stats().record(
+        function, duration_ms, rows, query,
+        page=getattr(_context, 'page', None), run_id=getattr(_context, 'run_id', None)
+    )
+
+def query_stats_page():
+    """Show query timings and the slow-query log (Admin only)."""
+    if st.session_state.user_role != "admin":
+        st.error("You don't have permission to access this page")
+        return
+
+    st.title("⏱️ Hiệu năng truy vấn")
+
+    stats = get_query_stats()
+    records = stats.records()
+    if records.empty:
+        st.info("Chưa ghi nhận truy vấn nào.")
+        return
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Số truy vấn", len(records))
+    with col2:
+        st.metric("Số lần tải trang", records['run_id'].nunique())
+    with col3:
+        st.metric("p95 (ms)", f"{records['duration_ms'].quantile(0.95):.1f}")
+    with col4:
+        st.metric(f"Truy vấn chậm (≥ {stats.slow_query_ms:.0f} ms)", int((records['duration_ms'] >= stats.slow_query_ms).sum()))
+
+    summary = stats.summary()
+
+    st.subheader("Theo tổng thời gian")
+    st.dataframe(summary.round(2), use_container_width=True)
+
+    st.subheader("Theo số lần gọi mỗi lần tải trang")
+    st.caption("Hàm được gọi nhiều lần trong một lần tải trang thường là dấu hiệu của truy vấn N+1.")
+    st.dataframe(
+        summary.sort_values('max_calls_per_rerun', ascending=False)[
+            ['function', 'pages', 'calls_per_rerun', 'max_calls_per_rerun', 'calls', 'total_ms']
+        ].round(2),
+        use_container_width=True
+    )
+
+    st.subheader("Nhật ký truy vấn chậm")
+    slow = stats.slow_queries()
+    if slow.empty:
+        st.info("Không có truy vấn chậm.")
+    else:
+        st.dataframe(slow.drop(columns=['run_id']).round(2), use_container_width=True)
+
+    if st.button("Xóa số liệu"):
+        stats.clear()
+        st.rerun()
@@ -0,0 +1,144 @@
+"""
+Due-date recurrence rules for report schedules.
+
+A schedule repeats every month, quarter or year from its first due date, or
+follows a cron-like expression over calendar days:
+
+    "DAY MONTH WEEKDAY"     e.g. "L * *" (last day of every month),
+                                 "15 1,4,7,10 *" (15th of each quarter's first month),
+                                 "* * 1" (every Monday)
+
+Each field takes *, numbers, ranges (1-5), lists (1,15) and steps (*/3, 1-31/2);
+the day field also takes L for the last day of the month. Weekdays run 0-6 from
+Sunday (7 is also Sunday). A standard five-field cron expression is accepted too,
+ignoring its minute and hour fields.
+"""
+import calendar
+from datetime import timedelta
+import utils
+
+FREQUENCIES = ["monthly", "quarterly", "yearly", "cron"]
+
+# Months between due dates for the periodic frequencies
+FREQUENCY_MONTHS = {
+    "monthly": 1,
+    "quarterly": 3,
+    "yearly": 12
+}
+
+def _parse_field(field, low, high):
+    """Expand one cron field into the set of values it matches."""
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step_text = part.split('/', 1)
+            step = int(step_text)
+            if step < 1:
+                raise ValueError(f"Invalid step in '{field}'")
+
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start_text, end_text = part.split('-', 1)
+            start, end = int(start_text), int(end_text)
+        else:
+            start = end = int(part)
+
+        if start < low or end > high or start > end:
+            raise ValueError(f"'{field}' is outside {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return values
+
+def parse_cron(expression):
+    """
+    Parse a cron-like expression into the days, months and weekdays it matches.
+
+    Returns:
+        Tuple (days, months, weekdays, last_day, day_restricted, weekday_restricted)
+
+    Raises:
+        ValueError: If the expression is malformed
+    """
+    fields = (expression or '').split()
+    if len(fields) == 5:
+        fields = fields[2:]
+    if len(fields) != 3:
+        raise ValueError("Expected 3 fields (day month weekday) or a 5-field cron expression")
+    day_field, month_field, weekday_field = fields
+
+    day_parts = day_field.split(',')
+    last_day = 'L' in day_parts
+    day_parts = [part for part in day_parts if part != 'L']
+    days = _parse_field(','.join(day_parts), 1, 31) if day_parts else set()
+
+    months = _parse_field(month_field, 1, 12)
+    weekdays = {weekday % 7 for weekday in _parse_field(weekday_field, 0, 7)}
+    # Like cron, a field starting with * (e.g. */2) does not count as restricted
+    return days, months, weekdays, last_day, not day_field.startswith('*'), not weekday_field.startswith('*')
+
+def cron_dates(expression, start, end):
+    """List the dates from start to end (inclusive) that match a cron-like expression."""
+    days, months, weekdays, last_day, day_restricted, weekday_restricted = parse_cron(expression)
+
+    dates = []
+    day = start
+    while day <= end:
+        if day.month in months:
+            day_match = day.day in days or (last_day and day.day == calendar.monthrange(day.year, day.month)[1])
+            # Python counts weekdays from Monday; cron counts from Sunday
+            weekday_match = (day.weekday() + 1) % 7 in weekdays
+            # As in cron, a restricted day and weekday match when either one does
+            if day_restricted and weekday_restricted:
+                matched = day_match or weekday_match
+            elif day_restricted:
+                matched = day_match
+            else:
+                matched = weekday_match
+            if matched:
+                dates.append(day)
+        day += timedelta(days=1)
+    return dates
+
+def due_dates(frequency, first_due_date, start, end, cron_expression=None):
+    """
+    List a schedule's due dates from start to end (inclusive).
+
+    Periodic schedules count whole periods from first_due_date, so a schedule
+    due on the 31st stays on the last day of shorter months. No date falls
+    before first_due_date.
+
+    Args:
+        frequency: One of FREQUENCIES
+        first_due_date: The schedule's first due date
+        start: First date of the window
+        end: Last date of the window
+        cron_expression: The expression for 'cron' schedules
+
+    Returns:
+        Sorted list of dates
+    """
+    start = max(start, first_due_date)
+    if start > end:
+        return []
+
+    if frequency == "cron":
+        return cron_dates(cron_expression, start, end)
+
+    if frequency not in FREQUENCY_MONTHS:
+        raise ValueError(f"Unknown frequency: {frequency}")
+    step = FREQUENCY_MONTHS[frequency]
+
+    # Skip whole periods that end before the window
+    months_to_start = (start.year - first_due_date.year) * 12 + start.month - first_due_date.month
+    period = max(0, months_to_start // step - 1)
+
+    dates = []
+    while True:
+        due_date = utils.add_months(first_due_date, period * step)
+        if due_date > end:
+            break
+        if due_date >= start:
+            dates.append(due_date)
+        period += 1
+    return dates
@@ -66,17 +66,16 @@ def list_report_templates():
             st.write(f"**Mô tả:** {template['description']}")
             st.write(f"**Phòng ban:** {template['department']}")
             
-            # Parse and display fields
-            fields = json.loads(template['fields'])
+            # Display fields
+            fields = template['fields']
             st.write("**Các trường dữ liệu:**")
             
             for field in fields:
                 st.write(f"- {field['label']} ({field['id']})")
             
             # Get sheet structure if available
-            sheet_structure = db.get_report_template_sheet_structure(template['id'])
-            if sheet_structure:
-                sheet_data = json.loads(sheet_structure)
+            sheet_data = db.get_report_template_sheet_structure(template['id'])
+            if sheet_data:
                 st.write("**Cấu trúc Excel:**")
                 
                 for sheet_name, sheet_config in sheet_data.items():
@@ -241,8 +240,8 @@ def edit_report_template(template):
             current_dept_idx = i
             break
     
-    # Parse fields from JSON
-    fields = json.loads(template['fields'])
+    # Fields are stored as JSONB and arrive already decoded
+    fields = template['fields']
     
     # Initialize session state for editing fields if not exists
     if 'editing_fields' not in st.session_state:
@@ -319,10 +318,8 @@ def edit_report_template(template):
                     st.success("Đã cập nhật mẫu báo cáo thành công.")
                     
                     # Update sheet structure if it exists
-                    sheet_structure = db.get_report_template_sheet_structure(template['id'])
-                    if sheet_structure:
-                        sheet_data = json.loads(sheet_structure)
-                        
+                    sheet_data = db.get_report_template_sheet_structure(template['id'])
+                    if sheet_data:
                         # Update fields in all sheets
                         for sheet_name in sheet_data:
                             sheet_data[sheet_name]['fields'] = st.session_state.editing_fields
@@ -387,14 +384,12 @@ def configure_excel_sheets(template):
     if 'configuring_fields' in st.session_state:
         fields = st.session_state.configuring_fields
     else:
-        fields = json.loads(template['fields'])
+        fields = template['fields']
     
     # Get current sheet structure if it exists
-    current_structure = db.get_report_template_sheet_structure(template['id'])
+    sheet_structure = db.get_report_template_sheet_structure(template['id'])
     
-    if current_structure:
-        sheet_structure = json.loads(current_structure)
-    else:
+    if not sheet_structure:
         # Create default structure with a single sheet
         sheet_structure = {
             "Báo cáo": {
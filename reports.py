@@ -1,11 +1,18 @@
+import os
 import streamlit as st
 import pandas as pd
 import json
+from collections import OrderedDict
 from datetime import datetime, timedelta
 import database as db
 import excel_handler
+import excel_utils
+import recurrence
 import utils
 
+# Most submission workbooks one session keeps for download (override with environment variables)
+SUBMISSION_EXCEL_CACHE_SIZE = int(os.getenv('SUBMISSION_EXCEL_CACHE_SIZE', '8'))
+
 def manage_report_templates():
     """Manage report templates (Admin only)."""
     if st.session_state.user_role != "admin":
@@ -23,7 +30,9 @@ def manage_report_templates():
         
         if templates_df is not None and not templates_df.empty:
             # Format the fields column to show it better
-            templates_df['fields'] = templates_df['fields'].apply(lambda x: ', '.join(json.loads(x)) if isinstance(x, str) else '')
+            templates_df['fields'] = templates_df['fields'].apply(
+                lambda x: ', '.join(f['label'] if isinstance(f, dict) else str(f) for f in x) if isinstance(x, list) else ''
+            )
             
             # Display the templates
             st.dataframe(templates_df[['id', 'name', 'description', 'fields', 'department']], use_container_width=True)
@@ -69,7 +78,7 @@ def manage_report_templates():
                     template_id = template_data['id']
                     default_name = template_data['name']
                     default_description = template_data['description']
-                    default_fields = json.loads(template_data['fields'])
+                    default_fields = template_data['fields']
                     default_department_id = template_data['department_id']
                 else:
                     st.error("Failed to load template data")
@@ -181,11 +190,15 @@ def assign_reports():
         return
     
     # Create tabs for viewing and assigning reports
-    tab1, tab2 = st.tabs(["Assigned Reports", "Assign New Report"])
+    tab1, tab2, tab3 = st.tabs(["Assigned Reports", "Assign New Report", "Recurring Schedules"])
     
     with tab1:
-        # Get all assigned reports
-        assigned_reports = db.get_assigned_reports()
+        # Get one page of assigned reports (department users see their own templates only)
+        department_id = st.session_state.user_org_id if st.session_state.user_role == "department" else None
+        assigned_reports = utils.keyset_page(
+            "assigned_reports_page",
+            lambda limit, after: db.get_assigned_reports(limit=limit, after=after, department_id=department_id)
+        )
         
         if assigned_reports is not None and not assigned_reports.empty:
             st.dataframe(assigned_reports, use_container_width=True)
@@ -193,77 +206,212 @@ def assign_reports():
             st.info("No reports have been assigned yet")
     
     with tab2:
-        with st.form("assign_report_form"):
-            # Template selection
-            template_id = st.selectbox(
-                "Select Report Template",
-                options=templates_df['id'].tolist(),
-                format_func=lambda x: templates_df.loc[templates_df['id'] == x, 'name'].iloc[0]
-            )
-            
-            # Organization selection
-            organization_id = st.selectbox(
-                "Select Organization",
+        # Template selection
+        template_id = st.selectbox(
+            "Select Report Template",
+            options=templates_df['id'].tolist(),
+            format_func=lambda x: templates_df.loc[templates_df['id'] == x, 'name'].iloc[0]
+        )
+        
+        # Organization selection: picked units or every unit under a parent organization
+        target = st.radio("Assign To", ["Selected units", "All units under an organization"], horizontal=True)
+        if target == "Selected units":
+            organization_ids = st.multiselect(
+                "Select Units",
                 options=units_df['id'].tolist(),
                 format_func=lambda x: units_df.loc[units_df['id'] == x, 'name'].iloc[0]
             )
-            
-            # Due date selection
-            min_date = datetime.now().date() + timedelta(days=1)
-            default_due_date = datetime.now().date() + timedelta(days=7)
-            due_date = st.date_input("Due Date", value=default_due_date, min_value=min_date)
-            
-            # Submit button
-            submit_button = st.form_submit_button("Assign Report")
-            
-            if submit_button:
-                if db.assign_report(template_id, organization_id, due_date):
-                    st.success("Report assigned successfully")
-                    st.rerun()
+        else:
+            organizations_df = db.get_organizations()
+            parents_df = organizations_df[organizations_df['type'] != 'unit']
+            parent_id = st.selectbox(
+                "Parent Organization",
+                options=parents_df['id'].tolist(),
+                format_func=lambda x: parents_df.loc[parents_df['id'] == x, 'name'].iloc[0]
+            )
+            subtree_units = db.get_units_under(parent_id)
+            organization_ids = [] if subtree_units is None or subtree_units.empty else subtree_units['id'].tolist()
+            st.caption(f"{len(organization_ids)} units")
+        
+        # Due date selection: one date, or a series repeating every period
+        min_date = datetime.now().date() + timedelta(days=1)
+        default_due_date = datetime.now().date() + timedelta(days=7)
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            first_due_date = st.date_input("Due Date", value=default_due_date, min_value=min_date)
+        with col2:
+            period_count = st.number_input("Number of Periods", min_value=1, max_value=24, value=1)
+        with col3:
+            period_months = st.selectbox(
+                "Repeat Every",
+                options=[1, 3, 6, 12],
+                format_func=lambda x: {1: "Month", 3: "Quarter", 6: "Half year", 12: "Year"}[x],
+                disabled=period_count == 1
+            )
+        due_dates = [utils.add_months(first_due_date, i * period_months) for i in range(int(period_count))]
+        
+        if len(due_dates) > 1:
+            st.caption("Due dates: " + ", ".join(d.strftime('%d/%m/%Y') for d in due_dates))
+        
+        if st.button("Assign Report"):
+            if not organization_ids:
+                st.error("Select at least one unit")
+            else:
+                report_ids = db.assign_reports_bulk(template_id, organization_ids, due_dates)
+                if report_ids is not None:
+                    st.success(f"Assigned {len(report_ids)} reports")
                 else:
                     st.error("Failed to assign report")
+    
+    with tab3:
+        manage_report_schedules(templates_df, units_df)
+
+def manage_report_schedules(templates_df, units_df):
+    """List recurring schedules and create new ones."""
+    schedules = db.get_report_schedules()
+    if schedules is not None and not schedules.empty:
+        st.dataframe(schedules, use_container_width=True)
+        
+        schedule_id = st.selectbox(
+            "Select Schedule",
+            options=schedules['id'].tolist(),
+            format_func=lambda x: schedules.loc[schedules['id'] == x, 'name'].iloc[0]
+        )
+        active = bool(schedules.loc[schedules['id'] == schedule_id, 'active'].iloc[0])
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("Pause Schedule" if active else "Resume Schedule"):
+                if db.set_report_schedule_active(schedule_id, not active):
+                    st.rerun()
+        with col2:
+            if st.button("Delete Schedule"):
+                if db.delete_report_schedule(schedule_id):
+                    st.rerun()
+    else:
+        st.info("No recurring schedules yet")
+    
+    st.subheader("New Schedule")
+    with st.form("report_schedule_form"):
+        name = st.text_input("Schedule Name")
+        template_id = st.selectbox(
+            "Select Report Template",
+            options=templates_df['id'].tolist(),
+            format_func=lambda x: templates_df.loc[templates_df['id'] == x, 'name'].iloc[0],
+            key="schedule_template"
+        )
+        all_units = st.checkbox("All units")
+        organization_ids = st.multiselect(
+            "Select Units",
+            options=units_df['id'].tolist(),
+            format_func=lambda x: units_df.loc[units_df['id'] == x, 'name'].iloc[0],
+            key="schedule_units"
+        )
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            frequency = st.selectbox("Frequency", options=recurrence.FREQUENCIES, format_func=str.capitalize)
+            first_due_date = st.date_input("First Due Date", value=datetime.now().date() + timedelta(days=7))
+            lead_days = st.number_input("Create Reports Days Ahead", min_value=1, max_value=366, value=31)
+        with col2:
+            cron_expression = st.text_input("Cron Expression (day month weekday)", placeholder="L * *")
+            has_end_date = st.checkbox("Has End Date")
+            end_date = st.date_input("End Date", value=datetime.now().date() + timedelta(days=365))
+        
+        if st.form_submit_button("Create Schedule"):
+            if all_units:
+                organization_ids = units_df['id'].tolist()
+            
+            if not name or not organization_ids:
+                st.error("Enter a name and select at least one unit")
+            elif frequency == "cron" and not cron_expression:
+                st.error("Enter a cron expression")
+            else:
+                schedule_id = db.add_report_schedule(
+                    name, template_id, organization_ids, frequency, first_due_date,
+                    end_date=end_date if has_end_date else None, lead_days=lead_days,
+                    cron_expression=cron_expression if frequency == "cron" else None
+                )
+                if schedule_id is not None:
+                    # Create the reports already due within the lead time right away
+                    try:
+                        created = db.materialize_scheduled_reports(schedule_id)
+                        st.success(f"Schedule created; {created} reports assigned")
+                    except Exception as e:
+                        st.error(f"Schedule created, but assigning its reports failed: {e}")
+                else:
+                    st.error("Failed to create schedule")
+
+def excel_download(report, submission, key):
+    """Offer a submission as an Excel download, building the workbook only once asked for."""
+    # The most recently built workbooks stay in the session so later reruns do
+    # not rebuild them; older ones are dropped and built again when asked for
+    excel_files = st.session_state.setdefault('submission_excel_files', OrderedDict())
+    file_key = (key, submission['id'])
+    
+    if file_key not in excel_files:
+        if st.button("Download as Excel", key=f"download_{key}"):
+            excel_files[file_key] = excel_handler.create_excel_from_report(report, submission)
+            while len(excel_files) > SUBMISSION_EXCEL_CACHE_SIZE:
+                excel_files.popitem(last=False)
+    
+    if file_key in excel_files:
+        excel_files.move_to_end(file_key)
+        st.download_button(
+            label="Download Excel",
+            data=excel_files[file_key],
+            file_name=f"{report['report_name']}.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            key=f"dl_{key}"
+        )
+
+def show_submission(submission):
+    """Show when a submission was made and its field values."""
+    st.write(f"**Submitted at:** {submission['submitted_at']}")
+    if submission.get('sharepoint_url'):
+        st.write(f"**SharePoint:** [{submission['sharepoint_url']}]({submission['sharepoint_url']})")
+    else:
+        st.write("**SharePoint:** upload pending")
+    st.write("**Submitted data:**")
+    
+    try:
+        for field, value in excel_utils.ordered_submission_items(submission['data'], submission.get('fields')):
+            st.write(f"**{field}:** {value}")
+    except:
+        st.write(submission['data'])
 
 def view_my_reports():
     """View reports assigned to the user's organization."""
     if st.session_state.user_role == "unit":
         # For units, show reports assigned to them
         st.title("My Assigned Reports")
-        assigned_reports = db.get_organization_assigned_reports(st.session_state.user_org_id)
+        assigned_reports = utils.keyset_page(
+            "my_reports_page",
+            lambda limit, after: db.get_organization_reports_with_submissions(
+                st.session_state.user_org_id, limit=limit, after=after
+            )
+        )
         
         if assigned_reports is not None and not assigned_reports.empty:
             # Display reports with expanders for details
-            for _, report in assigned_reports.iterrows():
+            for report in assigned_reports.to_dict('records'):
                 with st.expander(f"{report['report_name']} - Due: {report['due_date']}"):
                     st.write(f"**Description:** {report['description']}")
                     st.write(f"**Status:** {report['status']}")
                     
                     # Display submission if completed
-                    if report['status'] == 'completed':
-                        submission = db.get_report_submission(report['id'])
-                        if submission:
-                            st.write(f"**Submitted at:** {submission['submitted_at']}")
-                            st.write("**Submitted data:**")
-                            
-                            try:
-                                data = json.loads(submission['data'])
-                                for field, value in data.items():
-                                    st.write(f"**{field}:** {value}")
-                            except:
-                                st.write(submission['data'])
-                            
-                            # Download as Excel button
-                            if st.button(f"Download as Excel", key=f"download_{report['id']}"):
-                                excel_file = excel_handler.create_excel_from_report(report, submission)
-                                st.download_button(
-                                    label="Download Excel",
-                                    data=excel_file,
-                                    file_name=f"{report['report_name']}.xlsx",
-                                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                                    key=f"dl_{report['id']}"
-                                )
+                    if report['status'] == 'completed' and pd.notna(report['submission_id']):
+                        submission = {
+                            'id': int(report['submission_id']),
+                            'data': report['data'],
+                            'submitted_at': report['submitted_at'],
+                            'sharepoint_url': report['sharepoint_url'],
+                            'fields': report['fields']
+                        }
+                        show_submission(submission)
+                        excel_download(report, submission, report['id'])
                     
-                    # Show submit button for pending reports
-                    if report['status'] == 'pending':
+                    # Show submit button for reports that have not been submitted yet
+                    if report['status'] in ('pending', 'overdue'):
                         if st.button(f"Submit Report", key=f"submit_{report['id']}"):
                             st.session_state.current_report = report['id']
                             st.session_state.current_report_name = report['report_name']
@@ -275,26 +423,27 @@ def view_my_reports():
         # For admin and department roles, show reports they manage
         st.title("Reports Overview")
         
-        # Get all assigned reports or filter by department
-        if st.session_state.user_role == "admin":
-            assigned_reports = db.get_assigned_reports()
-        else:
-            # Get reports for templates belonging to this department
-            assigned_reports = db.get_assigned_reports()
-            # TODO: Filter by department
+        # Add filters
+        status_filter = st.multiselect(
+            "Filter by Status",
+            options=["pending", "completed", "overdue"],
+            default=[]
+        )
+        
+        # Department users only see the reports of their own templates
+        department_id = st.session_state.user_org_id if st.session_state.user_role == "department" else None
+        
+        # Get one page of assigned reports
+        assigned_reports = utils.keyset_page(
+            "reports_overview_page",
+            lambda limit, after: db.get_assigned_reports(
+                status=status_filter or None, limit=limit, after=after, department_id=department_id
+            ),
+            filters=status_filter
+        )
         
         if assigned_reports is not None and not assigned_reports.empty:
-            # Add filters
-            status_filter = st.multiselect(
-                "Filter by Status",
-                options=["pending", "completed", "overdue"],
-                default=[]
-            )
-            
-            # Apply filters
             filtered_reports = assigned_reports
-            if status_filter:
-                filtered_reports = filtered_reports[filtered_reports['status'].isin(status_filter)]
             
             # Display filtered reports
             st.dataframe(filtered_reports, use_container_width=True)
@@ -317,25 +466,8 @@ def view_my_reports():
                 st.write(f"**Status:** {report_details['status']}")
                 
                 if submission:
-                    st.write(f"**Submitted at:** {submission['submitted_at']}")
-                    st.write("**Submitted data:**")
-                    
-                    try:
-                        data = json.loads(submission['data'])
-                        for field, value in data.items():
-                            st.write(f"**{field}:** {value}")
-                    except:
-                        st.write(submission['data'])
-                    
-                    # Download as Excel button
-                    if st.button(f"Download as Excel", key=f"download_{selected_report_id}"):
-                        excel_file = excel_handler.create_excel_from_report(report_details, submission)
-                        st.download_button(
-                            label="Download Excel",
-                            data=excel_file,
-                            file_name=f"{report_details['report_name']}.xlsx",
-                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                        )
+                    show_submission(submission)
+                    excel_download(report_details, submission, selected_report_id)
         else:
             st.info("No reports found")
 
@@ -356,15 +488,11 @@ def submit_report():
         del st.session_state.current_report
         del st.session_state.current_report_name
     else:
-        # Get pending reports for the unit
-        assigned_reports = db.get_organization_assigned_reports(st.session_state.user_org_id)
-        if assigned_reports is None or assigned_reports.empty:
-            st.info("No pending reports to submit")
-            return
-        
-        # Filter for pending reports
-        pending_reports = assigned_reports[assigned_reports['status'] == 'pending']
-        if pending_reports.empty:
+        # Get the unit's reports that still need a submission (pending or overdue)
+        pending_reports = db.get_organization_assigned_reports(
+            st.session_state.user_org_id, status=['pending', 'overdue']
+        )
+        if pending_reports is None or pending_reports.empty:
             st.info("No pending reports to submit")
             return
         
@@ -378,9 +506,15 @@ def submit_report():
         report_name = pending_reports.loc[pending_reports['id'] == report_id, 'report_name'].iloc[0]
     
     # Get the report template fields
-    report_details = db.get_organization_assigned_reports(st.session_state.user_org_id)
-    report_details = report_details[report_details['id'] == report_id].iloc[0]
-    fields = json.loads(report_details['fields'])
+    report_details = db.get_organization_assigned_reports(
+        st.session_state.user_org_id, status=['pending', 'overdue']
+    )
+    report_details = report_details[report_details['id'] == report_id]
+    if report_details.empty:
+        st.info("This report has already been submitted")
+        return
+    report_details = report_details.iloc[0]
+    fields = report_details['fields']
     
     st.subheader(f"Submit Report: {report_name}")
     st.write(f"Due Date: {report_details['due_date']}")
@@ -421,7 +555,10 @@ def submit_report():
         st.write("Upload your report data in Excel format")
         
         # Download template button
-        template_excel = excel_handler.create_report_template(fields)
+        template_excel = excel_utils.get_cached_template(
+            int(report_details['template_id']), 'fields',
+            lambda: excel_handler.create_report_template(fields)
+        )
         st.download_button(
             label="Download Template",
             data=template_excel,
@@ -464,41 +601,45 @@ def view_report_status():
     
     st.title("Report Status")
     
-    # Get all assigned reports
-    if st.session_state.user_role == "admin":
-        assigned_reports = db.get_assigned_reports()
-    else:
-        # Filter reports by department
-        assigned_reports = db.get_assigned_reports()
-        # TODO: Filter by department
+    # Department users only see the reports of their own templates
+    department_id = st.session_state.user_org_id if st.session_state.user_role == "department" else None
     
-    if assigned_reports is not None and not assigned_reports.empty:
-        # Add filters
-        status_filter = st.multiselect(
-            "Filter by Status",
-            options=["pending", "completed", "overdue"],
-            default=[]
-        )
-        
-        organization_filter = st.multiselect(
-            "Filter by Organization",
-            options=assigned_reports['organization'].unique().tolist(),
-            default=[]
+    # Add filters (applied in SQL)
+    status_filter = st.multiselect(
+        "Filter by Status",
+        options=["pending", "completed", "overdue"],
+        default=[]
+    )
+    
+    organizations = db.get_organizations()
+    organization_filter = st.multiselect(
+        "Filter by Organization",
+        options=organizations['name'].tolist() if organizations is not None and not organizations.empty else [],
+        default=[]
+    )
+    organization_ids = None
+    if organization_filter:
+        organization_ids = organizations.loc[organizations['name'].isin(organization_filter), 'id'].tolist()
+    status = status_filter or None
+    
+    status_counts = db.get_assigned_report_status_counts(
+        status=status, organization_id=organization_ids, department_id=department_id
+    )
+    
+    if status_counts is not None and not status_counts.empty:
+        # Display one page of the filtered reports
+        filtered_reports = utils.keyset_page(
+            "report_status_page",
+            lambda limit, after: db.get_assigned_reports(
+                status=status, organization_id=organization_ids, limit=limit, after=after,
+                department_id=department_id
+            ),
+            filters=(status_filter, organization_filter)
         )
-        
-        # Apply filters
-        filtered_reports = assigned_reports
-        if status_filter:
-            filtered_reports = filtered_reports[filtered_reports['status'].isin(status_filter)]
-        if organization_filter:
-            filtered_reports = filtered_reports[filtered_reports['organization'].isin(organization_filter)]
-        
-        # Display filtered reports
         st.dataframe(filtered_reports, use_container_width=True)
         
         # Status summary
         st.subheader("Status Summary")
-        status_counts = filtered_reports['status'].value_counts().reset_index()
         status_counts.columns = ['Status', 'Count']
         
         # Create a pie chart
@@ -516,14 +657,33 @@ def view_report_status():
         )
         st.plotly_chart(fig, use_container_width=True)
         
-        # Export to Excel
-        if st.button("Export to Excel"):
-            excel_file = excel_handler.create_status_report(filtered_reports)
+        # Export with the same filters, streamed straight from the database
+        st.subheader("Export")
+        export_formats = ["Excel", "CSV"]
+        if excel_handler.parquet_available():
+            export_formats.append("Parquet")
+        else:
+            st.caption("Parquet export is unavailable because pyarrow is not installed.")
+        export_format = st.radio("Format", export_formats, horizontal=True)
+        
+        if st.button(f"Export to {export_format}"):
+            rows = db.stream_assigned_reports(
+                status=status, organization_id=organization_ids, department_id=department_id
+            )
+            if export_format == "CSV":
+                with excel_handler.create_status_csv(rows) as csv_file:
+                    data, file_name, mime = csv_file.read(), "report_status.csv", "text/csv"
+            elif export_format == "Parquet":
+                data, file_name, mime = excel_handler.create_status_parquet(rows), "report_status.parquet", "application/vnd.apache.parquet"
+            else:
+                data = excel_handler.create_status_report(rows)
+                file_name = "report_status.xlsx"
+                mime = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
             st.download_button(
-                label="Download Excel Report",
-                data=excel_file,
-                file_name="report_status.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                label=f"Download {export_format} Report",
+                data=data,
+                file_name=file_name,
+                mime=mime
             )
     else:
         st.info("No reports found")
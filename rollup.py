@@ -0,0 +1,202 @@
+"""
+Roll-up of report progress and submitted values along the organization tree.
+
+Every node's figures cover its whole subtree. Status counts come from one query
+over organization_closure and report_status_counts; submitted values are the
+per-unit totals of consolidation.consolidate joined with the closure pairs, so
+a page never runs one query per unit. Both are cached per period for
+database.ROLLUP_CACHE_TTL seconds and dropped when a report is submitted or the
+organization tree changes.
+
+Admins see the whole tree; department users see only their own organization's
+subtree (from organization_closure) and the values of their own templates.
+"""
+from datetime import datetime
+import pandas as pd
+import plotly.express as px
+import streamlit as st
+import database as db
+from query_cache import cached
+from consolidation import consolidate, get_quarter_range
+
+def status_rollup(period_from, period_to):
+    """
+    Get every organization's report counts over its subtree, with completion rates.
+
+    Returns:
+        DataFrame indexed by organization id with name, type, parent_id, total,
+        completed, pending, overdue and completion_rate (None without reports)
+    """
+    rollup = db.get_organization_rollup(period_from, period_to)
+    if rollup is None or rollup.empty:
+        return pd.DataFrame()
+
+    rollup = rollup.set_index('id')
+    totals = rollup['total'].where(rollup['total'] > 0)
+    rollup['completion_rate'] = (100.0 * rollup['completed'] / totals).round(1)
+    return rollup
+
+@cached(ttl=db.ROLLUP_CACHE_TTL, tags=('submissions', 'organizations'))
+def value_rollup(template_id, period_from, period_to):
+    """
+    Sum a template's submitted numeric values over every organization's subtree.
+
+    Returns:
+        DataFrame with organization_id, sheet, field and value (the subtree
+        total), or an empty DataFrame when nothing was submitted
+    """
+    _, per_unit = consolidate(template_id, period_from, period_to)
+    closure = db.get_organization_closure()
+    if per_unit.empty or closure is None or closure.empty:
+        return pd.DataFrame()
+
+    # Each unit's value counts towards the unit itself and all of its ancestors
+    values = per_unit.merge(closure, left_on='organization_id', right_on='descendant_id')
+    return (
+        values.groupby(['ancestor_id', 'sheet', 'field'], sort=False)['value'].sum()
+        .reset_index()
+        .rename(columns={'ancestor_id': 'organization_id'})
+    )
+
+def _visible_rollup(rollup):
+    """Keep the organizations the current user may see: all for admins, else the user's own subtree."""
+    if rollup.empty or st.session_state.user_role == "admin":
+        return rollup
+    subtree = db.get_organization_subtree(st.session_state.user_org_id)
+    if subtree is None or subtree.empty:
+        return rollup.iloc[0:0]
+    return rollup[rollup.index.isin(subtree['id'])]
+
+def _root_ids(rollup):
+    """Return the organizations the current user may start drilling down from."""
+    if st.session_state.user_role == "admin":
+        return rollup.index[rollup['parent_id'].isna()].tolist()
+    return [st.session_state.user_org_id] if st.session_state.user_org_id in rollup.index else []
+
+def _is_valid_path(path, roots, rollup):
+    """Return True if path starts at one of the roots and each step goes down to a child."""
+    if not path or path[0] not in roots or any(node not in rollup.index for node in path):
+        return False
+    return all(rollup.at[child, 'parent_id'] == parent for parent, child in zip(path, path[1:]))
+
+def rollup_page():
+    """Drill down through report progress along the organization tree (Admin and Department roles)."""
+    if st.session_state.user_role not in ["admin", "department"]:
+        st.error("You don't have permission to access this page")
+        return
+
+    st.title("🌳 Tổng hợp theo cây tổ chức")
+
+    default_from, default_to = get_quarter_range(datetime.now().date())
+    col1, col2 = st.columns(2)
+    with col1:
+        period_from = st.date_input("Hạn nộp từ ngày", value=default_from, key="rollup_from")
+    with col2:
+        period_to = st.date_input("Đến ngày", value=default_to, key="rollup_to")
+    st.caption("Số liệu tính theo tháng của hạn nộp.")
+
+    rollup = _visible_rollup(status_rollup(period_from, period_to))
+    roots = _root_ids(rollup) if not rollup.empty else []
+    if not roots:
+        st.info("Không có đơn vị nào để hiển thị.")
+        return
+
+    # The drill-down position is the path from one of the user's roots
+    path = st.session_state.get('rollup_path')
+    if not _is_valid_path(path, roots, rollup):
+        path = [roots[0]] if len(roots) == 1 else []
+    st.session_state.rollup_path = path
+
+    # Breadcrumb: each step goes back up to that level
+    crumbs = [("Tất cả", [])] if len(roots) > 1 else []
+    crumbs += [(rollup.at[node, 'name'], path[:i + 1]) for i, node in enumerate(path)]
+    for column, (label, crumb_path) in zip(st.columns(len(crumbs)), crumbs):
+        with column:
+            if st.button(label, key=f"rollup_crumb_{len(crumb_path)}", disabled=crumb_path == path):
+                st.session_state.rollup_path = crumb_path
+                st.rerun()
+
+    if path:
+        node = rollup.loc[path[-1]]
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Tổng số báo cáo", int(node['total']))
+        with col2:
+            st.metric("Đã hoàn thành", int(node['completed']))
+        with col3:
+            st.metric("Quá hạn", int(node['overdue']))
+        with col4:
+            st.metric("Tỷ lệ hoàn thành", "-" if pd.isna(node['completion_rate']) else f"{node['completion_rate']}%")
+        children = rollup[rollup['parent_id'] == path[-1]]
+    else:
+        children = rollup.loc[roots]
+
+    if children.empty:
+        st.info("Đơn vị này không có đơn vị cấp dưới.")
+    else:
+        st.subheader("Đơn vị cấp dưới")
+        chart_data = children[['name', 'completed', 'pending', 'overdue']].melt(
+            id_vars='name', var_name='status', value_name='count'
+        )
+        fig = px.bar(
+            chart_data, x='name', y='count', color='status', barmode='stack',
+            color_discrete_map={'completed': '#0066b2', 'pending': '#fcba03', 'overdue': '#fc0303'},
+            labels={'name': 'Đơn vị', 'count': 'Số báo cáo', 'status': 'Trạng thái'}
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
+        st.dataframe(
+            children[['name', 'type', 'total', 'completed', 'pending', 'overdue', 'completion_rate']].rename(columns={
+                'name': 'Đơn vị', 'type': 'Loại', 'total': 'Tổng', 'completed': 'Hoàn thành',
+                'pending': 'Chờ nộp', 'overdue': 'Quá hạn', 'completion_rate': 'Tỷ lệ hoàn thành (%)'
+            }),
+            use_container_width=True, hide_index=True
+        )
+
+        child_ids = children.index.tolist()
+        next_node = st.selectbox(
+            "Xem chi tiết đơn vị",
+            options=child_ids,
+            format_func=lambda x: rollup.at[x, 'name']
+        )
+        if st.button("Xem chi tiết"):
+            st.session_state.rollup_path = path + [next_node]
+            st.rerun()
+
+    if path:
+        show_value_rollup(path[-1], children.index.tolist(), rollup, period_from, period_to)
+
+def show_value_rollup(node_id, child_ids, rollup, period_from, period_to):
+    """Show a template's submitted values for a node and each of its children."""
+    st.subheader("Số liệu đã nộp")
+
+    templates_df = db.get_report_templates()
+    if templates_df is not None and not templates_df.empty and st.session_state.user_role == "department":
+        templates_df = templates_df[templates_df['department_id'] == st.session_state.user_org_id]
+    if templates_df is None or templates_df.empty:
+        st.info("Chưa có mẫu báo cáo nào.")
+        return
+    template_id = st.selectbox(
+        "Mẫu báo cáo",
+        options=templates_df['id'].tolist(),
+        format_func=lambda x: templates_df.loc[templates_df['id'] == x, 'name'].iloc[0],
+        key="rollup_template"
+    )
+
+    values = value_rollup(int(template_id), period_from, period_to)
+    if values.empty:
+        st.info("Không có số liệu đã nộp trong kỳ này.")
+        return
+
+    values = values[values['organization_id'].isin([node_id] + child_ids)]
+    if values.empty:
+        st.info("Không có số liệu đã nộp trong kỳ này.")
+        return
+
+    # One row per field; the node's total first, then one column per child
+    table = values.pivot_table(index=['sheet', 'field'], columns='organization_id', values='value', aggfunc='sum')
+    table = table.reindex(columns=[node_id] + [child for child in child_ids if child in table.columns])
+    table.columns = ["Tổng"] + [rollup.at[child, 'name'] for child in table.columns[1:]]
+    if (table.index.get_level_values('sheet') == '').all():
+        table = table.droplevel('sheet')
+    st.dataframe(table, use_container_width=True)
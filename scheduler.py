@@ -0,0 +1,132 @@
+"""
+Background jobs for the Vinatex Report Portal.
+
+Jobs run on a fixed interval either inside the Streamlit process (started from
+app.py) or as a separate worker process:
+
+    python scheduler.py            # run all jobs on their intervals until stopped
+    python scheduler.py --once     # run every job once and exit
+"""
+import os
+import time
+import logging
+import argparse
+import threading
+from datetime import datetime
+import streamlit as st
+import database as db
+
+logger = logging.getLogger(__name__)
+
+# Job intervals in seconds (override with environment variables)
+OVERDUE_SWEEP_INTERVAL = int(os.getenv('OVERDUE_SWEEP_INTERVAL', '3600'))
+SCHEDULE_MATERIALIZE_INTERVAL = int(os.getenv('SCHEDULE_MATERIALIZE_INTERVAL', '3600'))
+
+# Set to 0 when the jobs run in a separate `python scheduler.py` worker
+SCHEDULER_IN_APP = os.getenv('SCHEDULER_IN_APP', '1') == '1'
+
+class Job:
+    """A named function that the scheduler runs every `interval` seconds."""
+
+    def __init__(self, name, func, interval):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.next_run = 0.0
+
+class Scheduler:
+    """Run registered jobs on a daemon thread and record every run in job_runs."""
+
+    def __init__(self):
+        self.jobs = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_job(self, name, func, interval):
+        """Register a job; `func` returns the number of rows it affected."""
+        self.jobs.append(Job(name, func, interval))
+
+    def run_job(self, job):
+        """Run a job once, record its duration and row count, and return the row count."""
+        started_at = datetime.now()
+        start = time.perf_counter()
+        rows_affected = 0
+        error = None
+
+        try:
+            rows_affected = job.func() or 0
+        except Exception as e:
+            error = str(e)
+            logger.exception("Job %s failed", job.name)
+
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        db.record_job_run(job.name, started_at, duration_ms, rows_affected, error)
+        job.next_run = time.monotonic() + job.interval
+        logger.debug("Job %s: %s rows in %s ms", job.name, rows_affected, duration_ms)
+        return rows_affected
+
+    def run_all(self):
+        """Run every job once, regardless of its schedule."""
+        for job in self.jobs:
+            self.run_job(job)
+
+    def run_pending(self):
+        """Run the jobs whose interval has elapsed."""
+        now = time.monotonic()
+        for job in self.jobs:
+            if job.next_run <= now:
+                self.run_job(job)
+
+    def run_forever(self, poll_interval=1.0):
+        """Run due jobs until stop() is called."""
+        while not self._stop.is_set():
+            self.run_pending()
+            self._stop.wait(poll_interval)
+
+    def start(self):
+        """Start running jobs on a daemon thread."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever, name="report-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the background thread after the current job finishes."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+def create_scheduler():
+    """Create a scheduler with all of the portal's background jobs registered."""
+    scheduler = Scheduler()
+    scheduler.add_job("overdue_sweep", db.mark_overdue_reports, OVERDUE_SWEEP_INTERVAL)
+    scheduler.add_job("materialize_schedules", db.materialize_scheduled_reports, SCHEDULE_MATERIALIZE_INTERVAL)
+    return scheduler
+
+@st.cache_resource
+def start_background_scheduler():
+    """Start the in-process scheduler once per server process."""
+    if not SCHEDULER_IN_APP:
+        return None
+    scheduler = create_scheduler()
+    scheduler.start()
+    return scheduler
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the report portal's background jobs")
+    parser.add_argument("--once", action="store_true", help="run every job once and exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    scheduler = create_scheduler()
+    if args.once:
+        scheduler.run_all()
+        return
+
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Signed, expiring session tokens.
+
+A token is the base64url JSON of its claims (user id, username, role,
+organization, issue and expiry times and a random token id) followed by an
+HMAC-SHA256 signature made with SESSION_SECRET. Every rerun validates the
+user by checking the signature and expiry, without reading the users table.
+The token is kept in the session's state and in the SESSION_COOKIE cookie,
+never in the URL, so a page reload restores the session until the token
+expires or is revoked. Streamlit cannot send Set-Cookie headers, so the
+cookie is written by script (SameSite=Strict, and Secure over HTTPS) and is
+not HttpOnly; a stolen token is still bound by its expiry and revocation.
+
+Tokens are revoked through the revoked_sessions table: auth.logout revokes
+one token; database.delete_user, role or organization changes and new
+passwords revoke every token of the user (auth.refresh_session gives the
+current session a fresh one). The revocations are small and read through a
+cache that other server processes refresh every
+database.SESSION_REVOCATION_CACHE_TTL seconds.
+
+Set SESSION_SECRET when more than one server process serves the app;
+without it each process signs with its own random key.
+"""
+import os
+import json
+import hmac
+import time
+import base64
+import hashlib
+import secrets
+import streamlit as st
+import database as db
+
+# Key signing session tokens (override with environment variables)
+SESSION_SECRET = os.getenv('SESSION_SECRET')
+
+# Name of the browser cookie that keeps the token across page reloads
+SESSION_COOKIE = os.getenv('SESSION_COOKIE', 'vinatex_session')
+
+@st.cache_resource
+def _signing_key():
+    """Return the key tokens are signed with."""
+    if SESSION_SECRET:
+        return SESSION_SECRET.encode('utf-8')
+    return secrets.token_bytes(32)
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+def _sign(payload):
+    return hmac.new(_signing_key(), payload.encode('ascii'), hashlib.sha256).digest()
+
+def issue_token(user, ttl=None):
+    """
+    Issue a session token for a validated user.
+
+    Args:
+        user: Dictionary with id, username, role and organization_id
+        ttl: Lifetime in seconds (defaults to database.SESSION_TTL)
+
+    Returns:
+        Signed token string
+    """
+    now = time.time()
+    claims = {
+        'uid': int(user['id']),
+        'sub': user['username'],
+        'role': user['role'],
+        'org': None if user['organization_id'] is None else int(user['organization_id']),
+        'iat': now,
+        'exp': int(now + (ttl or db.SESSION_TTL)),
+        'jti': secrets.token_urlsafe(16)
+    }
+    payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+    return f"{payload}.{_b64encode(_sign(payload))}"
+
+def decode_token(token):
+    """Return a token's claims if its signature is valid and it has not expired, else None."""
+    try:
+        payload, signature = token.split('.')
+        if not hmac.compare_digest(_b64decode(signature), _sign(payload)):
+            return None
+        claims = json.loads(_b64decode(payload))
+    except (ValueError, UnicodeError):
+        return None
+    if claims.get('exp', 0) <= time.time():
+        return None
+    return claims
+
+def is_revoked(claims):
+    """Return True if a token was revoked on its own or with all of its user's tokens."""
+    revoked = db.get_revoked_sessions()
+    if revoked is None:
+        # Fail closed: the revocations could not be read
+        return True
+    if revoked.empty:
+        return False
+    revoked = revoked[revoked['user_id'] == claims['uid']]
+    if (revoked['token_id'] == claims['jti']).any():
+        return True
+    user_wide = revoked[revoked['token_id'].isna()]
+    return bool((user_wide['revoked_at'] >= claims['iat']).any())
+
+def verify_token(token):
+    """Return the claims of a valid, unexpired and unrevoked token, else None."""
+    claims = decode_token(token) if token else None
+    if claims is None or is_revoked(claims):
+        return None
+    return claims
+
+def revoke_token(token):
+    """Revoke a token until it expires; invalid or expired tokens need nothing."""
+    claims = decode_token(token) if token else None
+    if claims is None:
+        return True
+    return db.revoke_session(claims['jti'], claims['uid'], claims['exp'])
@@ -1,7 +1,10 @@
 import streamlit as st
 import pandas as pd
-import json
 import database as db
+import auth
+import settings_store
+import upload_queue
+from settings_store import SharePointSettings, NotificationSettings, EmailSettings
 
 def settings_page():
     """Display the settings page with multiple tabs."""
@@ -61,6 +64,8 @@ def account_settings():
                             user['organization_id']
                         )
                         if success:
+                            # The new password revokes the user's other sessions
+                            auth.refresh_session(user)
                             st.success("Đã cập nhật mật khẩu thành công.")
                         else:
                             st.error("Không thể cập nhật mật khẩu. Vui lòng thử lại sau.")
@@ -72,96 +77,93 @@ def notification_settings():
     st.header("Cài đặt thông báo")
     
     # Load current settings
-    settings = load_notification_settings()
+    settings = settings_store.load(NotificationSettings)
     
     st.subheader("Thông báo email")
     
     with st.form("notification_settings_form"):
-        settings['enable_email_notifications'] = st.toggle(
+        settings.enable_email_notifications = st.toggle(
             "Bật thông báo email", 
-            value=settings['enable_email_notifications']
+            value=settings.enable_email_notifications
         )
         
         st.write("**Gửi thông báo cho các sự kiện:**")
         
         col1, col2 = st.columns(2)
         with col1:
-            settings['notify_on_report_assignment'] = st.checkbox(
+            settings.notify_on_report_assignment = st.checkbox(
                 "Khi được giao báo cáo mới", 
-                value=settings['notify_on_report_assignment']
+                value=settings.notify_on_report_assignment
             )
-            settings['notify_on_report_due'] = st.checkbox(
+            settings.notify_on_report_due = st.checkbox(
                 "Trước hạn nộp báo cáo", 
-                value=settings['notify_on_report_due']
+                value=settings.notify_on_report_due
             )
         
         with col2:
-            settings['notify_on_report_submission'] = st.checkbox(
+            settings.notify_on_report_submission = st.checkbox(
                 "Khi báo cáo được nộp", 
-                value=settings['notify_on_report_submission']
+                value=settings.notify_on_report_submission
             )
-            settings['notify_on_status_change'] = st.checkbox(
+            settings.notify_on_status_change = st.checkbox(
                 "Khi trạng thái báo cáo thay đổi", 
-                value=settings['notify_on_status_change']
+                value=settings.notify_on_status_change
             )
         
         st.write("**Nhắc nhở:**")
-        settings['reminder_days'] = st.number_input(
+        settings.reminder_days = st.number_input(
             "Số ngày trước hạn để gửi nhắc nhở", 
             min_value=1, 
             max_value=14, 
-            value=settings['reminder_days']
+            value=settings.reminder_days
         )
         
         submitted = st.form_submit_button("Lưu cài đặt")
         
         if submitted:
-            save_notification_settings(settings)
-            st.success("Đã lưu cài đặt thông báo.")
+            if settings_store.save(settings):
+                st.success("Đã lưu cài đặt thông báo.")
 
 def sharepoint_settings():
     """Configure SharePoint integration settings."""
     st.header("Cài đặt SharePoint")
     
     # Load current settings
-    settings = load_sharepoint_settings()
+    settings = settings_store.load(SharePointSettings)
     
     with st.form("sharepoint_settings_form"):
-        settings['sharepoint_url'] = st.text_input(
+        settings.sharepoint_url = st.text_input(
             "URL SharePoint", 
-            value=settings['sharepoint_url'],
+            value=settings.sharepoint_url,
             help="URL cơ sở của site SharePoint, ví dụ: https://vinatex.sharepoint.com/sites/reports"
         )
         
-        settings['document_library'] = st.text_input(
+        settings.document_library = st.text_input(
             "Thư viện tài liệu", 
-            value=settings['document_library'],
+            value=settings.document_library,
             help="Đường dẫn thư viện tài liệu, ví dụ: Documents/Reports"
         )
         
-        settings['use_org_folders'] = st.checkbox(
+        settings.use_org_folders = st.checkbox(
             "Tạo thư mục riêng cho mỗi đơn vị", 
-            value=settings['use_org_folders'],
+            value=settings.use_org_folders,
             help="Tạo thư mục riêng cho mỗi đơn vị trong thư viện tài liệu"
         )
         
         # SharePoint credentials (in a real app, these would be securely stored)
         st.subheader("Thông tin xác thực (nếu cần)")
         
-        settings['use_credentials'] = st.checkbox(
+        settings.use_credentials = st.checkbox(
             "Sử dụng thông tin xác thực",
-            value=settings.get('use_credentials', False)
+            value=settings.use_credentials
         )
         
-        if settings['use_credentials']:
-            settings['username'] = st.text_input(
+        if settings.use_credentials:
+            settings.username = st.text_input(
                 "Tên đăng nhập SharePoint", 
-                value=settings.get('username', '')
+                value=settings.username
             )
             
-            if 'password' not in settings:
-                settings['password'] = ''
-                
             new_password = st.text_input(
                 "Mật khẩu SharePoint", 
                 type="password", 
@@ -169,47 +171,82 @@ def sharepoint_settings():
             )
             
             if new_password:
-                settings['password'] = new_password
+                settings.password = new_password
         
         submitted = st.form_submit_button("Lưu cài đặt")
         
         if submitted:
-            save_sharepoint_settings(settings)
-            st.success("Đã lưu cài đặt SharePoint.")
+            if settings_store.save(settings):
+                st.success("Đã lưu cài đặt SharePoint.")
+    
+    if st.session_state.get('user_role') == "admin":
+        upload_queue_status()
+
+def upload_queue_status():
+    """Show the SharePoint upload queue and retry uploads that failed."""
+    st.subheader("Hàng đợi tải lên SharePoint")
+    
+    if not upload_queue.UPLOAD_BACKEND:
+        st.warning("Chưa cấu hình UPLOAD_BACKEND: các tệp sẽ nằm trong hàng đợi cho đến khi được cấu hình.")
+    elif upload_queue.UPLOAD_BACKEND == "local":
+        st.warning(f"Đang dùng thư mục cục bộ '{upload_queue.UPLOAD_LOCAL_DIR}' thay cho SharePoint (chỉ dùng khi phát triển).")
+    else:
+        st.caption(f"Nơi lưu trữ: {upload_queue.UPLOAD_BACKEND}")
+    
+    counts = db.get_upload_queue_counts()
+    if counts is None or counts.empty:
+        st.info("Chưa có tệp nào trong hàng đợi.")
+        return
+    
+    counts = dict(zip(counts['status'], counts['count']))
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Đang chờ", counts.get('pending', 0))
+    with col2:
+        st.metric("Đang tải lên", counts.get('uploading', 0))
+    with col3:
+        st.metric("Hoàn thành", counts.get('done', 0))
+    with col4:
+        st.metric("Thất bại", counts.get('failed', 0))
+    
+    if counts.get('failed'):
+        failed = db.get_failed_uploads()
+        if failed is not None and not failed.empty:
+            st.dataframe(failed, use_container_width=True)
+        if st.button("Thử lại các tệp thất bại"):
+            db.retry_failed_uploads()
+            st.rerun()
 
 def email_settings():
     """Configure email server settings."""
     st.header("Cài đặt máy chủ email")
     
     # Load current settings
-    settings = load_email_settings()
+    settings = settings_store.load(EmailSettings)
     
     with st.form("email_settings_form"):
-        settings['smtp_server'] = st.text_input(
+        settings.smtp_server = st.text_input(
             "Máy chủ SMTP", 
-            value=settings['smtp_server']
+            value=settings.smtp_server
         )
         
-        settings['smtp_port'] = st.number_input(
+        settings.smtp_port = st.number_input(
             "Cổng SMTP", 
-            value=settings['smtp_port'],
+            value=settings.smtp_port,
             min_value=1,
             max_value=65535
         )
         
-        settings['use_ssl'] = st.checkbox(
+        settings.use_ssl = st.checkbox(
             "Sử dụng SSL", 
-            value=settings['use_ssl']
+            value=settings.use_ssl
         )
         
-        settings['smtp_username'] = st.text_input(
+        settings.smtp_username = st.text_input(
             "Tên đăng nhập SMTP", 
-            value=settings['smtp_username']
+            value=settings.smtp_username
         )
         
-        if 'smtp_password' not in settings:
-            settings['smtp_password'] = ''
-            
         new_password = st.text_input(
             "Mật khẩu SMTP", 
             type="password", 
@@ -217,87 +254,20 @@ def email_settings():
         )
         
         if new_password:
-            settings['smtp_password'] = new_password
+            settings.smtp_password = new_password
         
-        settings['from_email'] = st.text_input(
+        settings.from_email = st.text_input(
             "Địa chỉ email gửi", 
-            value=settings['from_email']
+            value=settings.from_email
         )
         
-        settings['email_signature'] = st.text_area(
+        settings.email_signature = st.text_area(
             "Chữ ký email", 
-            value=settings['email_signature']
+            value=settings.email_signature
         )
         
         submitted = st.form_submit_button("Lưu cài đặt")
         
         if submitted:
-            save_email_settings(settings)
-            st.success("Đã lưu cài đặt email.")
-
-def load_notification_settings():
-    """Load notification settings from database or create default settings"""
-    settings_data = db.get_settings("notifications")
-    
-    if settings_data:
-        return json.loads(settings_data)
-    else:
-        # Default notification settings
-        return {
-            "enable_email_notifications": True,
-            "notify_on_report_assignment": True,
-            "notify_on_report_due": True,
-            "notify_on_report_submission": True,
-            "notify_on_status_change": False,
-            "reminder_days": 3
-        }
-
-def save_notification_settings(settings):
-    """Save notification settings to database"""
-    settings_data = json.dumps(settings)
-    db.save_settings("notifications", settings_data)
-
-def load_sharepoint_settings():
-    """Load SharePoint settings from database or create default settings"""
-    settings_data = db.get_settings("sharepoint")
-    
-    if settings_data:
-        return json.loads(settings_data)
-    else:
-        # Default SharePoint settings
-        return {
-            "sharepoint_url": "https://vinatex.sharepoint.com/sites/reports",
-            "document_library": "Documents/Reports",
-            "use_org_folders": True,
-            "use_credentials": False,
-            "username": "",
-            "password": ""
-        }
-
-def save_sharepoint_settings(settings):
-    """Save SharePoint settings to database"""
-    settings_data = json.dumps(settings)
-    db.save_settings("sharepoint", settings_data)
-
-def load_email_settings():
-    """Load email settings from database or create default settings"""
-    settings_data = db.get_settings("email")
-    
-    if settings_data:
-        return json.loads(settings_data)
-    else:
-        # Default email settings
-        return {
-            "smtp_server": "smtp.vinatex.com.vn",
-            "smtp_port": 587,
-            "use_ssl": True,
-            "smtp_username": "reports@vinatex.com.vn",
-            "smtp_password": "",
-            "from_email": "reports@vinatex.com.vn",
-            "email_signature": "Hệ thống báo cáo Tập đoàn Dệt may Việt Nam\nVinatex Report Management System"
-        }
-
-def save_email_settings(settings):
-    """Save email settings to database"""
-    settings_data = json.dumps(settings)
-    db.save_settings("email", settings_data)
\ No newline at end of file
+            if settings_store.save(settings):
+                st.success("Đã lưu cài đặt email.")
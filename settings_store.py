@@ -0,0 +1,202 @@
+"""
+Typed, cached system settings.
+
+Each setting type stored in system_settings is a dataclass with typed fields
+and defaults; values saved by older versions are coerced to the field types and
+missing fields take their defaults. One query loads every type into a
+process-wide cache, so reading settings costs no queries in the steady state.
+
+A trigger on system_settings sends the changed type on the "system_settings"
+notification channel, and a listener thread in every server process drops
+that type from its cache. A version counter bumped on every invalidation keeps
+a load that raced with a change from caching the old value. While the listener
+is disconnected, cached settings expire after SETTINGS_CACHE_TTL seconds.
+
+    settings = settings_store.load(SharePointSettings)
+    settings.document_library = "Documents/Reports"
+    settings_store.save(settings)
+"""
+import os
+import json
+import time
+import select
+import threading
+import dataclasses
+from dataclasses import dataclass
+from typing import ClassVar
+import streamlit as st
+import database as db
+
+# Seconds settings are cached while change notifications are unavailable
+SETTINGS_CACHE_TTL = float(os.getenv('SETTINGS_CACHE_TTL', '60'))
+
+# Seconds between reconnection attempts of the notification listener
+SETTINGS_LISTEN_RETRY = float(os.getenv('SETTINGS_LISTEN_RETRY', '10'))
+
+@dataclass
+class SharePointSettings:
+    TYPE: ClassVar[str] = "sharepoint"
+    sharepoint_url: str = "https://vinatex.sharepoint.com/sites/reports"
+    document_library: str = "Documents/Reports"
+    use_org_folders: bool = True
+    use_credentials: bool = False
+    username: str = ""
+    password: str = ""
+
+@dataclass
+class NotificationSettings:
+    TYPE: ClassVar[str] = "notifications"
+    enable_email_notifications: bool = True
+    notify_on_report_assignment: bool = True
+    notify_on_report_due: bool = True
+    notify_on_report_submission: bool = True
+    notify_on_status_change: bool = False
+    reminder_days: int = 3
+
+@dataclass
+class EmailSettings:
+    TYPE: ClassVar[str] = "email"
+    smtp_server: str = "smtp.vinatex.com.vn"
+    smtp_port: int = 587
+    use_ssl: bool = True
+    smtp_username: str = "reports@vinatex.com.vn"
+    smtp_password: str = ""
+    from_email: str = "reports@vinatex.com.vn"
+    email_signature: str = "Hệ thống báo cáo Tập đoàn Dệt may Việt Nam\nVinatex Report Management System"
+
+SETTING_CLASSES = {cls.TYPE: cls for cls in (SharePointSettings, NotificationSettings, EmailSettings)}
+
+def parse_settings(cls, value):
+    """Build settings of class `cls` from a stored JSON value, keeping the defaults for missing or invalid fields."""
+    try:
+        data = json.loads(value) if value else {}
+    except ValueError:
+        data = {}
+    if not isinstance(data, dict):
+        data = {}
+
+    fields = {}
+    for field in dataclasses.fields(cls):
+        if field.name not in data:
+            continue
+        raw = data[field.name]
+        if field.type is bool:
+            if isinstance(raw, bool):
+                fields[field.name] = raw
+            elif isinstance(raw, str) and raw.lower() in ('true', 'false'):
+                fields[field.name] = raw.lower() == 'true'
+        else:
+            try:
+                fields[field.name] = field.type(raw)
+            except (TypeError, ValueError):
+                pass
+    return cls(**fields)
+
+class SettingsStore:
+    """Process-wide cache of typed settings, invalidated by database notifications."""
+
+    def __init__(self, cache_ttl, retry_interval):
+        self.cache_ttl = cache_ttl
+        self.retry_interval = retry_interval
+        self._values = {}
+        self._version = 0
+        self._listening = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def get(self, cls):
+        """Return a copy of the settings of class `cls`, loading every type on a miss."""
+        with self._lock:
+            entry = self._values.get(cls.TYPE)
+            version = self._version
+        if entry is not None and (entry[0] is None or entry[0] > time.monotonic()):
+            return dataclasses.replace(entry[1])
+
+        rows = db.get_all_settings()
+        if rows is None:
+            # The query failed; use the defaults without caching them
+            return cls()
+
+        stored = dict(zip(rows['type'], rows['value'])) if not rows.empty else {}
+        values = {
+            setting_type: parse_settings(setting_cls, stored.get(setting_type))
+            for setting_type, setting_cls in SETTING_CLASSES.items()
+        }
+        with self._lock:
+            # A change notified while loading may not be in what was loaded
+            if self._version == version:
+                expires_at = None if self._listening else time.monotonic() + self.cache_ttl
+                for setting_type, value in values.items():
+                    self._values[setting_type] = (expires_at, value)
+        return dataclasses.replace(values[cls.TYPE])
+
+    def save(self, settings):
+        """Save settings with one upsert; this process sees the change immediately."""
+        result = db.save_settings(type(settings).TYPE, json.dumps(dataclasses.asdict(settings)))
+        self.invalidate(type(settings).TYPE)
+        return result
+
+    def invalidate(self, setting_type=None):
+        """Drop one setting type, or every type when setting_type is None, from the cache."""
+        with self._lock:
+            self._version += 1
+            if setting_type is None:
+                self._values.clear()
+            else:
+                self._values.pop(setting_type, None)
+
+    def start(self):
+        """Start listening for settings changes on a daemon thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._listen, name="settings-listener", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Ask the listener to stop; it exits within the retry interval."""
+        self._stop.set()
+
+    def _set_listening(self, listening):
+        with self._lock:
+            self._listening = listening
+        # Changes may have been missed while not listening, and entries cached
+        # while listening never expire on their own
+        self.invalidate()
+
+    def _listen(self):
+        while not self._stop.is_set():
+            try:
+                conn = db.listen(db.SETTINGS_CHANNEL)
+            except Exception:
+                self._stop.wait(self.retry_interval)
+                continue
+
+            try:
+                self._set_listening(True)
+                while not self._stop.is_set():
+                    # Wake up now and then to notice stop(); waiting sends no queries
+                    if select.select([conn], [], [], self.retry_interval) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self.invalidate(conn.notifies.pop(0).payload)
+            except Exception:
+                pass
+            finally:
+                self._set_listening(False)
+                conn.close()
+
+@st.cache_resource
+def get_settings_store():
+    """Create the process-wide settings store, start its listener and return it."""
+    store = SettingsStore(SETTINGS_CACHE_TTL, SETTINGS_LISTEN_RETRY)
+    store.start()
+    return store
+
+def load(cls):
+    """Return the current settings of class `cls` (e.g. SharePointSettings)."""
+    return get_settings_store().get(cls)
+
+def save(settings):
+    """Save a settings object and return True on success."""
+    return get_settings_store().save(settings)
@@ -7,6 +7,7 @@ import random
 from datetime import datetime, timedelta
 import streamlit as st
 import urllib.parse
+import migrations
 
 # Parse database URL from environment variables
 database_url = os.getenv('DATABASE_URL')
@@ -20,90 +21,12 @@ db_params = {
 }
 
 def create_tables():
-    """Create the necessary tables for the application."""
-    # SQL for creating tables
-    create_tables_sql = """
-    -- Organizations table
-    CREATE TABLE IF NOT EXISTS organizations (
-        id SERIAL PRIMARY KEY,
-        name VARCHAR(255) NOT NULL,
-        type VARCHAR(50) NOT NULL,  -- 'unit', 'department', 'holding', etc.
-        parent_id INT,
-        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (parent_id) REFERENCES organizations(id) ON DELETE CASCADE
-    );
-
-    -- Users table
-    CREATE TABLE IF NOT EXISTS users (
-        id SERIAL PRIMARY KEY,
-        username VARCHAR(100) UNIQUE NOT NULL,
-        password VARCHAR(255) NOT NULL,
-        role VARCHAR(50) NOT NULL,  -- 'admin', 'department', 'unit'
-        organization_id INT,
-        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (organization_id) REFERENCES organizations(id) ON DELETE SET NULL
-    );
-
-    -- Report Templates table
-    CREATE TABLE IF NOT EXISTS report_templates (
-        id SERIAL PRIMARY KEY,
-        name VARCHAR(255) NOT NULL,
-        description TEXT,
-        fields TEXT NOT NULL,  -- JSON string of field names
-        sheet_structure TEXT,  -- JSON string defining Excel sheet structure
-        department_id INT,
-        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (department_id) REFERENCES organizations(id) ON DELETE SET NULL
-    );
-
-    -- Assigned Reports table
-    CREATE TABLE IF NOT EXISTS assigned_reports (
-        id SERIAL PRIMARY KEY,
-        template_id INT NOT NULL,
-        organization_id INT NOT NULL,
-        due_date DATE NOT NULL,
-        status VARCHAR(50) NOT NULL,  -- 'pending', 'completed', 'overdue'
-        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (template_id) REFERENCES report_templates(id) ON DELETE CASCADE,
-        FOREIGN KEY (organization_id) REFERENCES organizations(id) ON DELETE CASCADE
-    );
-
-    -- Report Submissions table
-    CREATE TABLE IF NOT EXISTS report_submissions (
-        id SERIAL PRIMARY KEY,
-        assigned_report_id INT NOT NULL,
-        data TEXT NOT NULL,  -- JSON string of field values
-        sharepoint_url TEXT,  -- URL to the saved file in SharePoint
-        submitted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (assigned_report_id) REFERENCES assigned_reports(id) ON DELETE CASCADE
-    );
-    
-    -- System Settings table
-    CREATE TABLE IF NOT EXISTS system_settings (
-        id SERIAL PRIMARY KEY,
-        type VARCHAR(50) NOT NULL,  -- 'email', 'sharepoint', 'notification', etc.
-        value TEXT NOT NULL,  -- JSON string of settings
-        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
-    );
-    """
-    
-    # Connect to the database and create tables
+    """Create or upgrade the application tables by applying pending schema migrations."""
     conn = None
     try:
         conn = psycopg2.connect(**db_params)
-        conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
-        cursor = conn.cursor()
-        
-        # Create tables
-        cursor.execute(create_tables_sql)
-        print("Tables created successfully")
-        
-        cursor.close()
+        applied = migrations.apply_migrations(conn)
+        print(f"Applied {len(applied)} migration(s)" if applied else "Database schema is up to date")
         return True
     except Exception as e:
         print(f"Error creating tables: {e}")
@@ -351,7 +274,7 @@ def create_sample_assigned_reports(cursor):
             
             # Get template fields
             cursor.execute("SELECT fields FROM report_templates WHERE id = %s", (template_id,))
-            fields = json.loads(cursor.fetchone()[0])
+            fields = cursor.fetchone()[0]
             
             # Create sample data for submission
             sample_data = {}
@@ -541,18 +464,23 @@ def check_tables_exist():
         if conn is not None:
             conn.close()
 
+@st.cache_resource
+def ensure_schema():
+    """Apply pending schema migrations once per server process."""
+    return create_tables()
+
 def initialize_database():
     """Initialize the database with tables and sample data."""
+    # Create tables, or bring an existing schema up to date
+    if not ensure_schema():
+        st.error("Failed to create tables")
+        return False
+    
     # Check if tables already exist with data
     if check_tables_exist():
         st.write("Database already initialized.")
         return True
     
-    # Create tables
-    if not create_tables():
-        st.error("Failed to create tables")
-        return False
-    
     # Create sample data
     if not create_sample_data():
         st.error("Failed to create sample data")
@@ -0,0 +1,120 @@
+"""
+Byte cache for generated blank template workbooks.
+
+A blank workbook depends only on the template's fields, sheet structure and
+`updated_at`, so entries are keyed by (template_id, updated_at, kind) and a
+template edit can never serve a stale file. Entries live in an in-memory LRU
+and, when TEMPLATE_CACHE_DIR is set, in a directory shared by every server
+process.
+"""
+import os
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+import streamlit as st
+
+# Maximum number of workbooks kept in memory (override with environment variables)
+TEMPLATE_CACHE_SIZE = int(os.getenv('TEMPLATE_CACHE_SIZE', '64'))
+
+# Directory for the on-disk store; leave unset to cache in memory only
+TEMPLATE_CACHE_DIR = os.getenv('TEMPLATE_CACHE_DIR')
+
+class TemplateCache:
+    """Thread-safe LRU of workbook bytes with an optional on-disk store."""
+
+    def __init__(self, max_entries, cache_dir=None):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, key):
+        """Return the cached bytes for a key, or None on a miss."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        path = self._path(key)
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except OSError:
+                return None
+            self._remember(key, data)
+            return data
+        return None
+
+    def put(self, key, data):
+        """Store bytes for a key in memory and, if configured, on disk."""
+        self._remember(key, data)
+
+        path = self._path(key)
+        if path:
+            # Write to a temporary file first so other processes never read a partial file
+            try:
+                fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except OSError:
+                pass
+
+    def get_or_create(self, key, build):
+        """Return the cached bytes for a key, calling `build()` to create them on a miss."""
+        data = self.get(key)
+        if data is None:
+            data = build()
+            self.put(key, data)
+        return data
+
+    def invalidate(self, template_id):
+        """Drop every cached workbook of a template."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == template_id]:
+                del self._entries[key]
+
+        if self.cache_dir:
+            prefix = f"{template_id}_"
+            for filename in os.listdir(self.cache_dir):
+                if filename.startswith(prefix):
+                    try:
+                        os.remove(os.path.join(self.cache_dir, filename))
+                    except OSError:
+                        pass
+
+    def clear(self):
+        """Drop every cached workbook."""
+        with self._lock:
+            self._entries.clear()
+
+        if self.cache_dir:
+            for filename in os.listdir(self.cache_dir):
+                if filename.endswith('.xlsx'):
+                    try:
+                        os.remove(os.path.join(self.cache_dir, filename))
+                    except OSError:
+                        pass
+
+    def _remember(self, key, data):
+        with self._lock:
+            self._entries[key] = data
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _path(self, key):
+        if not self.cache_dir:
+            return None
+        template_id, version, kind = key
+        digest = hashlib.sha1(str(version).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{template_id}_{kind}_{digest}.xlsx")
+
+@st.cache_resource
+def get_template_cache():
+    """Create the process-wide template cache and return it."""
+    return TemplateCache(TEMPLATE_CACHE_SIZE, TEMPLATE_CACHE_DIR)
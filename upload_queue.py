@@ -0,0 +1,382 @@
+"""
+Durable SharePoint upload queue for report submissions.
+
+Submitting a report only adds a row to the sharepoint_uploads table (in the
+same transaction as the submission), so the Streamlit request returns at once.
+A pool of worker threads claims due rows, builds the submission workbook,
+uploads it in chunks to the configured storage backend and stores the URL in
+report_submissions.sharepoint_url. Failed attempts are retried with
+exponential backoff until UPLOAD_MAX_ATTEMPTS is reached.
+
+Backends (UPLOAD_BACKEND):
+
+    local        write files under UPLOAD_LOCAL_DIR (for development only)
+    http         PUT files to UPLOAD_HTTP_URL in Content-Range chunks
+    sharepoint   Microsoft Graph upload sessions, with app credentials from
+                 SHAREPOINT_TENANT_ID, SHAREPOINT_CLIENT_ID and SHAREPOINT_CLIENT_SECRET
+
+There is no default: until UPLOAD_BACKEND is set no workers start and queued
+uploads stay pending, so files never silently end up on the server's disk.
+
+Workers run inside the Streamlit process (started from app.py) or separately:
+
+    python upload_queue.py           # run upload workers until stopped
+    python upload_queue.py --once    # upload everything that is due and exit
+"""
+import os
+import abc
+import json
+import time
+import logging
+import random
+import argparse
+import pathlib
+import tempfile
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+import streamlit as st
+import database as db
+import excel_export
+import settings_store
+import utils
+from settings_store import SharePointSettings
+
+logger = logging.getLogger(__name__)
+
+# Queue settings (override with environment variables)
+UPLOAD_BACKEND = os.getenv('UPLOAD_BACKEND')
+UPLOAD_LOCAL_DIR = os.getenv('UPLOAD_LOCAL_DIR', 'uploads')
+UPLOAD_HTTP_URL = os.getenv('UPLOAD_HTTP_URL')
+UPLOAD_CONCURRENCY = int(os.getenv('UPLOAD_CONCURRENCY', '4'))
+UPLOAD_MAX_ATTEMPTS = int(os.getenv('UPLOAD_MAX_ATTEMPTS', '6'))
+UPLOAD_RETRY_SECONDS = float(os.getenv('UPLOAD_RETRY_SECONDS', '30'))
+UPLOAD_RETRY_MAX_SECONDS = float(os.getenv('UPLOAD_RETRY_MAX_SECONDS', '3600'))
+UPLOAD_LEASE_SECONDS = int(os.getenv('UPLOAD_LEASE_SECONDS', '600'))
+UPLOAD_POLL_INTERVAL = float(os.getenv('UPLOAD_POLL_INTERVAL', '5'))
+UPLOAD_TIMEOUT = float(os.getenv('UPLOAD_TIMEOUT', '60'))
+
+# Graph upload sessions need chunks in multiples of 320 KiB; 5 MiB is 16 of them
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(16 * 320 * 1024)))
+
+# Set to 0 when the workers run in a separate `python upload_queue.py` process
+UPLOAD_WORKERS_IN_APP = os.getenv('UPLOAD_WORKERS_IN_APP', '1') == '1'
+
+# Azure AD app credentials for the SharePoint backend
+SHAREPOINT_TENANT_ID = os.getenv('SHAREPOINT_TENANT_ID')
+SHAREPOINT_CLIENT_ID = os.getenv('SHAREPOINT_CLIENT_ID')
+SHAREPOINT_CLIENT_SECRET = os.getenv('SHAREPOINT_CLIENT_SECRET')
+
+GRAPH_URL = "https://graph.microsoft.com/v1.0"
+
+class PermanentUploadError(Exception):
+    """An upload failure that retrying cannot fix (e.g. a rejected request)."""
+
+def upload_path(template_name, organization_name, due_date, settings):
+    """Return the path of a submission workbook inside the document library."""
+    filename = f"{utils.safe_filename(template_name)}_{utils.safe_filename(organization_name)}_{due_date}.xlsx"
+    parts = [settings.document_library.strip('/')]
+    if settings.use_org_folders:
+        parts.append(utils.safe_filename(organization_name))
+    parts.append(filename)
+    return '/'.join(part for part in parts if part)
+
+def _http_request(url, data=None, method='GET', headers=None):
+    """Send a request and return the decoded JSON body (or None when there is none).
+
+    Client errors other than 408 and 429 raise PermanentUploadError; everything
+    else is left to the retry logic.
+    """
+    request = urllib.request.Request(url, data=data, method=method, headers=headers or {})
+    try:
+        with urllib.request.urlopen(request, timeout=UPLOAD_TIMEOUT) as response:
+            body = response.read()
+    except urllib.error.HTTPError as e:
+        message = f"{method} {url}: HTTP {e.code} {e.read()[:500].decode('utf-8', 'replace')}"
+        if 400 <= e.code < 500 and e.code not in (408, 429):
+            raise PermanentUploadError(message) from e
+        raise RuntimeError(message) from e
+    if not body:
+        return None
+    try:
+        return json.loads(body)
+    except ValueError:
+        return None
+
+class StorageBackend(abc.ABC):
+    """Uploads a file in chunks of `chunk_size` bytes and returns its URL."""
+
+    def __init__(self, chunk_size=UPLOAD_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+
+    def upload(self, path, data):
+        """Upload `data` to `path` and return the URL of the stored file."""
+        session = self.start_upload(path, len(data))
+        try:
+            for offset in range(0, len(data), self.chunk_size):
+                self.upload_chunk(session, offset, data[offset:offset + self.chunk_size], len(data))
+            return self.finish_upload(session)
+        except Exception:
+            self.abort_upload(session)
+            raise
+
+    @abc.abstractmethod
+    def start_upload(self, path, size):
+        """Start uploading `size` bytes to `path` and return the upload session."""
+
+    def abort_upload(self, session):
+        """Clean up after a failed upload."""
+
+    @abc.abstractmethod
+    def upload_chunk(self, session, offset, chunk, size):
+        """Upload the chunk starting at byte `offset` of the file."""
+
+    @abc.abstractmethod
+    def finish_upload(self, session):
+        """Complete the upload and return the URL of the stored file."""
+
+class LocalStorageBackend(StorageBackend):
+    """Stores files in a local directory; a stand-in for SharePoint in development."""
+
+    def __init__(self, root=UPLOAD_LOCAL_DIR, chunk_size=UPLOAD_CHUNK_SIZE):
+        super().__init__(chunk_size)
+        self.root = pathlib.Path(root).resolve()
+
+    def start_upload(self, path, size):
+        target = self.root / path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so a partial upload is never visible
+        fd, tmp_path = tempfile.mkstemp(dir=target.parent, suffix='.part')
+        return {'target': target, 'tmp_path': tmp_path, 'file': os.fdopen(fd, 'wb')}
+
+    def upload_chunk(self, session, offset, chunk, size):
+        session['file'].write(chunk)
+
+    def finish_upload(self, session):
+        session['file'].close()
+        os.replace(session['tmp_path'], session['target'])
+        return session['target'].as_uri()
+
+    def abort_upload(self, session):
+        session['file'].close()
+        if os.path.exists(session['tmp_path']):
+            os.remove(session['tmp_path'])
+
+class HttpStorageBackend(StorageBackend):
+    """PUTs files to `base_url/<path>`, one Content-Range request per chunk."""
+
+    def __init__(self, base_url=UPLOAD_HTTP_URL, chunk_size=UPLOAD_CHUNK_SIZE):
+        super().__init__(chunk_size)
+        if not base_url:
+            raise ValueError("UPLOAD_HTTP_URL is not set")
+        self.base_url = base_url.rstrip('/')
+
+    def start_upload(self, path, size):
+        return {'url': f"{self.base_url}/{urllib.parse.quote(path)}", 'response': None}
+
+    def upload_chunk(self, session, offset, chunk, size):
+        session['response'] = _http_request(session['url'], data=chunk, method='PUT', headers={
+            'Content-Type': 'application/octet-stream',
+            'Content-Range': f"bytes {offset}-{offset + len(chunk) - 1}/{size}"
+        })
+
+    def finish_upload(self, session):
+        # The server may answer the last chunk with the file's public URL
+        response = session['response'] or {}
+        return response.get('url', session['url'])
+
+class SharePointStorageBackend(StorageBackend):
+    """Uploads to a SharePoint site's default document library through Microsoft Graph."""
+
+    def __init__(self, tenant_id=SHAREPOINT_TENANT_ID, client_id=SHAREPOINT_CLIENT_ID,
+                 client_secret=SHAREPOINT_CLIENT_SECRET, chunk_size=UPLOAD_CHUNK_SIZE):
+        super().__init__(chunk_size)
+        if not (tenant_id and client_id and client_secret):
+            raise ValueError("SHAREPOINT_TENANT_ID, SHAREPOINT_CLIENT_ID and SHAREPOINT_CLIENT_SECRET must be set")
+        self.tenant_id = tenant_id
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self._token = None
+        self._token_expires_at = 0.0
+        self._site_ids = {}
+        self._lock = threading.Lock()
+
+    def _access_token(self):
+        """Return an app-only Graph token, fetching a new one shortly before it expires."""
+        with self._lock:
+            if self._token is None or time.time() > self._token_expires_at - 60:
+                body = urllib.parse.urlencode({
+                    'client_id': self.client_id,
+                    'client_secret': self.client_secret,
+                    'scope': 'https://graph.microsoft.com/.default',
+                    'grant_type': 'client_credentials'
+                }).encode('utf-8')
+                response = _http_request(
+                    f"https://login.microsoftonline.com/{self.tenant_id}/oauth2/v2.0/token",
+                    data=body, method='POST',
+                    headers={'Content-Type': 'application/x-www-form-urlencoded'}
+                )
+                self._token = response['access_token']
+                self._token_expires_at = time.time() + int(response.get('expires_in', 3600))
+            return self._token
+
+    def _site_id(self, site_url):
+        """Look up (once) the Graph id of the site at `site_url`."""
+        with self._lock:
+            site_id = self._site_ids.get(site_url)
+        if site_id is None:
+            parsed = urllib.parse.urlparse(site_url)
+            response = _http_request(
+                f"{GRAPH_URL}/sites/{parsed.hostname}:{parsed.path.rstrip('/') or '/'}",
+                headers={'Authorization': f"Bearer {self._access_token()}"}
+            )
+            site_id = response['id']
+            with self._lock:
+                self._site_ids[site_url] = site_id
+        return site_id
+
+    def start_upload(self, path, size):
+        site_id = self._site_id(settings_store.load(SharePointSettings).sharepoint_url)
+        response = _http_request(
+            f"{GRAPH_URL}/sites/{site_id}/drive/root:/{urllib.parse.quote(path)}:/createUploadSession",
+            data=json.dumps({'item': {'@microsoft.graph.conflictBehavior': 'replace'}}).encode('utf-8'),
+            method='POST',
+            headers={'Authorization': f"Bearer {self._access_token()}", 'Content-Type': 'application/json'}
+        )
+        return {'upload_url': response['uploadUrl'], 'response': None}
+
+    def upload_chunk(self, session, offset, chunk, size):
+        # The upload URL is pre-authenticated and must not get an Authorization header
+        session['response'] = _http_request(session['upload_url'], data=chunk, method='PUT', headers={
+            'Content-Range': f"bytes {offset}-{offset + len(chunk) - 1}/{size}"
+        })
+
+    def finish_upload(self, session):
+        response = session['response'] or {}
+        if 'webUrl' not in response:
+            raise RuntimeError("Upload session finished without returning the file")
+        return response['webUrl']
+
+BACKENDS = {
+    'local': LocalStorageBackend,
+    'http': HttpStorageBackend,
+    'sharepoint': SharePointStorageBackend
+}
+
+def create_backend(name=UPLOAD_BACKEND):
+    """Create the storage backend called `name` with its environment settings."""
+    if not name:
+        raise ValueError("UPLOAD_BACKEND is not set; choose one of: " + ", ".join(BACKENDS))
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown upload backend: {name}")
+    return BACKENDS[name]()
+
+def retry_delay(attempts):
+    """Seconds to wait after the given number of failed attempts (exponential, with jitter)."""
+    delay = min(UPLOAD_RETRY_MAX_SECONDS, UPLOAD_RETRY_SECONDS * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+class UploadWorkerPool:
+    """Worker threads that upload queued submissions; `concurrency` limits parallel uploads."""
+
+    def __init__(self, backend, concurrency=UPLOAD_CONCURRENCY, poll_interval=UPLOAD_POLL_INTERVAL):
+        self.backend = backend
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads = []
+
+    def process(self, upload):
+        """Build and upload one claimed submission, then record the result."""
+        try:
+            excel_file = excel_export.create_report_excel(
+                upload['template_id'], upload['assigned_report_id'], upload['data']
+            )
+            path = upload_path(
+                upload['template_name'], upload['organization_name'], upload['due_date'],
+                settings_store.load(SharePointSettings)
+            )
+            url = self.backend.upload(path, excel_file.getvalue())
+        except PermanentUploadError as e:
+            db.fail_upload(upload['id'], str(e))
+            return False
+        except Exception as e:
+            retry_in = retry_delay(upload['attempts']) if upload['attempts'] < UPLOAD_MAX_ATTEMPTS else None
+            db.fail_upload(upload['id'], str(e) or type(e).__name__, retry_in)
+            return False
+
+        db.complete_upload(upload['id'], upload['submission_id'], url)
+        return True
+
+    def run_once(self):
+        """Upload everything that is due now, on the calling thread; return the number uploaded."""
+        uploaded = 0
+        while True:
+            uploads = db.claim_uploads(self.concurrency, UPLOAD_LEASE_SECONDS)
+            if not uploads:
+                return uploaded
+            uploaded += sum(self.process(upload) for upload in uploads)
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                uploads = db.claim_uploads(1, UPLOAD_LEASE_SECONDS)
+                if uploads:
+                    self.process(uploads[0])
+                    continue
+            except Exception:
+                # Keep the worker alive; a claimed upload is retried once its lease expires
+                logger.exception("Upload worker %s failed", threading.current_thread().name)
+            self._stop.wait(self.poll_interval)
+
+    def start(self):
+        """Start `concurrency` daemon worker threads."""
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._work, name=f"upload-worker-{i}", daemon=True)
+            for i in range(self.concurrency)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """Stop the workers after their current uploads finish."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+
+@st.cache_resource
+def start_upload_workers():
+    """Start the in-process upload workers once per server process."""
+    if not UPLOAD_WORKERS_IN_APP:
+        return None
+    if not UPLOAD_BACKEND:
+        logger.warning("UPLOAD_BACKEND is not set; SharePoint uploads stay queued until it is configured")
+        return None
+    pool = UploadWorkerPool(create_backend())
+    pool.start()
+    return pool
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload queued report submissions")
+    parser.add_argument("--once", action="store_true", help="upload everything that is due and exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    if not UPLOAD_BACKEND:
+        parser.error("set UPLOAD_BACKEND to one of: " + ", ".join(BACKENDS))
+
+    pool = UploadWorkerPool(create_backend())
+    if args.once:
+        print(f"Uploaded {pool.run_once()} submissions")
+        return
+
+    pool.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pool.stop()
+
+if __name__ == "__main__":
+    main()
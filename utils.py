@@ -1,5 +1,11 @@
+import re
+import calendar
+from datetime import date
 import streamlit as st
 
+# Choices for the rows-per-page control of paged listings
+PAGE_SIZES = [25, 50, 100, 200]
+
 def get_navigation_options():
     """Return navigation options based on user role."""
     if st.session_state.user_role == "admin":
@@ -26,3 +32,54 @@ def get_navigation_options():
         ]
     else:
         return ["Dashboard"]
+
+def add_months(day, months):
+    """Return the same day `months` months later, clamped to the end of shorter months."""
+    month_index = day.month - 1 + months
+    year = day.year + month_index // 12
+    month = month_index % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+def safe_filename(name):
+    """Make a name usable as a file or folder name on disk, in ZIP archives and in SharePoint."""
+    return re.sub(r'[\s"*:<>?/\\|#%]+', '_', str(name)).strip('_.')
+
+def keyset_page(key, fetch, cursor_columns=('due_date', 'id'), filters=None):
+    """Fetch one page of a listing with keyset pagination and draw its page controls.
+
+    `fetch(limit, after)` must return a DataFrame sorted by `cursor_columns`
+    that starts right after the `after` tuple (None for the first page). The
+    cursor of every visited page is kept in session state under `key`, so
+    Previous needs no OFFSET and each page costs the same however long the
+    history is. Changing `filters` or the page size goes back to page one.
+    """
+    page_size = st.selectbox("Rows per page", PAGE_SIZES, index=1, key=f"{key}_page_size")
+    
+    state = st.session_state.get(key)
+    signature = (page_size, repr(filters))
+    if state is None or state['signature'] != signature:
+        state = {'signature': signature, 'cursors': [None]}
+        st.session_state[key] = state
+    cursors = state['cursors']
+    
+    # One extra row tells whether a next page exists
+    page = fetch(page_size + 1, cursors[-1])
+    if page is None:
+        return None
+    has_next = len(page) > page_size
+    page = page.head(page_size)
+    
+    col1, col2, col3 = st.columns([1, 1, 4])
+    with col1:
+        if st.button("← Previous", key=f"{key}_previous", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        if st.button("Next →", key=f"{key}_next", disabled=not has_next):
+            last_row = page.iloc[-1]
+            cursors.append(tuple(last_row[column] for column in cursor_columns))
+            st.rerun()
+    with col3:
+        st.caption(f"Page {len(cursors)}")
+    
+    return page